@@ -0,0 +1,6 @@
+"""
+AutoInvoice Pro core modules
+
+Everything in this package is free of Streamlit imports so it can be used
+from app.py, background workers and command-line tools alike.
+"""
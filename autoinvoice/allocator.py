@@ -0,0 +1,56 @@
+import os
+import threading
+
+# ========================
+# INVOICE NUMBER ALLOCATION
+# ========================
+#
+# Numbers are handed out by the storage backend's atomic allocate(), so
+# two tabs or sessions for the same workshop can never receive the same
+# INV-xxxx. A session may reserve a block of numbers at a time to avoid a
+# storage round trip per invoice; numbers left in a block when the session
+# ends are skipped, so keep the block size at 1 (the default) if invoice
+# numbers must be gap-free.
+
+BLOCK_SIZE = int(os.environ.get("AUTOINVOICE_COUNTER_BLOCK", "1"))
+
+
+def format_invoice_number(number):
+    """INV-xxxx display form of an invoice number"""
+    return f"INV-{number:04d}"
+
+
+def parse_invoice_number(invoice_number):
+    """Number of an INV-xxxx invoice number, or None if it has another form"""
+    prefix, _, digits = str(invoice_number).partition("-")
+    if prefix != "INV" or not digits.isdigit():
+        return None
+    return int(digits)
+
+
+class InvoiceNumberAllocator:
+    """Per-session view of a user's invoice counter with optional block reservation"""
+
+    def __init__(self, storage, block_size=BLOCK_SIZE):
+        self.storage = storage
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._next = None
+        self._end = None
+
+    def take(self):
+        """Allocate the next invoice number for this session"""
+        with self._lock:
+            if self._next is None or self._next >= self._end:
+                self._next = self.storage.allocate(self.block_size)
+                self._end = self._next + self.block_size
+            number = self._next
+            self._next += 1
+            return number
+
+    def peek(self):
+        """Number the next take() is expected to return (not reserved)"""
+        with self._lock:
+            if self._next is not None and self._next < self._end:
+                return self._next
+        return self.storage.peek_counter()
@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.web
+
+from autoinvoice.allocator import format_invoice_number
+from autoinvoice.backends import get_storage
+from autoinvoice.cache import cached_profile
+from autoinvoice.commit import COMPLETED, archive_path, begin_invoice, commit_invoice_async, get_commit_log
+from autoinvoice.engine import build_invoice, make_line_item, merge_profile, validate_invoice_input
+from autoinvoice.jobs import RenderQueueFull, get_render_pool
+from autoinvoice.metrics import count, observe, start_metrics_server
+from autoinvoice.pdfcache import cached_pdf, render_cached, render_profile
+from autoinvoice.search import MAX_RESULTS
+from autoinvoice.storage import today_key
+from autoinvoice.tenants import TENANT_HEADER, tenant_for_login, verify_token
+
+# ========================
+# HTTP/JSON API
+# ========================
+#
+# Runs next to the Streamlit app on the same engine, storage and PDF
+# workers, for front-desk tablets, parts-counter systems and scripts:
+#
+#     python -m autoinvoice.api --port 8600
+#
+#     POST /api/v1/invoices                  create an invoice (JSON body below)
+#     GET  /api/v1/invoices?q=corolla        search, or the latest invoices without q
+#     GET  /api/v1/invoices/INV-1042         one stored invoice record
+#     GET  /api/v1/invoices/INV-1042/pdf     its PDF
+#     GET  /api/v1/stats?start=&end=         today's totals and a date range's totals
+#     GET  /healthz
+#
+#     {"customer_name": "...", "car_details": "...", "labor": 1500, "discount": 0,
+#      "items": [{"desc": "Oil change", "qty": 1, "price": 2500}]}
+#
+# Requests are authenticated with the workshop link token as a bearer token
+# (`Authorization: Bearer ws_...`, printed by `python -m autoinvoice.compact
+# link`), or by the login header when AUTOINVOICE_TENANT_HEADER is set,
+# exactly like the app.
+#
+# The server is a single tornado event loop (tornado ships with Streamlit)
+# with HTTP/1.1 keep-alive. Storage calls run on a small thread pool and PDFs
+# render in the shared process pool, so slow requests never block the loop
+# and many requests are served concurrently. A new invoice's PDF is rendered
+# while its record is saved (see autoinvoice.commit), so fetching it is
+# usually a cache hit.
+
+API_HOST = os.environ.get("AUTOINVOICE_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("AUTOINVOICE_API_PORT", "8600"))
+API_THREADS = int(os.environ.get("AUTOINVOICE_API_THREADS", "8"))
+MAX_BODY_BYTES = 256 * 1024
+IDLE_TIMEOUT = 75
+
+INVOICE_NUMBER = r"(INV-\d+)"
+
+
+class ApiError(tornado.web.HTTPError):
+    """HTTP error whose message is returned as {"error": message}"""
+
+    def __init__(self, status_code, message):
+        super().__init__(status_code)
+        self.message = message
+
+
+def tenant_of(request):
+    """Tenant id of an API request, or None if it is not authenticated"""
+    if TENANT_HEADER:
+        login = request.headers.get(TENANT_HEADER, "").strip()
+        return tenant_for_login(login) if login else None
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    return verify_token(token.strip())
+
+
+def is_number(value):
+    """JSON number check; true, false, NaN and Infinity are not numbers here"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def parse_item(item):
+    """LineItem from a JSON item; qty must be a positive whole number"""
+    qty = item.get("qty", 1)
+    price = item["price"]
+    if not is_number(qty) or qty <= 0 or qty != int(qty):
+        raise ValueError("item qty must be a positive whole number")
+    if not is_number(price) or price < 0:
+        raise ValueError("item price must be a non-negative number")
+    return make_line_item(str(item["desc"]), int(qty), price)
+
+
+def parse_invoice_request(body):
+    """(customer_name, car_details, items, labor, discount) from a JSON body"""
+    try:
+        data = json.loads(body or b"{}")
+        if not isinstance(data, dict):
+            raise ValueError("expected a JSON object")
+        items = [parse_item(item) for item in data.get("items", [])]
+        labor = data.get("labor", 1500)
+        discount = data.get("discount", 0)
+        if not all(is_number(v) and v >= 0 for v in (labor, discount)):
+            raise ValueError("labor and discount must be non-negative numbers")
+        customer_name = str(data.get("customer_name", "")).strip()
+        car_details = str(data.get("car_details", "")).strip()
+    except ArithmeticError:
+        raise ApiError(400, "Invalid invoice: prices must be numbers")
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise ApiError(400, f"Invalid invoice: {e}")
+
+    problems = validate_invoice_input(customer_name, car_details, items)
+    if problems:
+        raise ApiError(400, "; ".join(problems))
+    return customer_name, car_details, items, labor, discount
+
+
+class ApiHandler(tornado.web.RequestHandler):
+    """JSON responses, tenant authentication and off-loop storage calls"""
+
+    def initialize(self, executor):
+        self.executor = executor
+        self.user_id = None
+
+    def prepare(self):
+        self.user_id = tenant_of(self.request)
+        if self.user_id is None:
+            raise ApiError(401, "Missing or invalid workshop token")
+
+    def blocking(self, fn, *args):
+        """Run a blocking storage call on the API thread pool"""
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def storage(self):
+        return get_storage(self.user_id)
+
+    def send_json(self, data, status=200):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+
+    def write_error(self, status_code, **kwargs):
+        error = kwargs.get("exc_info", (None, None, None))[1]
+        self.send_json({"error": error.message if isinstance(error, ApiError) else self._reason},
+                       status_code)
+
+    def on_finish(self):
+        observe(f"api_{self.request.method.lower()}", self.request.request_time(), self.user_id)
+
+
+class InvoicesHandler(ApiHandler):
+    def build(self, customer_name, car_details, items, labor, discount):
+        """Reserve a number and build the record; post() saves it"""
+        storage = self.storage()
+        profile = merge_profile(cached_profile(storage))
+        invoice_number = format_invoice_number(storage.allocate(1))
+        invoice_data = build_invoice(invoice_number, customer_name, car_details, items, labor,
+                                     discount, self.user_id, profile['workshop_name'],
+                                     profile=profile).to_dict()
+        # Logged before anything is written for it (see autoinvoice.commit)
+        invoice_commit = begin_invoice(storage, invoice_number, archive_path(self.user_id, invoice_number))
+        return storage, invoice_data, profile, invoice_commit
+
+    async def post(self):
+        fields = parse_invoice_request(self.request.body)
+        storage, invoice_data, profile, invoice_commit = await self.blocking(self.build, *fields)
+        filepath = invoice_commit.filepath
+
+        # The PDF is rendered while the record is saved. Without archiving it
+        # only warms the cache (the client may never ask for it); an archived
+        # PDF is part of the commit and the response waits for it too.
+        try:
+            pdf = get_render_pool().render(invoice_data, profile, filepath)
+        except RenderQueueFull:
+            pdf = self.executor.submit(render_cached, invoice_data, profile, filepath) if filepath else None
+        if filepath:
+            invoice_commit.watch_pdf(pdf)
+        try:
+            await commit_invoice_async(storage, invoice_data, pdf if filepath else None,
+                                       invoice_commit.day, self.executor)
+            invoice_commit.record_saved()
+        except Exception:
+            # Completed anyway if the record made it to disk, else rolled back
+            if await self.blocking(invoice_commit.abort) != COMPLETED:
+                raise
+        count("invoice_generated", self.user_id)
+
+        number = invoice_data['invoice_number']
+        self.set_header("Location", f"/api/v1/invoices/{number}")
+        self.send_json(dict(invoice_data, pdf_url=f"/api/v1/invoices/{number}/pdf"), 201)
+
+    async def get(self):
+        query = self.get_query_argument("q", "").strip()
+        try:
+            limit = min(MAX_RESULTS, max(1, int(self.get_query_argument("limit", str(MAX_RESULTS)))))
+        except ValueError:
+            raise ApiError(400, "limit must be a number")
+        storage = self.storage()
+        if query:
+            results = await self.blocking(storage.search, query, limit)
+        else:
+            results = await self.blocking(storage.recent_invoices, limit)
+        self.send_json({"invoices": results})
+
+
+class InvoiceHandler(ApiHandler):
+    async def get(self, invoice_number):
+        invoice_data = await self.blocking(self.storage().find_invoice, invoice_number)
+        if invoice_data is None:
+            raise ApiError(404, f"Invoice {invoice_number} not found")
+        self.send_json(invoice_data)
+
+
+class InvoicePdfHandler(ApiHandler):
+    def lookup(self, invoice_number):
+        storage = self.storage()
+        invoice_data = storage.find_invoice(invoice_number)
+        if invoice_data is None:
+            return None, None, None
+        profile = render_profile(invoice_data, merge_profile(cached_profile(storage)))
+        return invoice_data, profile, cached_pdf(invoice_data, profile)
+
+    async def get(self, invoice_number):
+        invoice_data, profile, pdf_bytes = await self.blocking(self.lookup, invoice_number)
+        if invoice_data is None:
+            raise ApiError(404, f"Invoice {invoice_number} not found")
+        if pdf_bytes is None:
+            try:
+                pdf_bytes = await asyncio.wrap_future(get_render_pool().render(invoice_data, profile))
+            except RenderQueueFull:
+                self.set_header("Retry-After", "1")
+                raise ApiError(503, "PDF renderer is busy, retry shortly")
+
+        self.set_header("Content-Type", "application/pdf")
+        self.set_header("Content-Disposition", f'inline; filename="invoice_{invoice_number}.pdf"')
+        self.finish(pdf_bytes)
+
+
+class StatsHandler(ApiHandler):
+    def stats(self, start, end):
+        storage = self.storage()
+        today = {k: v for k, v in storage.today_stats().items() if k != "recent"}
+        return {"today": today, "range": dict(storage.range_totals(start, end), start=start, end=end)}
+
+    async def get(self):
+        start = self.get_query_argument("start", None)
+        end = self.get_query_argument("end", None) or today_key()
+        self.send_json(await self.blocking(self.stats, start, end))
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.finish({"status": "ok"})
+
+
+def make_app(executor):
+    """tornado Application serving the API"""
+    args = {"executor": executor}
+    return tornado.web.Application([
+        (r"/api/v1/invoices", InvoicesHandler, args),
+        (rf"/api/v1/invoices/{INVOICE_NUMBER}", InvoiceHandler, args),
+        (rf"/api/v1/invoices/{INVOICE_NUMBER}/pdf", InvoicePdfHandler, args),
+        (r"/api/v1/stats", StatsHandler, args),
+        (r"/healthz", HealthHandler),
+    ])
+
+
+async def serve(host=API_HOST, port=API_PORT, threads=API_THREADS):
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="api")
+    make_app(executor).listen(port, address=host, max_body_size=MAX_BODY_BYTES,
+                              idle_connection_timeout=IDLE_TIMEOUT)
+    get_commit_log()
+    get_render_pool().start()
+    start_metrics_server()
+    print(f"AutoInvoice API listening on http://{host}:{port}/api/v1", flush=True)
+    await asyncio.Event().wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AutoInvoice HTTP/JSON API")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--threads", type=int, default=API_THREADS, help="storage worker threads")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.threads))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
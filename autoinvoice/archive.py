@@ -0,0 +1,133 @@
+import gzip
+import json
+import os
+from collections import Counter
+
+from autoinvoice.models import RECORD_FORMAT, pack_record, unpack_record
+from autoinvoice.tenants import tenant_path
+
+# ========================
+# MONTHLY INVOICE ARCHIVES
+# ========================
+#
+# Days older than the retention age leave the live store (day journals or
+# the SQLite invoices table) and move into one gzip-compressed JSON-lines
+# file per month:
+#
+#     data/archive/<shard>/<user_id>/invoices_<YYYY-MM>.jsonl.gz
+#
+# Each line is {"day": "YYYY-MM-DD", "r": <stored record>}. A month file is
+# rewritten as a whole (temp file + rename) when records are added, and
+# records it already holds are skipped, so an archiving run interrupted at
+# any point can simply be run again, and a record saved later to an
+# archived day is merged into its month. Daily rollups are kept, so statistics do
+# not need to open the archives; Storage.iter_invoices() reads them.
+
+ARCHIVE_ROOT = "data/archive"
+ARCHIVE_PREFIX = "invoices_"
+ARCHIVE_SUFFIX = ".jsonl.gz"
+
+
+def user_archive_dir(user_id):
+    """Directory holding a user's monthly archives"""
+    return tenant_path(ARCHIVE_ROOT, user_id)
+
+
+def stored_number(record):
+    """Invoice number of a record in either stored form"""
+    if record.get("f") == RECORD_FORMAT:
+        return record.get("n")
+    return record.get("invoice_number")
+
+
+class MonthlyArchive:
+    """gzip JSON-lines archive files, one per month, for one user"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, month):
+        return os.path.join(self.directory, f"{ARCHIVE_PREFIX}{month}{ARCHIVE_SUFFIX}")
+
+    def months(self):
+        """Sorted list of archived months (YYYY-MM)"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[len(ARCHIVE_PREFIX):-len(ARCHIVE_SUFFIX)] for name in os.listdir(self.directory)
+                      if name.startswith(ARCHIVE_PREFIX) and name.endswith(ARCHIVE_SUFFIX))
+
+    def _read_lines(self, month):
+        path = self.path(month)
+        if not os.path.exists(path):
+            return []
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def read_month(self, month):
+        """(day, record) pairs of one month, in archive order"""
+        return [(line["day"], unpack_record(line["r"])) for line in self._read_lines(month)]
+
+    def add(self, by_day):
+        """
+        Archive {day: [records]}. Records the archive already holds (same day
+        and invoice number) are skipped; the rest are merged into their
+        month. Returns the days given, all of whose records are now archived.
+        """
+        by_month = {}
+        for day, records in by_day.items():
+            by_month.setdefault(day[:7], {})[day] = records
+
+        archived = []
+        for month, days in sorted(by_month.items()):
+            lines = self._read_lines(month)
+            present = Counter((line["day"], stored_number(line["r"])) for line in lines)
+            added = 0
+            for day, records in sorted(days.items()):
+                for record in records:
+                    key = (day, stored_number(record))
+                    if present[key]:
+                        present[key] -= 1
+                        continue
+                    lines.append({"day": day, "r": pack_record(record)})
+                    added += 1
+            archived.extend(sorted(days))
+            if not added:
+                continue
+
+            # Stable: a day's earlier records stay ahead of the ones merged in
+            lines.sort(key=lambda line: line["day"])
+            self._write(month, lines)
+        return archived
+
+    def _write(self, month, lines):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(month)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+                for line in lines:
+                    f.write((json.dumps(line, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8"))
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, path)
+
+    def iter_invoices(self, start=None, end=None):
+        """Yield (day, record) for archived days in [start, end], oldest first"""
+        for month in self.months():
+            if (start and month < start[:7]) or (end and month > end[:7]):
+                continue
+            for day, record in self.read_month(month):
+                if (not start or day >= start) and (not end or day <= end):
+                    yield day, record
+
+    def day_totals(self):
+        """{day: {count, sales, labor, items}} over every archived invoice"""
+        totals = {}
+        for month in self.months():
+            for day, invoice in self.read_month(month):
+                row = totals.setdefault(day, {"count": 0, "sales": 0, "labor": 0, "items": 0})
+                row["count"] += 1
+                row["sales"] += invoice.get("grand_total", 0)
+                row["labor"] += invoice.get("labor", 0)
+                row["items"] += len(invoice.get("items", []))
+        return totals
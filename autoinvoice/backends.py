@@ -0,0 +1,829 @@
+import heapq
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from autoinvoice.archive import MonthlyArchive, user_archive_dir
+from autoinvoice.cache import LruRegistry, ensure_dir, forget_dir, invalidate_profile
+from autoinvoice.models import pack_record, unpack_record
+from autoinvoice.storage import get_journal, today_key
+from autoinvoice.stats import get_today_aggregate, get_rollup_index
+from autoinvoice.search import get_search_index, forget_search_index, MAX_RESULTS
+from autoinvoice.tenants import tenant_path, is_shard_name, adopt_legacy_path
+
+# ========================
+# PLUGGABLE STORAGE BACKENDS
+# ========================
+#
+# Every backend stores the same three things per user - the workshop
+# profile, the invoice counter and the invoice records - behind one small
+# API. Pick one with the AUTOINVOICE_STORAGE environment variable:
+#
+#     sqlite  (default)  single WAL-mode database at data/autoinvoice.db
+#     json               legacy file layout under data/ and profiles/
+#
+# Statistics are returned in a backend-neutral shape:
+#     today_stats()   -> {count, sales, labor, items, recent}
+#     range_totals()  -> {count, sales, labor, items, days}
+#
+# Per-user directories are sharded: data/users/<shard>/<user_id> (see
+# autoinvoice.tenants). Directories of the old flat layout are moved into
+# their shard when the user is first opened.
+#
+# Days older than the retention age can be moved out of the live store into
+# monthly archives with archive_before() (see autoinvoice.archive and
+# autoinvoice.retention); their statistics stay in the rollups.
+
+DATA_ROOT = "data/users"
+PROFILE_ROOT = "profiles/users"
+INVOICES_ROOT = "invoices/users"
+DB_PATH = os.environ.get("AUTOINVOICE_DB", "data/autoinvoice.db")
+DEFAULT_BACKEND = "sqlite"
+FIRST_INVOICE_NUMBER = 1000
+
+
+USER_ROOTS = (DATA_ROOT, PROFILE_ROOT, INVOICES_ROOT)
+
+
+def user_data_dir(user_id):
+    """Directory holding a user's journals and counters (json backend)"""
+    return tenant_path(DATA_ROOT, user_id)
+
+
+def user_profile_dir(user_id):
+    """Directory holding a user's profile.json (json backend)"""
+    return tenant_path(PROFILE_ROOT, user_id)
+
+
+def user_invoices_dir(user_id):
+    """Directory holding a user's rendered invoice PDFs"""
+    return tenant_path(INVOICES_ROOT, user_id)
+
+
+def adopt_legacy_dirs(user_id):
+    """Move a user's directories from the flat layout into their shard"""
+    for root in USER_ROOTS:
+        adopt_legacy_path(os.path.join(root, user_id), tenant_path(root, user_id))
+
+
+def user_dirs_on_disk():
+    """Ids of every user with a directory, in either layout"""
+    users = set()
+    for root in USER_ROOTS:
+        if not os.path.isdir(root):
+            continue
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if not os.path.isdir(path):
+                continue
+            if is_shard_name(name):
+                users.update(n for n in os.listdir(path) if os.path.isdir(os.path.join(path, n)))
+            else:
+                users.add(name)
+    return users
+
+
+def remove_user_dirs(user_id):
+    """Delete a user's directories (both layouts), archives and search index"""
+    paths = [user_archive_dir(user_id)]
+    for root in USER_ROOTS:
+        paths += [tenant_path(root, user_id), os.path.join(root, user_id)]
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        forget_dir(path)
+    forget_search_index(user_id, remove=True)
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive inter-process lock held on a separate lock file"""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def try_file_lock(path):
+    """
+    Exclusive inter-process lock on a lock file, without waiting. Returns
+    the open file (the lock is held until it is closed), or None if
+    another process holds it.
+    """
+    f = open(path, "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+class Storage:
+    """Behaviour shared by every backend"""
+
+    name = None
+
+    def save_invoices(self, invoices, day=None):
+        """Save invoice records to a day (today by default) and index them"""
+        day = day or today_key()
+        if invoices:
+            # Open (or build) the index before writing so nothing is indexed twice
+            index = get_search_index(self)
+            self._write_invoices(invoices, day)
+            index.add_invoices(invoices, day)
+        return True
+
+    def save_invoice(self, invoice_data, day=None):
+        """Save one invoice record to a day (today by default)"""
+        return self.save_invoices([invoice_data], day)
+
+    def sync(self):
+        """Make every invoice saved so far durable on disk"""
+        self._sync()
+
+    def clear_day(self, day):
+        """Delete every invoice saved on a day"""
+        cleared = self._clear_day(day)
+        if cleared:
+            get_search_index(self).clear_day(day)
+        return cleared
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Invoice summaries matching a search query, newest first"""
+        return get_search_index(self).search(query, limit)
+
+    def invoice_changes(self, version=None):
+        """(changed days or None, version) of this user's invoices; see SearchIndex.changes_since"""
+        return get_search_index(self).changes_since(version)
+
+    def recent_invoices(self, limit=MAX_RESULTS):
+        """Summaries of the most recently saved invoices, newest first"""
+        return get_search_index(self).recent(limit)
+
+    def iter_invoices(self, start=None, end=None):
+        """Yield (day, record) for days in [start, end], oldest first, archives included"""
+        # A merge, not a chain: merged or restored days can be live while
+        # later days are already archived
+        return heapq.merge(self.archive.iter_invoices(start, end), self._iter_live(start, end),
+                           key=lambda pair: pair[0])
+
+    def find_invoice(self, invoice_number, day=None):
+        """Full record of an invoice by number (looked up on `day` only, if given), or None"""
+        if day is not None:
+            return self._find_on_day(invoice_number, day)
+        for doc in self.search(invoice_number):
+            if doc["invoice_number"] != invoice_number:
+                continue
+            record = self._find_on_day(invoice_number, doc["day"])
+            if record is not None:
+                return record
+        return None
+
+    def _find_on_day(self, invoice_number, day):
+        for _, record in self.iter_invoices(day, day):
+            if record.get("invoice_number") == invoice_number:
+                return record
+        return None
+
+    def archive_before(self, before, dry_run=False):
+        """
+        Move every day before `before` (YYYY-MM-DD) from the live store into
+        the monthly archives. Returns the days archived (or, with dry_run,
+        the days that would be). Today is never archived.
+        """
+        before = min(before, today_key())
+        days = self._live_days_before(before)
+        if not days or dry_run:
+            return days
+        with file_lock(os.path.join(ensure_dir(self.archive.directory), ".lock")):
+            days = self._live_days_before(before)
+            return self._archive_days(days) if days else []
+
+    def peek_counter(self):
+        """Next invoice number without reserving it"""
+        counter = self.get_counter()
+        if counter is None:
+            counter = FIRST_INVOICE_NUMBER + self.range_totals()["count"]
+        return counter
+
+    def delete(self):
+        """Remove everything stored for the user, including PDFs and the search index"""
+        self._delete()
+        remove_user_dirs(self.user_id)
+        invalidate_profile(self)
+        _storages.pop((self.name, self.user_id))
+
+
+class JsonStorage(Storage):
+    """Legacy file layout: profile.json, invoice_counter.json and day journals"""
+
+    name = "json"
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        adopt_legacy_dirs(user_id)
+        self.data_dir = user_data_dir(user_id)
+        self.profile_dir = user_profile_dir(user_id)
+        ensure_dir(self.data_dir)
+        ensure_dir(self.profile_dir)
+        self.profile_file = os.path.join(self.profile_dir, "profile.json")
+        self.counter_file = os.path.join(self.data_dir, "invoice_counter.json")
+        self.counter_lock = os.path.join(self.data_dir, "invoice_counter.lock")
+        self._thread_lock = threading.Lock()
+        self.archive = MonthlyArchive(user_archive_dir(user_id))
+
+    @property
+    def journal(self):
+        # Looked up on each use: the registry closes journals it evicts
+        return get_journal(self.data_dir)
+
+    # Profile
+
+    def load_profile(self):
+        """Stored profile dict, or None if the user has not saved one"""
+        if not os.path.exists(self.profile_file):
+            return None
+        try:
+            with open(self.profile_file, "r") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def save_profile(self, profile_data):
+        with open(self.profile_file, "w") as f:
+            json.dump(profile_data, f, indent=2)
+        invalidate_profile(self)
+
+    def profile_version(self):
+        """Changes whenever profile.json is rewritten"""
+        try:
+            st = os.stat(self.profile_file)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    # Counter
+
+    def get_counter(self):
+        """Next invoice number, or None if no counter was saved yet"""
+        if not os.path.exists(self.counter_file):
+            return None
+        try:
+            with open(self.counter_file, "r") as f:
+                return json.load(f).get("counter", 1000)
+        except Exception:
+            return None
+
+    def set_counter(self, value):
+        tmp_path = self.counter_file + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"counter": value}, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.counter_file)
+
+    def allocate(self, count=1):
+        """
+        Atomically reserve `count` consecutive invoice numbers.
+        Returns the first one. Safe across threads and processes.
+        """
+        with self._thread_lock, file_lock(self.counter_lock):
+            counter = self.peek_counter()
+            self.set_counter(counter + count)
+        return counter
+
+    def skip_number(self, number):
+        """Make sure `number` is never allocated (again)"""
+        with self._thread_lock, file_lock(self.counter_lock):
+            if self.peek_counter() <= number:
+                self.set_counter(number + 1)
+
+    # Invoices
+
+    def _write_invoices(self, invoices, day):
+        self.journal.append_many(invoices, day)
+        self._refresh_stats(day)
+
+    def _sync(self):
+        self.journal.sync()
+
+    def _refresh_stats(self, day):
+        if day == today_key():
+            get_today_aggregate(self.data_dir).refresh()
+        get_rollup_index(self.data_dir, self.archive).refresh(day)
+
+    def _clear_day(self, day):
+        cleared = self.journal.clear_day(day)
+        if cleared:
+            self._refresh_stats(day)
+        return cleared
+
+    def _iter_live(self, start=None, end=None):
+        days = [d for d in self.journal.days()
+                if (not start or d >= start) and (not end or d <= end)]
+        return self.journal.iter_invoices(days)
+
+    def _live_days_before(self, before):
+        return [d for d in self.journal.days() if d < before]
+
+    def _find_on_day(self, invoice_number, day):
+        # Only that day's journal (or its archived month) is read, not the directory
+        for record in self.journal.read_day(day):
+            if record.get("invoice_number") == invoice_number:
+                return record
+        for _, record in self.archive.iter_invoices(day, day):
+            if record.get("invoice_number") == invoice_number:
+                return record
+        return None
+
+    def _archive_days(self, days):
+        archived = self.archive.add({day: self.journal.read_day(day) for day in days})
+        # Rollup rows first, so the totals survive the journals going away
+        get_rollup_index(self.data_dir, self.archive).mark_archived(archived)
+        for day in archived:
+            self.journal.clear_day(day)
+            legacy_copy = os.path.join(self.data_dir, f"invoices_{day}.json.migrated")
+            if os.path.exists(legacy_copy):
+                os.remove(legacy_copy)
+        return archived
+
+    def _delete(self):
+        # The directories themselves go in remove_user_dirs()
+        self.journal.close()
+
+    # Statistics
+
+    def today_stats(self):
+        return get_today_aggregate(self.data_dir).snapshot()
+
+    def range_totals(self, start=None, end=None):
+        return get_rollup_index(self.data_dir, self.archive).totals(start, end)
+
+
+# ========================
+# SQLITE BACKEND
+# ========================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id     TEXT PRIMARY KEY,
+    data        TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS counters (
+    user_id     TEXT PRIMARY KEY,
+    value       INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS invoices (
+    id              INTEGER PRIMARY KEY,
+    user_id         TEXT NOT NULL,
+    day             TEXT NOT NULL,
+    invoice_number  TEXT NOT NULL,
+    customer_name   TEXT,
+    car_details     TEXT,
+    subtotal        NUMERIC,
+    labor           NUMERIC,
+    discount        NUMERIC,
+    grand_total     NUMERIC,
+    item_count      INTEGER,
+    data            TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_invoices_user_day ON invoices (user_id, day);
+CREATE INDEX IF NOT EXISTS idx_invoices_user_number ON invoices (user_id, invoice_number);
+CREATE INDEX IF NOT EXISTS idx_invoices_user_customer ON invoices (user_id, customer_name);
+
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    user_id     TEXT NOT NULL,
+    day         TEXT NOT NULL,
+    count       INTEGER NOT NULL DEFAULT 0,
+    sales       NUMERIC NOT NULL DEFAULT 0,
+    labor       NUMERIC NOT NULL DEFAULT 0,
+    items       INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS legacy_imports (
+    user_id     TEXT PRIMARY KEY
+);
+"""
+
+SQL_LOAD_PROFILE = "SELECT data FROM profiles WHERE user_id = ?"
+SQL_SAVE_PROFILE = (
+    "INSERT INTO profiles (user_id, data) VALUES (?, ?) "
+    "ON CONFLICT (user_id) DO UPDATE SET data = excluded.data"
+)
+SQL_GET_COUNTER = "SELECT value FROM counters WHERE user_id = ?"
+SQL_SET_COUNTER = (
+    "INSERT INTO counters (user_id, value) VALUES (?, ?) "
+    "ON CONFLICT (user_id) DO UPDATE SET value = excluded.value"
+)
+SQL_BUMP_COUNTER = "UPDATE counters SET value = value + ? WHERE user_id = ?"
+SQL_INSERT_INVOICE = (
+    "INSERT INTO invoices (user_id, day, invoice_number, customer_name, car_details, "
+    "subtotal, labor, discount, grand_total, item_count, data) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+SQL_BUMP_ROLLUP = (
+    "INSERT INTO daily_rollups (user_id, day, count, sales, labor, items) "
+    "VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (user_id, day) DO UPDATE SET "
+    "count = count + excluded.count, sales = sales + excluded.sales, "
+    "labor = labor + excluded.labor, items = items + excluded.items"
+)
+SQL_TODAY_ROLLUP = "SELECT count, sales, labor, items FROM daily_rollups WHERE user_id = ? AND day = ?"
+SQL_RECENT = "SELECT data FROM invoices WHERE user_id = ? AND day = ? ORDER BY id DESC LIMIT ?"
+SQL_RANGE_TOTALS = (
+    "SELECT COALESCE(SUM(count), 0), COALESCE(SUM(sales), 0), COALESCE(SUM(labor), 0), "
+    "COALESCE(SUM(items), 0), COUNT(*) FROM daily_rollups "
+    "WHERE user_id = ? AND day >= ? AND day <= ? AND count > 0"
+)
+# One page of a range, after the (day, id) of the previous page's last row
+SQL_RANGE_INVOICES = (
+    "SELECT day, id, data FROM invoices WHERE user_id = ? AND day <= ? "
+    "AND (day > ? OR (day = ? AND id > ?)) ORDER BY day, id LIMIT ?"
+)
+RANGE_PAGE_ROWS = 1000
+SQL_FIND_INVOICE = (
+    "SELECT data FROM invoices WHERE user_id = ? AND invoice_number = ? AND day = ? ORDER BY id LIMIT 1"
+)
+USER_TABLES = ("profiles", "counters", "invoices", "daily_rollups")
+SQL_USERS = " UNION ".join(f"SELECT user_id FROM {table}" for table in USER_TABLES)
+SQL_DAYS_BEFORE = "SELECT DISTINCT day FROM invoices WHERE user_id = ? AND day < ? ORDER BY day"
+SQL_DELETE_DAY = "DELETE FROM invoices WHERE user_id = ? AND day = ?"
+SQL_DELETE_ROLLUP = "DELETE FROM daily_rollups WHERE user_id = ? AND day = ?"
+
+
+def invoice_row(user_id, day, invoice):
+    """Column values for one invoice record"""
+    return (
+        user_id,
+        day,
+        invoice.get("invoice_number", ""),
+        invoice.get("customer_name", ""),
+        invoice.get("car_details", ""),
+        invoice.get("subtotal", 0),
+        invoice.get("labor", 0),
+        invoice.get("discount", 0),
+        invoice.get("grand_total", 0),
+        len(invoice.get("items", [])),
+        json.dumps(pack_record(invoice), separators=(",", ":"), ensure_ascii=False),
+    )
+
+
+class Database:
+    """One shared SQLite connection per process, serialized by a lock"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(
+            path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=64,
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params)
+
+    def query_one(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    def query_all(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def data_version(self):
+        """Counter bumped by commits from other connections (no disk read in WAL mode)"""
+        with self.lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def sync(self):
+        """
+        Make every commit so far durable. synchronous=NORMAL leaves commits
+        in the WAL without an fsync; syncing the WAL file covers them all
+        without holding the connection lock.
+        """
+        try:
+            fd = os.open(self.path + "-wal", os.O_RDONLY)
+        except FileNotFoundError:
+            # Checkpointed away: everything is in the (synced) main file
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            # Platforms that cannot fsync a read-only handle
+            self.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        finally:
+            os.close(fd)
+
+    def transaction(self):
+        return _Transaction(self)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT block holding the connection lock"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.lock.acquire()
+        try:
+            self.db.conn.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self.db.lock.release()
+            raise
+        return self.db.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.db.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.db.lock.release()
+        return False
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(path=None):
+    """Get the process-wide connection for a database file"""
+    key = os.path.abspath(path or DB_PATH)
+    db = _databases.get(key)
+    if db is None:
+        with _databases_lock:
+            db = _databases.get(key)
+            if db is None:
+                db = Database(key)
+                _databases[key] = db
+    return db
+
+
+class SqliteStorage(Storage):
+    """All users in one WAL-mode SQLite database"""
+
+    name = "sqlite"
+
+    def __init__(self, user_id, db=None):
+        self.user_id = user_id
+        self.db = db or get_database()
+        self.archive = MonthlyArchive(user_archive_dir(user_id))
+        adopt_legacy_dirs(user_id)
+        self._import_legacy()
+
+    def _import_legacy(self):
+        """Copy a user's legacy JSON files into the database once"""
+        if self.db.query_one("SELECT 1 FROM legacy_imports WHERE user_id = ?", (self.user_id,)):
+            return
+
+        has_files = (os.path.isdir(user_data_dir(self.user_id))
+                     or os.path.isdir(user_profile_dir(self.user_id)))
+        legacy = JsonStorage(self.user_id) if has_files else None
+
+        with self.db.transaction() as conn:
+            if conn.execute("SELECT 1 FROM legacy_imports WHERE user_id = ?",
+                            (self.user_id,)).fetchone():
+                return
+
+            if legacy is not None:
+                profile = legacy.load_profile()
+                if profile is not None:
+                    conn.execute(SQL_SAVE_PROFILE, (self.user_id, json.dumps(profile)))
+
+                counter = legacy.get_counter()
+                if counter is not None:
+                    conn.execute(SQL_SET_COUNTER, (self.user_id, counter))
+
+                by_day = {}
+                for day, invoice in legacy._iter_live():
+                    by_day.setdefault(day, []).append(invoice)
+                for day, invoices in by_day.items():
+                    self._insert(conn, invoices, day)
+
+                # Archived days stay in the shared archive directory; only their totals move
+                for day, totals in legacy.archive.day_totals().items():
+                    conn.execute(SQL_BUMP_ROLLUP, (self.user_id, day, totals["count"], totals["sales"],
+                                                   totals["labor"], totals["items"]))
+
+            conn.execute("INSERT INTO legacy_imports (user_id) VALUES (?)", (self.user_id,))
+
+    # Profile
+
+    def load_profile(self):
+        row = self.db.query_one(SQL_LOAD_PROFILE, (self.user_id,))
+        return json.loads(row[0]) if row else None
+
+    def save_profile(self, profile_data):
+        self.db.execute(SQL_SAVE_PROFILE, (self.user_id, json.dumps(profile_data)))
+        invalidate_profile(self)
+
+    def profile_version(self):
+        """
+        Changes whenever another connection commits to the database.
+        Writes through this process's own connection invalidate the
+        profile cache directly in save_profile().
+        """
+        return self.db.data_version()
+
+    # Counter
+
+    def get_counter(self):
+        row = self.db.query_one(SQL_GET_COUNTER, (self.user_id,))
+        return row[0] if row else None
+
+    def set_counter(self, value):
+        self.db.execute(SQL_SET_COUNTER, (self.user_id, value))
+
+    def allocate(self, count=1):
+        """
+        Atomically reserve `count` consecutive invoice numbers.
+        Returns the first one. BEGIN IMMEDIATE serializes writers across
+        processes, so concurrent sessions never receive the same number.
+        """
+        with self.db.transaction() as conn:
+            if conn.execute(SQL_BUMP_COUNTER, (count, self.user_id)).rowcount:
+                return conn.execute(SQL_GET_COUNTER, (self.user_id,)).fetchone()[0] - count
+
+            totals = conn.execute(SQL_RANGE_TOTALS, (self.user_id, "", "9999")).fetchone()
+            first = FIRST_INVOICE_NUMBER + totals[0]
+            conn.execute(SQL_SET_COUNTER, (self.user_id, first + count))
+            return first
+
+    def skip_number(self, number):
+        """Make sure `number` is never allocated (again), durably"""
+        with self.db.transaction() as conn:
+            row = conn.execute(SQL_GET_COUNTER, (self.user_id,)).fetchone()
+            if row is None:
+                counter = FIRST_INVOICE_NUMBER + conn.execute(SQL_RANGE_TOTALS, (self.user_id, "", "9999")).fetchone()[0]
+            else:
+                counter = row[0]
+            if counter <= number:
+                conn.execute(SQL_SET_COUNTER, (self.user_id, number + 1))
+        self.sync()
+
+    # Invoices
+
+    def _insert(self, conn, invoices, day):
+        rows = [invoice_row(self.user_id, day, inv) for inv in invoices]
+        conn.executemany(SQL_INSERT_INVOICE, rows)
+        conn.execute(SQL_BUMP_ROLLUP, (
+            self.user_id,
+            day,
+            len(rows),
+            sum(r[8] for r in rows),
+            sum(r[6] for r in rows),
+            sum(r[9] for r in rows),
+        ))
+
+    def _write_invoices(self, invoices, day):
+        # Records and the day rollup change in one transaction
+        with self.db.transaction() as conn:
+            self._insert(conn, invoices, day)
+
+    def _sync(self):
+        self.db.sync()
+
+    def _clear_day(self, day):
+        with self.db.transaction() as conn:
+            deleted = conn.execute(SQL_DELETE_DAY, (self.user_id, day)).rowcount
+            conn.execute(SQL_DELETE_ROLLUP, (self.user_id, day))
+        return deleted > 0
+
+    def _iter_live(self, start=None, end=None):
+        # Read a page at a time, so a long history is never held in memory
+        # and the connection is free between pages
+        day, last_id, end = start or "", 0, end or "9999"
+        while True:
+            rows = self.db.query_all(SQL_RANGE_INVOICES,
+                                     (self.user_id, end, day, day, last_id, RANGE_PAGE_ROWS))
+            for day, last_id, data in rows:
+                yield day, unpack_record(json.loads(data))
+            if len(rows) < RANGE_PAGE_ROWS:
+                return
+
+    def _live_days_before(self, before):
+        return [row[0] for row in self.db.query_all(SQL_DAYS_BEFORE, (self.user_id, before))]
+
+    def _find_on_day(self, invoice_number, day):
+        # Indexed lookup; only archived days are scanned
+        row = self.db.query_one(SQL_FIND_INVOICE, (self.user_id, invoice_number, day))
+        if row is not None:
+            return unpack_record(json.loads(row[0]))
+        for _, record in self.archive.iter_invoices(day, day):
+            if record.get("invoice_number") == invoice_number:
+                return record
+        return None
+
+    def _archive_days(self, days):
+        by_day = {}
+        for day, invoice in self._iter_live(days[0], days[-1]):
+            by_day.setdefault(day, []).append(invoice)
+        archived = self.archive.add(by_day)
+        # Only the records leave; daily_rollups keeps the totals
+        with self.db.transaction() as conn:
+            conn.executemany(SQL_DELETE_DAY, [(self.user_id, day) for day in archived])
+        return archived
+
+    def _delete(self):
+        # legacy_imports keeps its row: the JSON files are deleted as well
+        with self.db.transaction() as conn:
+            for table in USER_TABLES:
+                conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (self.user_id,))
+
+    # Statistics
+
+    def today_stats(self):
+        day = today_key()
+        row = self.db.query_one(SQL_TODAY_ROLLUP, (self.user_id, day)) or (0, 0, 0, 0)
+        recent = self.db.query_all(SQL_RECENT, (self.user_id, day, 5))
+        return {
+            "day": day,
+            "count": row[0],
+            "sales": row[1],
+            "labor": row[2],
+            "items": row[3],
+            "recent": [unpack_record(json.loads(r[0])) for r in reversed(recent)],
+        }
+
+    def range_totals(self, start=None, end=None):
+        row = self.db.query_one(SQL_RANGE_TOTALS, (self.user_id, start or "", end or "9999"))
+        return {
+            "count": row[0],
+            "sales": row[1],
+            "labor": row[2],
+            "items": row[3],
+            "days": row[4],
+        }
+
+
+BACKENDS = {
+    "json": JsonStorage,
+    "sqlite": SqliteStorage,
+}
+
+_storages = LruRegistry()
+
+
+def configured_backend():
+    """Backend name from AUTOINVOICE_STORAGE"""
+    return os.environ.get("AUTOINVOICE_STORAGE", DEFAULT_BACKEND)
+
+
+def stored_user_ids(backend=None):
+    """Every user id with data in a backend (or with directories on disk)"""
+    users = user_dirs_on_disk()
+    if (backend or configured_backend()) == "sqlite":
+        users.update(row[0] for row in get_database().query_all(SQL_USERS))
+    return sorted(users)
+
+
+def get_storage(user_id, backend=None):
+    """
+    Get the storage object for a user.
+    The backend comes from AUTOINVOICE_STORAGE unless given explicitly.
+    """
+    backend = backend or configured_backend()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}' (choose from {', '.join(BACKENDS)})")
+
+    return _storages.get((backend, user_id), lambda: BACKENDS[backend](user_id))
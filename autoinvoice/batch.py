@@ -0,0 +1,261 @@
+import argparse
+import csv
+import datetime
+import json
+import math
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from autoinvoice.allocator import format_invoice_number
+from autoinvoice.backends import get_storage, user_invoices_dir
+from autoinvoice.cache import ensure_dir
+from autoinvoice.commit import begin_invoices
+from autoinvoice.engine import (
+    merge_profile, make_line_item, validate_invoice_input, build_invoice_data
+)
+from autoinvoice.pdf import ARCHIVE_PDFS
+from autoinvoice.pdfcache import render_cached
+
+# ========================
+# BATCH INVOICE GENERATION
+# ========================
+#
+# Fleet jobs without the web UI. Reads one job per invoice from a CSV or
+# JSONL file, allocates all invoice numbers in a single block, logs them in
+# the commit log, renders the PDFs in parallel, saves every record with one
+# bulk write and packs the PDFs plus a summary into a zip.
+#
+#     python -m autoinvoice.batch jobs.csv --user ws_3f9c0a71d2e4b815 --out fleet.zip
+#
+# JSONL - one job per line:
+#     {"customer_name": "...", "car_details": "...", "labor": 1500, "discount": 0,
+#      "items": [{"desc": "Oil change", "qty": 1, "price": 2500}]}
+#
+# CSV - one line item per row, rows sharing a `job` value form one invoice:
+#     job,customer_name,car_details,labor,discount,desc,qty,price
+
+DEFAULT_LABOR = 1500
+
+
+class BatchInputError(ValueError):
+    """Raised when a jobs file has invalid rows"""
+
+
+def _number(value, default=0):
+    if value is None or str(value).strip() == "":
+        return default
+    if isinstance(value, bool):
+        raise ValueError(f"{value!r} is not a number")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{value!r} is not a number")
+    if not math.isfinite(number):
+        raise ValueError(f"{value!r} is not a number")
+    return int(number) if number.is_integer() else number
+
+
+def _amount(value, name, default=0):
+    """Non-negative rupee amount from a jobs file value"""
+    number = _number(value, default)
+    if number < 0:
+        raise ValueError(f"{name} must not be negative")
+    return number
+
+
+def _line_item(desc, qty, price):
+    """Line item from a jobs file, with the rules the API applies"""
+    qty = _number(qty, 1)
+    if not isinstance(qty, int) or qty <= 0:
+        raise ValueError(f"qty must be a positive whole number, not {qty}")
+    return make_line_item(str(desc), qty, _amount(price, "price"))
+
+
+def _job(row, items):
+    return {
+        'customer_name': str(row.get('customer_name') or ''),
+        'car_details': str(row.get('car_details') or ''),
+        'labor': _amount(row.get('labor'), "labor", DEFAULT_LABOR),
+        'discount': _amount(row.get('discount'), "discount"),
+        'items': items,
+    }
+
+
+def read_jsonl_jobs(path):
+    jobs = []
+    errors = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                jobs.append(_job(row, [_line_item(i['desc'], i.get('qty', 1), i['price'])
+                                       for i in row.get('items', [])]))
+            except KeyError as e:
+                errors.append(f"line {line_no}: item without {e}")
+            except (ValueError, TypeError, AttributeError) as e:
+                errors.append(f"line {line_no}: {e}")
+    if errors:
+        raise BatchInputError("\n".join(errors))
+    return jobs
+
+
+def read_csv_jobs(path):
+    jobs = {}
+    errors = []
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            key = row.get('job') or f"{row.get('customer_name')}|{row.get('car_details')}"
+            try:
+                job = jobs.get(key)
+                if job is None:
+                    job = jobs[key] = _job(row, [])
+                if (row.get('desc') or '').strip():
+                    job['items'].append(_line_item(row['desc'], row.get('qty'), row.get('price')))
+            except ValueError as e:
+                errors.append(f"line {reader.line_num}: {e}")
+    if errors:
+        raise BatchInputError("\n".join(errors))
+    return list(jobs.values())
+
+
+def read_jobs(path):
+    """Parse and validate a CSV or JSONL jobs file"""
+    if path.lower().endswith((".jsonl", ".ndjson", ".json")):
+        jobs = read_jsonl_jobs(path)
+    else:
+        jobs = read_csv_jobs(path)
+
+    errors = []
+    for index, job in enumerate(jobs, 1):
+        for problem in validate_invoice_input(job['customer_name'], job['car_details'], job['items']):
+            errors.append(f"job {index}: {problem}")
+    if errors:
+        raise BatchInputError("\n".join(errors))
+    return jobs
+
+
+def run_batch(jobs, user_id, out_path, workers=None):
+    """
+    Generate invoices for parsed jobs.
+    Returns the summary dict that is also written into the zip.
+    """
+    started = time.perf_counter()
+    storage = get_storage(user_id)
+    profile = merge_profile(storage.load_profile())
+    now = datetime.datetime.now()
+
+    # One allocation for the whole batch
+    first = storage.allocate(len(jobs))
+
+    invoices = [
+        build_invoice_data(
+            format_invoice_number(first + offset),
+            job['customer_name'],
+            job['car_details'],
+            job['items'],
+            job['labor'],
+            job['discount'],
+            user_id,
+            profile['workshop_name'],
+            now,
+            profile,
+        )
+        for offset, job in enumerate(jobs)
+    ]
+
+    filenames = [f"invoice_{inv['invoice_number']}.pdf" for inv in invoices]
+    if ARCHIVE_PDFS:
+        pdf_dir = ensure_dir(user_invoices_dir(user_id))
+        paths = [os.path.join(pdf_dir, name) for name in filenames]
+    else:
+        paths = [None] * len(invoices)
+
+    # Logged before any PDF is archived: a crash part-way is recovered like
+    # any other unfinished invoice
+    day = now.strftime("%Y-%m-%d")
+    commits = begin_invoices(storage, [inv['invoice_number'] for inv in invoices], paths, day)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pdfs = list(pool.map(render_cached, invoices, [profile] * len(invoices), paths,
+                                 chunksize=max(1, len(invoices) // (4 * (workers or os.cpu_count() or 1)))))
+
+        # One bulk write for every record
+        storage.save_invoices(invoices, day)
+        storage.sync()
+    except BaseException:
+        for invoice_commit in commits:
+            invoice_commit.pdf_written(False)
+            invoice_commit.abort()
+        raise
+    for invoice_commit in commits:
+        invoice_commit.pdf_written()
+        invoice_commit.record_saved()
+
+    summary = {
+        'user_id': user_id,
+        'generated_at': now.strftime("%Y-%m-%d %H:%M:%S"),
+        'invoice_count': len(invoices),
+        'first_invoice': invoices[0]['invoice_number'] if invoices else None,
+        'last_invoice': invoices[-1]['invoice_number'] if invoices else None,
+        'total_sales': sum(inv['grand_total'] for inv in invoices),
+        'total_labor': sum(inv['labor'] for inv in invoices),
+        'invoices': [
+            {
+                'invoice_number': inv['invoice_number'],
+                'customer_name': inv['customer_name'],
+                'car_details': inv['car_details'],
+                'items': len(inv['items']),
+                'grand_total': inv['grand_total'],
+            }
+            for inv in invoices
+        ],
+    }
+
+    with zipfile.ZipFile(out_path, "w") as zf:
+        for name, pdf_bytes in zip(filenames, pdfs):
+            # PDF streams are already compressed
+            zf.writestr(name, pdf_bytes, compress_type=zipfile.ZIP_STORED)
+        zf.writestr("summary.json", json.dumps(summary, indent=2),
+                    compress_type=zipfile.ZIP_DEFLATED)
+
+    summary['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a batch of invoices from CSV or JSONL")
+    parser.add_argument("jobs", help="CSV or JSONL jobs file")
+    parser.add_argument("--user", required=True, help="workshop id, e.g. ws_3f9c0a71d2e4b815")
+    parser.add_argument("--out", help="zip file to write (default: <jobs>.zip)")
+    parser.add_argument("--workers", type=int, default=None, help="render processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = read_jobs(args.jobs)
+    except (BatchInputError, KeyError, ValueError) as e:
+        print(f"Invalid jobs file: {e}", file=sys.stderr)
+        return 2
+
+    if not jobs:
+        print("No jobs found", file=sys.stderr)
+        return 2
+
+    out_path = args.out or os.path.splitext(args.jobs)[0] + ".zip"
+    summary = run_batch(jobs, args.user, out_path, args.workers)
+
+    print(f"Generated {summary['invoice_count']} invoices "
+          f"({summary['first_invoice']} .. {summary['last_invoice']}) "
+          f"in {summary['elapsed_seconds']}s")
+    print(f"Total sales: {summary['total_sales']:,}")
+    print(f"Written: {out_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
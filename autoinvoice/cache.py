@@ -0,0 +1,176 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+# ========================
+# PROFILE & DIRECTORY CACHE
+# ========================
+#
+# app.py loads the workshop profile on every Streamlit rerun. The cache
+# keeps each user's stored profile in memory together with the storage
+# version it was read at (profile.json mtime for the json backend, SQLite's
+# data_version for the database) and only reads it again when that version
+# changes or after save_profile(). Directories that were already created
+# are remembered so rerunning code does not repeat the makedirs call.
+#
+# Both caches are LRU-bounded so a long-running server with many sessions
+# does not keep every user in memory.
+
+PROFILE_CACHE_SIZE = int(os.environ.get("AUTOINVOICE_PROFILE_CACHE", "256"))
+DIR_CACHE_SIZE = 4 * PROFILE_CACHE_SIZE
+OPEN_USERS = int(os.environ.get("AUTOINVOICE_OPEN_USERS", "256"))
+
+
+class ProfileCache:
+    """Per-user stored profiles, re-read only when the storage changes"""
+
+    def __init__(self, max_users=PROFILE_CACHE_SIZE):
+        self.max_users = max(1, max_users)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, storage):
+        """Stored profile dict for a storage object's user, or None"""
+        key = (storage.name, storage.user_id)
+        version = storage.profile_version()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        profile = storage.load_profile()
+        with self._lock:
+            self._entries[key] = (version, profile)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return profile
+
+    def invalidate(self, storage=None):
+        """Forget one user's profile, or every profile"""
+        with self._lock:
+            if storage is None:
+                self._entries.clear()
+            else:
+                self._entries.pop((storage.name, storage.user_id), None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_profiles = ProfileCache()
+
+
+def cached_profile(storage):
+    """Stored profile for a user, served from memory while unchanged"""
+    return _profiles.get(storage)
+
+
+def invalidate_profile(storage=None):
+    _profiles.invalidate(storage)
+
+
+_dirs = OrderedDict()
+_dirs_lock = threading.Lock()
+
+
+def ensure_dir(path):
+    """makedirs once per directory; later calls are a dict lookup"""
+    with _dirs_lock:
+        if path in _dirs:
+            _dirs.move_to_end(path)
+            return path
+
+    os.makedirs(path, exist_ok=True)
+    with _dirs_lock:
+        _dirs[path] = True
+        while len(_dirs) > DIR_CACHE_SIZE:
+            _dirs.popitem(last=False)
+    return path
+
+
+def forget_dir(path):
+    """Drop a directory from the cache after removing it"""
+    with _dirs_lock:
+        _dirs.pop(path, None)
+
+
+# ========================
+# PER-USER REGISTRIES
+# ========================
+#
+# Storage objects, day journals, search indexes and statistics are shared
+# per user and created on first use. LruRegistry keeps the OPEN_USERS most
+# recently used of each; an evicted one is handed to `on_evict` (journals
+# sync and close their file, which they reopen if used again).
+#
+# An evicted object a caller still holds is not replaced: while it is
+# referenced anywhere, get() returns that same object, so there is never a
+# second journal or index for the same files. Objects are created outside
+# the registry lock, one at a time per key, so a slow create (a legacy
+# import, a rollup or search index rebuild) only holds up that user.
+
+class LruRegistry:
+    """Shared objects by key, bounded to the most recently used"""
+
+    def __init__(self, max_entries=OPEN_USERS, on_evict=None):
+        self.max_entries = max(1, max_entries)
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._alive = weakref.WeakValueDictionary()
+        self._creating = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        # Called with the lock held
+        value = self._entries.get(key)
+        if value is None:
+            value = self._alive.get(key)
+            if value is None:
+                return None
+            self._entries[key] = value
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, key, create):
+        """The object for a key, made with create() if there is none"""
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            once = self._creating.setdefault(key, threading.Lock())
+
+        with once:
+            with self._lock:
+                value = self._lookup(key)
+            if value is not None:
+                return value
+            value = create()
+            with self._lock:
+                self._entries[key] = self._alive[key] = value
+                self._creating.pop(key, None)
+                evicted = []
+                while len(self._entries) > self.max_entries:
+                    evicted.append(self._entries.popitem(last=False)[1])
+
+        for old in evicted:
+            if self.on_evict is not None:
+                self.on_evict(old)
+        return value
+
+    def pop(self, key):
+        """Forget the object for a key; returns it or None"""
+        with self._lock:
+            self._alive.pop(key, None)
+            return self._entries.pop(key, None)
+
+    def values(self):
+        """Every object still in use, evicted or not"""
+        with self._lock:
+            return list(self._alive.values())
+
+    def __len__(self):
+        return len(self._entries)
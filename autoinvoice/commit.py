@@ -0,0 +1,397 @@
+import asyncio
+import atexit
+import json
+import os
+import threading
+import uuid
+
+from autoinvoice.allocator import parse_invoice_number
+from autoinvoice.backends import get_storage, try_file_lock, user_invoices_dir
+from autoinvoice.cache import cached_profile, ensure_dir
+from autoinvoice.engine import merge_profile
+from autoinvoice.metrics import count, timed
+from autoinvoice.pdf import ARCHIVE_PDFS, sync_dir
+from autoinvoice.pdfcache import render_cached, render_profile
+from autoinvoice.storage import today_key
+
+# ========================
+# OVERLAPPED INVOICE COMMIT
+# ========================
+#
+# Generating an invoice writes two things that must be on disk before it
+# is confirmed: the invoice record and, when PDFs are archived, the PDF.
+# (The number was already reserved by Storage.allocate(), which the
+# record needs.) The two do not depend on each other, so they are not
+# written one after the other:
+#
+#     render + write + fsync PDF   (PDF worker)  ─┐
+#     append + fsync record        (thread)      ─┴─> confirmed
+#
+# On a slow or shared disk each fsync costs milliseconds to tens of
+# milliseconds; overlapped, the commit takes as long as the slower of the
+# two instead of their sum. Records are synced explicitly here, so a
+# confirmed invoice never waits in the journal's fsync batch.
+
+# ========================
+# WRITE-AHEAD COMMIT LOG AND RECOVERY
+# ========================
+#
+# Before anything is written for an invoice, a "begin" line naming it
+# (workshop, backend, number, day, archive path) is appended to a commit
+# log and fsync'd; once its record and PDF are written an "end" line
+# follows. The record is the commit point:
+#
+#     record saved  -> the invoice is completed (a missing PDF is rendered again)
+#     no record     -> it is rolled back (a PDF written for it is removed)
+#
+# Numbers are never handed out again either way, so a rolled-back invoice
+# leaves a gap, never a duplicate. allocate() is not necessarily durable
+# by the time "begin" is logged (SQLite runs synchronous=NORMAL, so a
+# power cut can lose the last counter bump), so rolling back also moves
+# the counter past the logged number with skip_number(). A failure inside
+# a running process resolves its invoice at once; a crash leaves the
+# "begin" line for recovery.
+#
+# Every process has its own log, data/commits/<id>.jsonl, and holds a lock
+# on data/commits/<id>.lock while it runs. The first commit of a process
+# (and the warm-up) recovers every log whose lock is free - its process
+# has died - and deletes it. A log only holds invoices in flight: it is
+# truncated whenever none are, and rewritten with just the open ones once
+# COMPACT_LINES of its lines are no longer needed, so recovery reads a few
+# lines per dead process and looks each invoice up on its day, whatever
+# the size of the history.
+
+COMMIT_LOG_DIR = os.environ.get("AUTOINVOICE_COMMIT_LOG_DIR", "data/commits")
+COMPACT_LINES = 1000
+LOG_SUFFIX = ".jsonl"
+LOCK_SUFFIX = ".lock"
+
+COMPLETED = "completed"
+ROLLED_BACK = "rolled_back"
+
+
+def archive_path(user_id, invoice_number):
+    """Where an invoice's PDF is archived, or None when archiving is off"""
+    if not ARCHIVE_PDFS:
+        return None
+    directory = ensure_dir(user_invoices_dir(user_id))
+    return os.path.join(directory, f"invoice_{invoice_number}.pdf")
+
+
+def save_durably(storage, invoice_data, day=None):
+    """Save an invoice record and sync it to disk"""
+    storage.save_invoice(invoice_data, day)
+    storage.sync()
+    return True
+
+
+async def commit_invoice_async(storage, invoice_data, pdf=None, day=None, executor=None):
+    """
+    Save an invoice record durably while its PDF is being written.
+
+    `pdf` is a concurrent.futures.Future of the PDF bytes (e.g. from
+    PdfRenderPool.render with an archive path), already running. Returns
+    the PDF bytes (None without one) once both are on disk; raises if
+    either failed, after both have finished.
+    """
+    loop = asyncio.get_running_loop()
+    steps = [loop.run_in_executor(executor, save_durably, storage, invoice_data, day)]
+    if pdf is not None:
+        steps.append(asyncio.wrap_future(pdf))
+
+    with timed("commit_invoice", invoice_data.get("user_id")):
+        results = await asyncio.gather(*steps, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results[1] if pdf is not None else None
+
+
+def resolve(entry):
+    """
+    Complete or roll back an invoice left between "begin" and "end".
+    Returns COMPLETED or ROLLED_BACK.
+    """
+    storage = get_storage(entry["user"], entry["backend"])
+    number = entry["number"]
+    filepath = entry.get("pdf")
+
+    invoice_data = storage.find_invoice(number, entry["day"])
+    if invoice_data is None:
+        if filepath:
+            for path in (filepath, filepath + ".tmp"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        parsed = parse_invoice_number(number)
+        if parsed is not None:
+            storage.skip_number(parsed)
+        print(f"Rolled back unfinished invoice {number} of {entry['user']}; the number stays unused")
+        count("invoice_rolled_back", entry["user"])
+        return ROLLED_BACK
+
+    if filepath and not os.path.exists(filepath):
+        profile = render_profile(invoice_data, merge_profile(cached_profile(storage)))
+        render_cached(invoice_data, profile, filepath)
+        print(f"Completed unfinished invoice {number} of {entry['user']}: PDF written again")
+        count("invoice_completed", entry["user"])
+    return COMPLETED
+
+
+class InvoiceCommit:
+    """One invoice between "begin" and "end" in the commit log"""
+
+    def __init__(self, log, entry):
+        self.log = log
+        self.entry = entry
+        self.day = entry["day"]
+        self.filepath = entry["pdf"]
+        self._lock = threading.Lock()
+        self._waiting = {"record", "pdf"} if self.filepath else {"record"}
+        self._failed = False
+
+    def record_saved(self):
+        """The record is saved and synced"""
+        return self._finish("record", True)
+
+    def pdf_written(self, ok=True):
+        """The archived PDF is written (ok) or failed; a no-op without archiving"""
+        return self._finish("pdf", ok)
+
+    def watch_pdf(self, future):
+        """Call pdf_written() when a Future of the PDF finishes"""
+        if self.filepath:
+            future.add_done_callback(lambda f: self.pdf_written(not f.cancelled() and f.exception() is None))
+
+    def abort(self):
+        """
+        The caller gave up on the invoice. It is resolved once the PDF (if
+        any) has finished; returns COMPLETED or ROLLED_BACK if that is now,
+        None if later.
+        """
+        return self._finish("record", False)
+
+    def _finish(self, step, ok):
+        with self._lock:
+            if step not in self._waiting:
+                return None
+            self._waiting.discard(step)
+            self._failed = self._failed or not ok
+            if self._waiting:
+                return None
+
+        outcome = COMPLETED
+        if self._failed:
+            try:
+                outcome = resolve(self.entry)
+            except Exception as e:
+                # Left in the log; the next process to start recovers it
+                print(f"Error resolving invoice {self.entry['number']}: {e}")
+                return None
+        self.log.end(self.entry)
+        return outcome
+
+
+def read_log(path):
+    """Entries of a commit log that were begun but never ended, in order"""
+    pending = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash - skip it
+                    continue
+                if entry.get("op") == "begin":
+                    pending[entry["id"]] = entry
+                elif entry.get("op") == "end":
+                    pending.pop(entry.get("id"), None)
+    except FileNotFoundError:
+        pass
+    return list(pending.values())
+
+
+class CommitLog:
+    """This process's write-ahead log of invoices being committed"""
+
+    def __init__(self, directory=COMMIT_LOG_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.name = uuid.uuid4().hex
+        self.path = os.path.join(directory, self.name + LOG_SUFFIX)
+        self.lock_path = os.path.join(directory, self.name + LOCK_SUFFIX)
+        self._owner = self._take_lock()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._pending = {}
+        self._lines = 0
+        self._written = 0
+        self._synced = 0
+        self._handle = open(self.path, "a", encoding="utf-8")
+        sync_dir(directory)
+
+    def _take_lock(self):
+        # Locked under a name recover() ignores, then moved into place: a
+        # lock file that is there unlocked, even briefly, looks like one
+        # left by a dead process and is deleted
+        tmp_path = self.lock_path + ".tmp"
+        owner = try_file_lock(tmp_path)
+        if owner is None:
+            raise RuntimeError(f"Commit log lock {tmp_path} is held by another process")
+        try:
+            os.replace(tmp_path, self.lock_path)
+        except OSError:
+            owner.close()
+            os.remove(tmp_path)
+            raise
+        return owner
+
+    def begin(self, storage, invoice_number, filepath=None, day=None):
+        """Log an invoice before anything is written for it"""
+        return self.begin_many(storage, [invoice_number], [filepath], day)[0]
+
+    def begin_many(self, storage, invoice_numbers, filepaths, day=None):
+        """Log several invoices of one workshop with a single sync"""
+        day = day or today_key()
+        entries = [{"op": "begin", "id": uuid.uuid4().hex, "backend": storage.name, "user": storage.user_id,
+                    "number": number, "day": day, "pdf": filepath}
+                   for number, filepath in zip(invoice_numbers, filepaths)]
+        with self._lock:
+            for entry in entries:
+                self._write(entry)
+                self._pending[entry["id"]] = entry
+            written = self._written
+        self._sync(written)
+        return [InvoiceCommit(self, entry) for entry in entries]
+
+    def _sync(self, upto):
+        # Group commit: sessions beginning invoices at the same time share one fsync
+        with self._sync_lock:
+            if self._synced >= upto:
+                return
+            with self._lock:
+                self._handle.flush()
+                written = self._written
+            os.fsync(self._handle.fileno())
+            self._synced = written
+
+    def end(self, entry):
+        """Mark an invoice finished (not synced: recovering it again is harmless)"""
+        with self._sync_lock, self._lock:
+            if self._pending.pop(entry["id"], None) is None:
+                return
+            if not self._pending:
+                # Nothing in flight: nothing in the log is needed any more
+                self._handle.truncate(0)
+                self._lines = 0
+            elif self._lines - len(self._pending) >= COMPACT_LINES:
+                self._compact()
+            else:
+                self._write({"op": "end", "id": entry["id"]})
+                self._handle.flush()
+
+    def _write(self, entry):
+        self._handle.write(json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n")
+        self._lines += 1
+        self._written += 1
+
+    def _compact(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self._pending.values():
+                f.write(json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._handle.close()
+        os.replace(tmp_path, self.path)
+        sync_dir(self.directory)
+        self._handle = open(self.path, "a", encoding="utf-8")
+        self._lines = len(self._pending)
+        self._synced = self._written
+
+    def close(self):
+        """Close the log; it is deleted unless invoices are still in flight"""
+        with self._sync_lock, self._lock:
+            if self._handle.closed:
+                return
+            self._handle.close()
+            self._owner.close()
+            if not self._pending:
+                for path in (self.path, self.lock_path):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+
+def recover(directory=COMMIT_LOG_DIR, skip=None):
+    """
+    Resolve the invoices in every commit log whose process has died, then
+    delete those logs. Returns (completed, rolled back).
+    """
+    completed = rolled_back = 0
+    if not os.path.isdir(directory):
+        return completed, rolled_back
+
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(LOCK_SUFFIX) or name[:-len(LOCK_SUFFIX)] == skip:
+            continue
+        lock_path = os.path.join(directory, name)
+        owner = try_file_lock(lock_path)
+        if owner is None:
+            # Its process is still running
+            continue
+        log_path = lock_path[:-len(LOCK_SUFFIX)] + LOG_SUFFIX
+        try:
+            for entry in read_log(log_path):
+                if resolve(entry) == COMPLETED:
+                    completed += 1
+                else:
+                    rolled_back += 1
+            for path in (log_path, log_path + ".tmp"):
+                if os.path.exists(path):
+                    os.remove(path)
+        except Exception as e:
+            # Kept for the next attempt; resolving an invoice twice is harmless
+            print(f"Error recovering commit log {log_path}: {e}")
+            owner.close()
+            continue
+        owner.close()
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+    return completed, rolled_back
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_commit_log():
+    """Process-wide CommitLog; creating it first recovers the logs of dead processes"""
+    global _log
+    with _log_lock:
+        if _log is None:
+            log = CommitLog()
+            try:
+                completed, rolled_back = recover(skip=log.name)
+                if completed or rolled_back:
+                    print(f"Commit recovery: {completed} invoices completed, {rolled_back} rolled back")
+            except Exception as e:
+                print(f"Error recovering unfinished invoices: {e}")
+            atexit.register(log.close)
+            _log = log
+        return _log
+
+
+def begin_invoice(storage, invoice_number, filepath=None, day=None):
+    """Log an invoice in this process's commit log; returns its InvoiceCommit"""
+    return get_commit_log().begin(storage, invoice_number, filepath, day)
+
+
+def begin_invoices(storage, invoice_numbers, filepaths, day=None):
+    """begin_invoice() for a batch; returns their InvoiceCommits in order"""
+    return get_commit_log().begin_many(storage, invoice_numbers, filepaths, day)
@@ -0,0 +1,212 @@
+import argparse
+import os
+import sys
+
+from autoinvoice.allocator import format_invoice_number, parse_invoice_number
+from autoinvoice.backends import configured_backend, get_storage, stored_user_ids, user_invoices_dir
+from autoinvoice.cache import ensure_dir
+from autoinvoice.tenants import SESSION_ID_PATTERN, TOKEN_PARAM, is_tenant_id, new_tenant_id, sign_tenant
+
+# ========================
+# ORPHANED SESSION COMPACTION
+# ========================
+#
+# Before workshops had a stable tenant id, every browser session got its own
+# user_<hash> id, so each refresh left a directory (or database rows) behind
+# with its own counter, profile and invoices. This tool lists those orphans,
+# deletes the empty ones and merges the rest into a workshop:
+#
+#     python -m autoinvoice.compact list
+#     python -m autoinvoice.compact prune --dry-run
+#     python -m autoinvoice.compact merge --into ws_3f9c0a71d2e4b815 user_ab12cd34 user_9f00e1c2
+#     python -m autoinvoice.compact merge --into ws_3f9c0a71d2e4b815 --all
+#     python -m autoinvoice.compact link [ws_3f9c0a71d2e4b815]
+#
+# Merging copies every invoice to the same day of the target (user_id
+# rewritten), moves the archived PDFs, keeps the target's profile (or takes
+# the first source profile if it has none), raises the target's counter
+# above every merged number and finally deletes the source. An invoice
+# whose number the target already uses is given the next free number; the
+# old and new numbers are printed. `link` prints the ?workshop= token for a
+# tenant, creating a new tenant if none is given.
+#
+# Run it with the same AUTOINVOICE_STORAGE (or --backend) and working
+# directory as the app. Merge into a workshop that is not generating
+# invoices at the same moment; with the json backend restart the app
+# afterwards so its in-memory totals include the merged days.
+
+
+def orphan_ids(backend):
+    """Session-derived user ids that still have storage"""
+    return [u for u in stored_user_ids(backend) if SESSION_ID_PATTERN.match(u)]
+
+
+def describe(storage):
+    totals = storage.range_totals()
+    return {
+        "user_id": storage.user_id,
+        "invoices": totals["count"],
+        "days": totals["days"],
+        "sales": totals["sales"],
+        "profile": storage.load_profile() is not None,
+    }
+
+
+def move_pdfs(source_id, target_id, renumbered=()):
+    """
+    Move archived PDFs to the target, renaming any that would clash.
+    PDFs of renumbered invoices are dropped: they show the old number, and
+    are rendered again from the record when downloaded.
+    """
+    source_dir = user_invoices_dir(source_id)
+    if not os.path.isdir(source_dir):
+        return 0
+    target_dir = ensure_dir(user_invoices_dir(target_id))
+    dropped = {f"invoice_{number}.pdf" for number in renumbered}
+    moved = 0
+    for name in sorted(os.listdir(source_dir)):
+        if name in dropped:
+            continue
+        target = os.path.join(target_dir, name)
+        if os.path.exists(target):
+            stem, ext = os.path.splitext(name)
+            target = os.path.join(target_dir, f"{stem}_{source_id}{ext}")
+        os.replace(os.path.join(source_dir, name), target)
+        moved += 1
+    return moved
+
+
+def merge_user(source, target):
+    """
+    Merge one source storage into the target and delete the source.
+    Source invoices whose number the target already uses get a new number
+    from the target's counter. Returns (invoices, PDFs moved, {old: new}).
+    """
+    taken = {invoice.get("invoice_number") for _, invoice in target.iter_invoices()}
+    merged = list(source.iter_invoices())
+
+    # The counter first goes past every number either side uses, so the
+    # numbers handed out for clashes are new to both
+    numbers = [parse_invoice_number(n) for n in taken]
+    numbers += [parse_invoice_number(invoice.get("invoice_number")) for _, invoice in merged]
+    highest = max((n for n in numbers if n is not None), default=0)
+    target.set_counter(max(target.peek_counter(), source.peek_counter(), highest + 1))
+
+    renumbered = {}
+    by_day = {}
+    for day, invoice in merged:
+        number = invoice.get("invoice_number")
+        if number in taken:
+            new_number = format_invoice_number(target.allocate(1))
+            renumbered[number] = new_number
+            invoice = dict(invoice, invoice_number=new_number)
+            number = new_number
+        taken.add(number)
+        by_day.setdefault(day, []).append(dict(invoice, user_id=target.user_id))
+    for day, invoices in by_day.items():
+        target.save_invoices(invoices, day)
+
+    if target.load_profile() is None:
+        profile = source.load_profile()
+        if profile is not None:
+            target.save_profile(profile)
+
+    pdfs = move_pdfs(source.user_id, target.user_id, renumbered)
+    source.delete()
+    return len(merged), pdfs, renumbered
+
+
+def cmd_list(args):
+    orphans = [describe(get_storage(u, args.backend)) for u in orphan_ids(args.backend)]
+    if not orphans:
+        print("No orphaned session storage")
+        return 0
+    print(f"{'user id':<16}{'invoices':>10}{'days':>6}{'sales':>14}  profile")
+    for row in orphans:
+        print(f"{row['user_id']:<16}{row['invoices']:>10}{row['days']:>6}{row['sales']:>14,}"
+              f"  {'yes' if row['profile'] else 'no'}")
+    empty = sum(1 for row in orphans if not row["invoices"])
+    print(f"{len(orphans)} orphaned sessions, {empty} without invoices")
+    return 0
+
+
+def cmd_prune(args):
+    removed = 0
+    for user_id in orphan_ids(args.backend):
+        storage = get_storage(user_id, args.backend)
+        if storage.range_totals()["count"]:
+            continue
+        print(f"{'would remove' if args.dry_run else 'removing'} {user_id}")
+        if not args.dry_run:
+            storage.delete()
+        removed += 1
+    print(f"{removed} empty sessions {'to remove' if args.dry_run else 'removed'}")
+    return 0
+
+
+def cmd_merge(args):
+    if not is_tenant_id(args.into):
+        print(f"Not a workshop id: {args.into}", file=sys.stderr)
+        return 2
+
+    sources = orphan_ids(args.backend) if args.all else args.sources
+    sources = [u for u in sources if u != args.into]
+    if not sources:
+        print("Nothing to merge", file=sys.stderr)
+        return 2
+
+    target = get_storage(args.into, args.backend)
+    for user_id in sources:
+        source = get_storage(user_id, args.backend)
+        row = describe(source)
+        if args.all and not row["invoices"]:
+            continue
+        if args.dry_run:
+            print(f"would merge {user_id} ({row['invoices']} invoices) into {args.into}")
+            continue
+        invoices, pdfs, renumbered = merge_user(source, target)
+        print(f"merged {user_id}: {invoices} invoices, {pdfs} PDFs")
+        for old, new in renumbered.items():
+            print(f"  {old} was already used by {args.into}; renumbered {new}")
+
+    if not args.dry_run:
+        print(f"{args.into}: {target.range_totals()['count']} invoices, next number {target.peek_counter()}")
+    return 0
+
+
+def cmd_link(args):
+    tenant_id = args.tenant or new_tenant_id()
+    if not is_tenant_id(tenant_id):
+        print(f"Not a workshop id: {tenant_id}", file=sys.stderr)
+        return 2
+    print(f"workshop: {tenant_id}")
+    print(f"link:     ?{TOKEN_PARAM}={sign_tenant(tenant_id)}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact orphaned session storage into workshops")
+    parser.add_argument("--backend", default=configured_backend(), choices=["sqlite", "json"])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="show orphaned sessions")
+
+    prune = commands.add_parser("prune", help="delete orphaned sessions without invoices")
+    prune.add_argument("--dry-run", action="store_true")
+
+    merge = commands.add_parser("merge", help="merge orphaned sessions into a workshop")
+    merge.add_argument("--into", required=True, help="target workshop id, e.g. ws_3f9c0a71d2e4b815")
+    merge.add_argument("sources", nargs="*", help="session ids to merge")
+    merge.add_argument("--all", action="store_true", help="merge every orphan with invoices")
+    merge.add_argument("--dry-run", action="store_true")
+
+    link = commands.add_parser("link", help="print the workshop link token for a tenant")
+    link.add_argument("tenant", nargs="?", help="workshop id (default: a new one)")
+
+    args = parser.parse_args(argv)
+    handlers = {"list": cmd_list, "prune": cmd_prune, "merge": cmd_merge, "link": cmd_link}
+    return handlers[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
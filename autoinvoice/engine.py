@@ -0,0 +1,78 @@
+from autoinvoice.models import Invoice, LineItem, items_subtotal_paisa, to_paisa, from_paisa
+
+# ========================
+# INVOICE CALCULATIONS
+# ========================
+#
+# Shared by the Streamlit generate button and the batch entry point so
+# both produce exactly the same records and totals. Pure functions over
+# plain dicts and the Invoice/LineItem model; importing this module pulls
+# in neither Streamlit nor the PDF library.
+
+DEFAULT_PROFILE = {
+    'workshop_name': 'Auto Care Workshop',
+    'phone_number': '+92-300-1234567',
+    'address': 'Main Road, Karachi',
+    'email': '',
+    'website': '',
+    'owner_name': 'Your Name',
+    'tax_rate': 0,
+    'currency': 'PKR'
+}
+
+
+def merge_profile(profile_data):
+    """Stored profile merged over the defaults"""
+    return {**DEFAULT_PROFILE, **(profile_data or {})}
+
+
+def make_line_item(desc, qty, price):
+    """Repair item with its price held in paisa"""
+    return LineItem.from_rupees(desc.strip(), qty, price)
+
+
+def calculate_totals(items, labor, discount):
+    """Return (subtotal, grand_total) for line items or item dicts, summed exactly"""
+    subtotal = items_subtotal_paisa([LineItem.coerce(item) for item in items])
+    total = subtotal + to_paisa(labor) - to_paisa(discount)
+    return from_paisa(subtotal), from_paisa(total)
+
+
+def validate_invoice_input(customer_name, car_details, items):
+    """List of problems that stop an invoice from being generated"""
+    problems = []
+    if not items:
+        problems.append("Please add at least one repair item")
+    if not customer_name.strip():
+        problems.append("Please enter customer name")
+    if not car_details.strip():
+        problems.append("Please enter vehicle details")
+    return problems
+
+
+def build_invoice(invoice_number, customer_name, car_details, items, labor, discount,
+                  user_id, workshop_name, date=None, profile=None):
+    """Invoice model from form or batch input; `profile` is snapshotted into it"""
+    invoice = Invoice(
+        invoice_number=invoice_number,
+        customer_name=customer_name,
+        car_details=car_details,
+        items=[LineItem.coerce(item) for item in items],
+        labor=labor,
+        discount=discount,
+        user_id=user_id,
+        workshop_name=workshop_name
+    )
+    if date is not None:
+        invoice.date = date
+    if profile is not None:
+        invoice.workshop_phone = profile.get('phone_number', '')
+        invoice.workshop_address = profile.get('address', '')
+    return invoice
+
+
+def build_invoice_data(invoice_number, customer_name, car_details, items, labor, discount,
+                       user_id, workshop_name, date=None, profile=None):
+    """Invoice record as saved to storage and rendered to PDF"""
+    return build_invoice(invoice_number, customer_name, car_details, items, labor, discount,
+                         user_id, workshop_name, date, profile).to_dict()
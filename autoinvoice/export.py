@@ -0,0 +1,335 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import time
+from decimal import Decimal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from autoinvoice.backends import configured_backend, get_storage, stored_user_ids
+from autoinvoice.models import DATE_FORMAT, to_paisa
+
+# ========================
+# PARQUET EXPORT
+# ========================
+#
+# Writes every workshop's invoices and line items as a Hive-partitioned
+# Parquet dataset, one file per user and month:
+#
+#     exports/invoices/user_id=<id>/month=<YYYY-MM>/part-0.parquet
+#     exports/line_items/user_id=<id>/month=<YYYY-MM>/part-0.parquet
+#     exports/_snapshot.json
+#
+#     python -m autoinvoice.export                      # incremental
+#     python -m autoinvoice.export --out /mnt/share/autoinvoice --full
+#     python -m autoinvoice.export --user ws_3f9c0a71d2e4b815
+#
+# Money is decimal(14, 2) in rupees, exact to the paisa. Read it back with
+# e.g. pyarrow.dataset.dataset("exports/invoices", partitioning="hive") or
+# pandas.read_parquet("exports/invoices").
+#
+# Exports are incremental. _snapshot.json records, per user, the version
+# of their invoices (see Storage.invoice_changes) at the last export; the
+# next run rewrites only the months holding days saved or cleared since,
+# and skips unchanged users without reading their records. Records are
+# streamed from Storage.iter_invoices() into the Parquet writers in row
+# groups of --batch-rows, so memory stays bounded however long the history
+# is. Every file is written to a temporary name and renamed into place.
+
+EXPORT_DIR = os.environ.get("AUTOINVOICE_EXPORT_DIR", "exports")
+SNAPSHOT_FILE = "_snapshot.json"
+SNAPSHOT_FORMAT = 1
+BATCH_ROWS = 10000
+PART_NAME = "part-0.parquet"
+
+MONEY = pa.decimal128(14, 2)
+
+INVOICE_SCHEMA = pa.schema([
+    ("day", pa.date32()),
+    ("invoice_number", pa.string()),
+    ("date", pa.timestamp("s")),
+    ("customer_name", pa.string()),
+    ("car_details", pa.string()),
+    ("workshop_name", pa.string()),
+    ("item_count", pa.int32()),
+    ("subtotal", MONEY),
+    ("labor", MONEY),
+    ("discount", MONEY),
+    ("grand_total", MONEY),
+])
+
+LINE_ITEM_SCHEMA = pa.schema([
+    ("day", pa.date32()),
+    ("invoice_number", pa.string()),
+    ("line", pa.int32()),
+    ("description", pa.string()),
+    ("qty", pa.int64()),
+    ("unit_price", MONEY),
+    ("total", MONEY),
+])
+
+TABLES = (("invoices", INVOICE_SCHEMA), ("line_items", LINE_ITEM_SCHEMA))
+
+
+def money(amount):
+    """Rupee amount as an exact two-place Decimal"""
+    return Decimal(to_paisa(amount or 0)).scaleb(-2)
+
+
+def parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, DATE_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def partition_dir(out_dir, table, user_id, month):
+    return os.path.join(out_dir, table, f"user_id={user_id}", f"month={month}")
+
+
+def remove_partitions(out_dir, user_id, month=None):
+    """Delete a user's exported month (or every month) from both tables"""
+    for table, _ in TABLES:
+        if month is None:
+            path = os.path.join(out_dir, table, f"user_id={user_id}")
+        else:
+            path = partition_dir(out_dir, table, user_id, month)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class MonthWriter:
+    """Streams one user-month into its invoices and line_items files"""
+
+    def __init__(self, out_dir, user_id, month, batch_rows=BATCH_ROWS):
+        self.batch_rows = max(1, batch_rows)
+        self.invoices = 0
+        self._paths = []
+        self._writers = {}
+        self._rows = {}
+        for table, schema in TABLES:
+            directory = partition_dir(out_dir, table, user_id, month)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, PART_NAME)
+            self._paths.append(path)
+            self._writers[table] = pq.ParquetWriter(path + ".tmp", schema, compression="zstd")
+            self._rows[table] = {name: [] for name in schema.names}
+
+    def add(self, day, record):
+        day = datetime.date.fromisoformat(day)
+        number = record.get("invoice_number", "")
+        items = record.get("items", [])
+
+        rows = self._rows["invoices"]
+        rows["day"].append(day)
+        rows["invoice_number"].append(number)
+        rows["date"].append(parse_date(record.get("date")))
+        rows["customer_name"].append(record.get("customer_name", ""))
+        rows["car_details"].append(record.get("car_details", ""))
+        rows["workshop_name"].append(record.get("workshop_name", ""))
+        rows["item_count"].append(len(items))
+        for name in ("subtotal", "labor", "discount", "grand_total"):
+            rows[name].append(money(record.get(name)))
+
+        rows = self._rows["line_items"]
+        for line, item in enumerate(items, 1):
+            rows["day"].append(day)
+            rows["invoice_number"].append(number)
+            rows["line"].append(line)
+            rows["description"].append(item.get("desc", ""))
+            rows["qty"].append(item.get("qty", 0))
+            rows["unit_price"].append(money(item.get("price")))
+            rows["total"].append(money(item.get("total")))
+
+        self.invoices += 1
+        if len(self._rows["line_items"]["day"]) >= self.batch_rows or \
+                len(self._rows["invoices"]["day"]) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self):
+        for table, schema in TABLES:
+            rows = self._rows[table]
+            if rows["day"]:
+                self._writers[table].write_table(pa.Table.from_pydict(rows, schema=schema))
+                for column in rows.values():
+                    column.clear()
+
+    def close(self):
+        """Finish both files and move them into place"""
+        self._flush()
+        for writer in self._writers.values():
+            writer.close()
+        for path in self._paths:
+            os.replace(path + ".tmp", path)
+        return self.invoices
+
+    def abort(self):
+        for writer in self._writers.values():
+            writer.close()
+        for path in self._paths:
+            if os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+
+
+def stream_months(storage, out_dir, start=None, end=None, batch_rows=BATCH_ROWS):
+    """
+    Export the user's invoices in [start, end] month by month.
+    Records come oldest first, so one writer is open at a time.
+    Returns {month: invoices} for every month written.
+    """
+    exported = {}
+    writer = month = None
+    try:
+        for day, record in storage.iter_invoices(start, end):
+            if day[:7] != month:
+                if writer is not None:
+                    exported[month] = writer.close()
+                    writer = None
+                month = day[:7]
+                if month in exported:
+                    # Reopening the month would overwrite the rows written so far
+                    raise RuntimeError(f"{storage.user_id}: records of {month} are not in day order")
+                writer = MonthWriter(out_dir, storage.user_id, month, batch_rows)
+            writer.add(day, record)
+        if writer is not None:
+            exported[month] = writer.close()
+            writer = None
+    finally:
+        if writer is not None:
+            writer.abort()
+    return exported
+
+
+def export_user(storage, out_dir, entry=None, batch_rows=BATCH_ROWS):
+    """
+    Bring one user's partitions up to date.
+    `entry` is the user's record from the last snapshot (None = full export).
+    Returns (new entry, months rewritten or None when unchanged).
+    """
+    version = None
+    if entry and entry.get("backend") == storage.name and entry.get("version"):
+        version = tuple(entry["version"])
+
+    # Take the version before reading: anything saved meanwhile is exported
+    # now and simply exported again next time
+    days, current = storage.invoice_changes(version)
+    if version is not None and current == version:
+        return entry, None
+
+    months = dict(entry.get("months", {})) if days is not None else {}
+    if days is None:
+        # First export, another backend or a rewritten index: everything
+        if entry is None:
+            remove_partitions(out_dir, storage.user_id)
+        exported = stream_months(storage, out_dir, batch_rows=batch_rows)
+        stale = set(entry.get("months", {})) - set(exported) if entry else set()
+        touched = set(exported) | stale
+    else:
+        exported = {}
+        stale = set()
+        touched = {day[:7] for day in days}
+        for month in sorted(touched):
+            written = stream_months(storage, out_dir, f"{month}-01", f"{month}-31", batch_rows)
+            exported.update(written)
+            if month not in written:
+                stale.add(month)
+
+    for month in stale:
+        remove_partitions(out_dir, storage.user_id, month)
+        months.pop(month, None)
+    months.update(exported)
+
+    return {
+        "backend": storage.name,
+        "version": list(current),
+        "exported_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "invoices": sum(months.values()),
+        "months": dict(sorted(months.items())),
+    }, sorted(touched)
+
+
+def load_snapshot(out_dir):
+    path = os.path.join(out_dir, SNAPSHOT_FILE)
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"format": SNAPSHOT_FORMAT, "users": {}}
+    if snapshot.get("format") != SNAPSHOT_FORMAT:
+        return {"format": SNAPSHOT_FORMAT, "users": {}}
+    return snapshot
+
+
+def save_snapshot(out_dir, snapshot):
+    snapshot["generated_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+    snapshot["invoices"] = sum(u["invoices"] for u in snapshot["users"].values())
+    path = os.path.join(out_dir, SNAPSHOT_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def export(out_dir=EXPORT_DIR, backend=None, users=None, full=False, batch_rows=BATCH_ROWS):
+    """
+    Export every user (or the given ones) and update the snapshot.
+    Yields (user_id, status, months rewritten) as each user finishes;
+    status is "exported", "unchanged" or "removed".
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    snapshot = load_snapshot(out_dir)
+    known = snapshot["users"]
+
+    if users is None:
+        users = stored_user_ids(backend)
+        # Users merged away or deleted since the last export
+        for user_id in sorted(set(known) - set(users)):
+            remove_partitions(out_dir, user_id)
+            del known[user_id]
+            yield user_id, "removed", []
+
+    for user_id in users:
+        storage = get_storage(user_id, backend)
+        entry = None if full else known.get(user_id)
+        known[user_id], months = export_user(storage, out_dir, entry, batch_rows)
+        if months is None:
+            yield user_id, "unchanged", []
+            continue
+        # Saved per user, so an interrupted run keeps what it finished
+        save_snapshot(out_dir, snapshot)
+        yield user_id, "exported", months
+
+    save_snapshot(out_dir, snapshot)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export invoices as partitioned Parquet")
+    parser.add_argument("--out", default=EXPORT_DIR, help=f"dataset directory (default: {EXPORT_DIR})")
+    parser.add_argument("--backend", default=configured_backend(), choices=["sqlite", "json"])
+    parser.add_argument("--user", action="append", help="only this workshop id (repeatable)")
+    parser.add_argument("--full", action="store_true", help="rewrite everything, ignoring the last snapshot")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS, help="rows per Parquet row group")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    changed = unchanged = 0
+    for user_id, status, months in export(args.out, args.backend, args.user, args.full, args.batch_rows):
+        if status == "removed":
+            print(f"{user_id}: removed")
+        elif status == "unchanged" or not months:
+            unchanged += 1
+        else:
+            changed += 1
+            print(f"{user_id}: {len(months)} months rewritten ({months[0]} .. {months[-1]})")
+
+    snapshot = load_snapshot(args.out)
+    print(f"{changed} users exported, {unchanged} unchanged, {snapshot.get('invoices', 0):,} invoices "
+          f"in {args.out} ({time.perf_counter() - started:.2f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+
+from autoinvoice.metrics import capture_timings, record_samples, observe, count
+from autoinvoice.pdf import warm_up
+from autoinvoice.pdfcache import render_cached
+
+# ========================
+# BACKGROUND PDF RENDERING
+# ========================
+#
+# PDFs are rendered in a process pool shared by every session in the
+# server, so slow renders neither block the Streamlit script thread nor
+# fight it for the GIL. At most PDF_QUEUE_SIZE jobs may be queued or
+# running at once; beyond that reserve() raises RenderQueueFull and the
+# caller should ask the user to retry.
+#
+# PDF_WORKERS = 0 renders inline in the calling thread (handy for
+# debugging and single-user installs).
+
+PDF_WORKERS = int(os.environ.get("AUTOINVOICE_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_QUEUE_SIZE = int(os.environ.get("AUTOINVOICE_PDF_QUEUE", "32"))
+FINISHED_JOBS_KEPT = 1000
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+@contextmanager
+def hidden_main_module():
+    """
+    Start spawn workers without re-running the main script in them.
+
+    Streamlit installs app.py as sys.modules['__main__'], and spawn would
+    import it (and so run the whole app) in every worker process.
+    """
+    main_module = sys.modules.get("__main__")
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main_module
+
+
+class RenderQueueFull(Exception):
+    """Raised when the render queue has no free slot"""
+
+
+def render_with_timings(invoice_data, profile, filepath=None):
+    """Worker entry point: the PDF bytes plus the timings and counts measured"""
+    with capture_timings() as samples:
+        pdf_bytes = render_cached(invoice_data, profile, filepath)
+    return pdf_bytes, samples
+
+
+class PdfRenderPool:
+    """Bounded job queue in front of a process pool"""
+
+    def __init__(self, workers=PDF_WORKERS, max_pending=PDF_QUEUE_SIZE):
+        self.workers = workers
+        self.max_pending = max(1, max_pending)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._jobs = OrderedDict()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: never fork a threaded server process. Every worker is
+                # started up front so none is spawned later outside the guard,
+                # and loads fpdf before the first real job arrives.
+                with hidden_main_module():
+                    executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                    for _ in range(self.workers):
+                        executor.submit(warm_up)
+                self._executor = executor
+        return self._executor
+
+    def start(self):
+        """Start the worker processes now instead of on the first render"""
+        if self.workers > 0:
+            self._get_executor()
+
+    def reserve(self):
+        """
+        Claim a queue slot and return a job id for submit().
+        Raises RenderQueueFull if the queue is at capacity.
+        """
+        if not self._slots.acquire(blocking=False):
+            count("render_queue_full")
+            raise RenderQueueFull(f"{self.max_pending} PDF renders already queued")
+
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {"state": PENDING, "future": None, "result": None, "error": None,
+                                  "user": None, "timed": False, "submitted": None, "on_done": None}
+        return job_id
+
+    def release(self, job_id):
+        """
+        Give back a reserved slot that will not be submitted, or drop a
+        submitted job whose result is no longer wanted
+        """
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        # Running jobs give their slot back when they finish
+        if job is not None and job["future"] is None and job["state"] == PENDING:
+            self._slots.release()
+
+    def submit(self, job_id, fn, *args):
+        """Run fn(*args) for a reserved job"""
+        job = self._jobs[job_id]
+        job["submitted"] = time.perf_counter()
+
+        if self.workers <= 0:
+            try:
+                self._complete(job, fn(*args))
+            except Exception as e:
+                self._fail(job, e)
+            finally:
+                self._slots.release()
+                self._prune()
+                self._notify(job)
+            return job_id
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self.release(job_id)
+            self._notify(job)
+            raise
+
+        job["future"] = future
+        future.add_done_callback(lambda f: self._finish(job, f))
+        return job_id
+
+    def _finish(self, job, future):
+        # The job may have been released meanwhile; finishing it is harmless
+        try:
+            error = future.exception()
+            if error is None:
+                self._complete(job, future.result())
+            else:
+                self._fail(job, error)
+        finally:
+            self._slots.release()
+            self._prune()
+            self._notify(job)
+
+    def _notify(self, job):
+        on_done = job["on_done"]
+        if on_done is not None:
+            try:
+                on_done(job["state"] == DONE)
+            except Exception as e:
+                print(f"Error in PDF job callback: {e}")
+
+    def _complete(self, job, result):
+        if job["timed"]:
+            result, samples = result
+            record_samples(samples, job["user"])
+            observe("pdf_job", time.perf_counter() - job["submitted"], job["user"])
+        job["result"] = result
+        job["state"] = DONE
+
+    def _fail(self, job, error):
+        job["error"] = str(error)
+        job["state"] = FAILED
+        count("pdf_render_failed", job["user"])
+
+    def _prune(self):
+        with self._lock:
+            finished = [k for k, j in self._jobs.items() if j["state"] != PENDING]
+            for job_id in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+                del self._jobs[job_id]
+
+    def status(self, job_id):
+        """State of a job: pending, done or failed (None if unknown)"""
+        job = self._jobs.get(job_id)
+        return job["state"] if job else None
+
+    def result(self, job_id):
+        job = self._jobs.get(job_id)
+        return job["result"] if job else None
+
+    def error(self, job_id):
+        job = self._jobs.get(job_id)
+        return job["error"] if job else None
+
+    def submit_render(self, job_id, invoice_data, profile, filepath=None, on_done=None):
+        """
+        Render an invoice PDF in the pool; the job result is the PDF bytes.
+        The worker also archives it to filepath when one is given.
+        on_done(ok) is called once the job has finished, or failed to start.
+        """
+        job = self._jobs[job_id]
+        job["user"] = invoice_data.get("user_id")
+        job["timed"] = True
+        job["on_done"] = on_done
+        return self.submit(job_id, render_with_timings, invoice_data, dict(profile), filepath)
+
+    def render(self, invoice_data, profile, filepath=None):
+        """
+        Render an invoice PDF outside the job table and return a
+        concurrent.futures.Future of the bytes (for async callers).
+        The worker also archives it to filepath when one is given.
+        Raises RenderQueueFull like reserve().
+        """
+        if not self._slots.acquire(blocking=False):
+            count("render_queue_full")
+            raise RenderQueueFull(f"{self.max_pending} PDF renders already queued")
+
+        user = invoice_data.get("user_id")
+        submitted = time.perf_counter()
+
+        def done(result):
+            pdf_bytes, samples = result
+            record_samples(samples, user)
+            observe("pdf_job", time.perf_counter() - submitted, user)
+            return pdf_bytes
+
+        result = Future()
+        if self.workers <= 0:
+            try:
+                result.set_result(done(render_with_timings(invoice_data, profile, filepath)))
+            except Exception as e:
+                count("pdf_render_failed", user)
+                result.set_exception(e)
+            finally:
+                self._slots.release()
+            return result
+
+        def finish(future):
+            try:
+                error = future.exception()
+                if error is None:
+                    result.set_result(done(future.result()))
+                else:
+                    count("pdf_render_failed", user)
+                    result.set_exception(error)
+            finally:
+                self._slots.release()
+
+        try:
+            future = self._get_executor().submit(render_with_timings, invoice_data, dict(profile), filepath)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(finish)
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """Process-wide PDF render pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PdfRenderPool()
+    return _pool
@@ -0,0 +1,311 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ========================
+# PIPELINE METRICS
+# ========================
+#
+# Timers and counters for the invoice pipeline, labelled by phase and user:
+#
+#     with timed("save_invoice", user_id):
+#         storage.save_invoice(...)
+#     count("invoice_generated", user_id)
+#
+# Each (phase, user) series keeps its count and total time plus the last
+# SAMPLES_KEPT durations, from which p50/p95/p99 are computed on demand.
+# Recording is a perf_counter call and a deque append under a lock, so it
+# stays on in production; AUTOINVOICE_METRICS=0 turns every call into a
+# no-op.
+#
+# Output, all optional:
+#     render_prometheus()        Prometheus text format
+#     AUTOINVOICE_METRICS_PORT   serves it over HTTP at /metrics
+#     AUTOINVOICE_METRICS_FILE   appends one JSON line per sample
+#     AUTOINVOICE_METRICS_ADMIN  shows a per-phase table in the app sidebar
+#
+# Phases timed and events counted inside PDF worker processes are collected
+# with capture_timings() and recorded by the parent when the job finishes.
+
+ENABLED = os.environ.get("AUTOINVOICE_METRICS", "1") != "0"
+METRICS_FILE = os.environ.get("AUTOINVOICE_METRICS_FILE", "")
+METRICS_PORT = int(os.environ.get("AUTOINVOICE_METRICS_PORT", "0"))
+ADMIN_PANEL = ENABLED and os.environ.get("AUTOINVOICE_METRICS_ADMIN", "0") == "1"
+SAMPLES_KEPT = 1024
+MAX_SERIES = 2000
+FILE_FLUSH_LINES = 256
+FILE_FLUSH_SECONDS = 5.0
+
+QUANTILES = (0.5, 0.95, 0.99)
+NO_USER = "-"
+
+
+class Series:
+    """Count, total and recent samples of one timer"""
+
+    __slots__ = ("count", "total", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=SAMPLES_KEPT)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+
+    def quantiles(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        last = len(ordered) - 1
+        return {q: ordered[min(last, int(q * len(ordered)))] for q in QUANTILES}
+
+
+class MetricsRegistry:
+    """Process-wide timers and counters"""
+
+    def __init__(self, max_series=MAX_SERIES, log_path=METRICS_FILE):
+        self.max_series = max_series
+        self._timers = OrderedDict()
+        self._counters = OrderedDict()
+        self._lock = threading.Lock()
+        self._log_path = log_path
+        self._log_lines = []
+        self._log_flushed = time.monotonic()
+
+    def _bounded(self, table, key, factory):
+        # Least recently updated series are dropped first
+        item = table.get(key)
+        if item is None:
+            item = table[key] = factory()
+            if len(table) > self.max_series:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return item
+
+    def observe(self, phase, seconds, user=None):
+        key = (phase, user or NO_USER)
+        with self._lock:
+            self._bounded(self._timers, key, Series).add(seconds)
+            if self._log_path:
+                self._log(phase, key[1], seconds)
+
+    def incr(self, event, user=None, amount=1):
+        key = (event, user or NO_USER)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._counters.move_to_end(key)
+            if len(self._counters) > self.max_series:
+                self._counters.popitem(last=False)
+
+    def _log(self, phase, user, seconds):
+        self._log_lines.append(json.dumps(
+            {"ts": round(time.time(), 3), "phase": phase, "user": user, "ms": round(seconds * 1000, 3)},
+            separators=(",", ":"),
+        ) + "\n")
+        now = time.monotonic()
+        if len(self._log_lines) >= FILE_FLUSH_LINES or now - self._log_flushed >= FILE_FLUSH_SECONDS:
+            self._flush_log(now)
+
+    def _flush_log(self, now=None):
+        lines, self._log_lines = self._log_lines, []
+        self._log_flushed = now or time.monotonic()
+        if lines:
+            try:
+                with open(self._log_path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+            except OSError as e:
+                print(f"Error writing metrics file {self._log_path}: {e}")
+
+    def flush(self):
+        with self._lock:
+            if self._log_path:
+                self._flush_log()
+
+    def snapshot(self):
+        """One row per (phase, user) timer with count, mean and quantiles in ms"""
+        with self._lock:
+            series = [(key, s.count, s.total, s.quantiles()) for key, s in self._timers.items()]
+        rows = []
+        for (phase, user), n, total, q in sorted(series):
+            rows.append({
+                "phase": phase,
+                "user": user,
+                "count": n,
+                "mean_ms": total / n * 1000 if n else 0.0,
+                "p50_ms": q[0.5] * 1000,
+                "p95_ms": q[0.95] * 1000,
+                "p99_ms": q[0.99] * 1000,
+            })
+        return rows
+
+    def counters(self):
+        with self._lock:
+            return [{"event": e, "user": u, "count": n} for (e, u), n in sorted(self._counters.items())]
+
+    def render_prometheus(self):
+        """Timers as a summary and counters, in Prometheus text format"""
+        lines = [
+            "# HELP autoinvoice_phase_seconds Time spent in each invoice pipeline phase",
+            "# TYPE autoinvoice_phase_seconds summary",
+        ]
+        for row in self.snapshot():
+            labels = f'phase="{row["phase"]}",user="{row["user"]}"'
+            for q in QUANTILES:
+                value = row[f"p{int(q * 100)}_ms"] / 1000
+                lines.append(f'autoinvoice_phase_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+            lines.append(f"autoinvoice_phase_seconds_sum{{{labels}}} "
+                         f"{row['mean_ms'] * row['count'] / 1000:.6f}")
+            lines.append(f"autoinvoice_phase_seconds_count{{{labels}}} {row['count']}")
+
+        lines.append("# HELP autoinvoice_events_total Invoice pipeline events")
+        lines.append("# TYPE autoinvoice_events_total counter")
+        for row in self.counters():
+            lines.append(f'autoinvoice_events_total{{event="{row["event"]}",user="{row["user"]}"}} '
+                         f'{row["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+_capture = threading.local()
+
+if METRICS_FILE:
+    atexit.register(_registry.flush)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("phase", "user", "started")
+
+    def __init__(self, phase, user):
+        self.phase = phase
+        self.user = user
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.phase, time.perf_counter() - self.started, self.user)
+        return False
+
+
+def timed(phase, user=None):
+    """Context manager timing one phase (no-op when metrics are disabled)"""
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(phase, user)
+
+
+def observe(phase, seconds, user=None):
+    """Record one duration; goes to the active capture_timings() list if any"""
+    if not ENABLED:
+        return
+    captured = getattr(_capture, "samples", None)
+    if captured is not None:
+        captured.append((phase, seconds))
+    else:
+        _registry.observe(phase, seconds, user)
+
+
+def count(event, user=None, amount=1):
+    """Increment an event counter; goes to the active capture_timings() list if any"""
+    if not ENABLED:
+        return
+    captured = getattr(_capture, "samples", None)
+    if captured is not None:
+        captured.append((event, user, amount))
+    else:
+        _registry.incr(event, user, amount)
+
+
+@contextmanager
+def capture_timings():
+    """
+    Collect (phase, seconds) timings and (event, user, amount) counts of
+    this thread instead of recording them, e.g. in a worker process that
+    returns them to the parent.
+    """
+    samples = []
+    previous = getattr(_capture, "samples", None)
+    _capture.samples = samples
+    try:
+        yield samples
+    finally:
+        _capture.samples = previous
+
+
+def record_samples(samples, user=None):
+    """Record samples returned by capture_timings(); timings are labelled with `user`"""
+    for sample in samples:
+        if len(sample) == 3:
+            count(*sample)
+        else:
+            observe(sample[0], sample[1], user)
+
+
+def render_prometheus():
+    return _registry.render_prometheus()
+
+
+def snapshot():
+    return _registry.snapshot()
+
+
+# ========================
+# HTTP ENDPOINT
+# ========================
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT, host="0.0.0.0"):
+    """Serve /metrics on a background thread once per process (port 0 = off)"""
+    global _server
+    if not ENABLED or not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                print(f"Error starting metrics endpoint on port {port}: {e}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
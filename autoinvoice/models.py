@@ -0,0 +1,252 @@
+import datetime
+import operator
+from dataclasses import dataclass, field
+from decimal import Decimal, ROUND_HALF_UP
+
+# ========================
+# INVOICE MODEL
+# ========================
+#
+# Typed view of the invoice records the app stores and renders. Money is
+# held as integer paisa (1 rupee = 100 paisa), so totals are exact sums of
+# integers and grand_total never drifts the way summed floats do. Rupee
+# values are only produced at the edges, by to_dict().
+#
+# Totals are derived from the line items, so an Invoice can never disagree
+# with its own items. to_dict() produces the full record format the PDF
+# renderer and the statistics read; to_compact() is the short-key form
+# written to storage:
+#
+#     {"f": 2, "n": "INV-1000", "c": customer, "v": vehicle, "d": date,
+#      "i": [[desc, qty, price_paisa], ...], "l": labor_paisa,
+#      "x": discount_paisa, "u": user_id, "w": workshop_name,
+#      "ph": workshop_phone, "ad": workshop_address}
+#
+# The workshop phone and address are a snapshot of the profile the invoice
+# was issued under, so its PDF can be rendered again later exactly as it
+# was printed. Records from before the snapshot have neither key.
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+RECORD_FORMAT = 2
+
+_CENT = Decimal("0.01")
+
+
+def to_paisa(amount):
+    """Rupee amount (int, float or str) as integer paisa, rounded half up"""
+    if isinstance(amount, int):
+        return amount * 100
+    rupees = Decimal(str(amount)).quantize(_CENT, rounding=ROUND_HALF_UP)
+    return int(rupees * 100)
+
+
+def from_paisa(paisa):
+    """Integer paisa as a float rupee amount"""
+    return paisa / 100
+
+
+def rupees(paisa):
+    """Integer paisa as whole rupees (int) when possible, else float"""
+    return paisa // 100 if paisa % 100 == 0 else paisa / 100
+
+
+# Item totals are summed with a single map/sum over Python ints rather than
+# a numpy dot product: the ints cannot overflow, and converting the lists
+# to arrays costs more than the sum itself (about 0.8 us against 3.3 us
+# for 10 items, 475 us against 545 us for 10,000).
+
+def sum_products(qtys, prices):
+    """Exact sum of qty * price over two integer sequences"""
+    return sum(map(operator.mul, qtys, prices))
+
+
+@dataclass
+class LineItem:
+    """One repair item or service on an invoice"""
+
+    __slots__ = ("desc", "qty", "price_paisa")
+
+    desc: str
+    qty: int
+    price_paisa: int
+
+    @classmethod
+    def from_rupees(cls, desc, qty, price):
+        return cls(desc, int(qty), to_paisa(price))
+
+    @property
+    def price(self):
+        return from_paisa(self.price_paisa)
+
+    @property
+    def total_paisa(self):
+        return self.qty * self.price_paisa
+
+    @property
+    def total(self):
+        return from_paisa(self.total_paisa)
+
+    def __getitem__(self, key):
+        # Read access like the item dicts (item['desc'], item['total'])
+        if key not in ("desc", "qty", "price", "total"):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def to_dict(self):
+        return {
+            'desc': self.desc,
+            'qty': self.qty,
+            'price': self.price,
+            'total': self.total
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls.from_rupees(data['desc'], data.get('qty', 1), data.get('price', 0))
+
+    @classmethod
+    def coerce(cls, item):
+        """LineItem from a LineItem or an item dict"""
+        return item if isinstance(item, cls) else cls.from_dict(item)
+
+
+def items_subtotal_paisa(items):
+    """Exact subtotal of a list of LineItems in paisa"""
+    return sum_products([i.qty for i in items], [i.price_paisa for i in items])
+
+
+@dataclass
+class Invoice:
+    """A customer invoice with its line items and charges"""
+
+    invoice_number: str
+    customer_name: str
+    car_details: str
+    items: list = field(default_factory=list)
+    labor: float = 0
+    discount: float = 0
+    date: datetime.datetime = field(default_factory=datetime.datetime.now)
+    user_id: str = ""
+    workshop_name: str = ""
+    workshop_phone: str = None
+    workshop_address: str = None
+
+    @property
+    def subtotal_paisa(self):
+        return items_subtotal_paisa(self.items)
+
+    @property
+    def grand_total_paisa(self):
+        return self.subtotal_paisa + to_paisa(self.labor) - to_paisa(self.discount)
+
+    @property
+    def subtotal(self):
+        return from_paisa(self.subtotal_paisa)
+
+    @property
+    def grand_total(self):
+        return from_paisa(self.grand_total_paisa)
+
+    def to_dict(self):
+        """Full record as rendered to PDF and read by the statistics"""
+        subtotal = self.subtotal_paisa
+        record = {
+            'invoice_number': self.invoice_number,
+            'customer_name': self.customer_name,
+            'car_details': self.car_details,
+            'date': self.date.strftime(DATE_FORMAT),
+            'items': [item.to_dict() for item in self.items],
+            'subtotal': from_paisa(subtotal),
+            'labor': self.labor,
+            'discount': self.discount,
+            'grand_total': from_paisa(subtotal + to_paisa(self.labor) - to_paisa(self.discount)),
+            'user_id': self.user_id,
+            'workshop_name': self.workshop_name
+        }
+        if self.workshop_phone is not None:
+            record['workshop_phone'] = self.workshop_phone
+        if self.workshop_address is not None:
+            record['workshop_address'] = self.workshop_address
+        return record
+
+    @classmethod
+    def from_dict(cls, data):
+        """Invoice from a full record"""
+        try:
+            date = datetime.datetime.strptime(data['date'], DATE_FORMAT)
+        except (KeyError, ValueError):
+            date = datetime.datetime.now()
+
+        return cls(
+            invoice_number=data.get('invoice_number', ''),
+            customer_name=data.get('customer_name', ''),
+            car_details=data.get('car_details', ''),
+            items=[LineItem.from_dict(item) for item in data.get('items', [])],
+            labor=data.get('labor', 0),
+            discount=data.get('discount', 0),
+            date=date,
+            user_id=data.get('user_id', ''),
+            workshop_name=data.get('workshop_name', ''),
+            workshop_phone=data.get('workshop_phone'),
+            workshop_address=data.get('workshop_address')
+        )
+
+    def to_compact(self):
+        """Short-key storage form with money in paisa"""
+        data = {
+            "f": RECORD_FORMAT,
+            "n": self.invoice_number,
+            "c": self.customer_name,
+            "v": self.car_details,
+            "d": self.date.strftime(DATE_FORMAT),
+            "i": [[item.desc, item.qty, item.price_paisa] for item in self.items],
+            "l": to_paisa(self.labor),
+            "x": to_paisa(self.discount),
+            "u": self.user_id,
+            "w": self.workshop_name,
+        }
+        if self.workshop_phone is not None:
+            data["ph"] = self.workshop_phone
+        if self.workshop_address is not None:
+            data["ad"] = self.workshop_address
+        return data
+
+    @classmethod
+    def from_compact(cls, data):
+        return cls(
+            invoice_number=data["n"],
+            customer_name=data["c"],
+            car_details=data["v"],
+            items=[LineItem(desc, qty, price) for desc, qty, price in data["i"]],
+            labor=rupees(data["l"]),
+            discount=rupees(data["x"]),
+            date=datetime.datetime.strptime(data["d"], DATE_FORMAT),
+            user_id=data["u"],
+            workshop_name=data["w"],
+            workshop_phone=data.get("ph"),
+            workshop_address=data.get("ad"),
+        )
+
+
+def pack_record(record):
+    """
+    Compact storage form of a full invoice record.
+    Records that would not round-trip exactly (legacy or hand-edited
+    ones) are returned unchanged and stored as they are.
+    """
+    if record.get("f") == RECORD_FORMAT:
+        return record
+    try:
+        invoice = Invoice.from_dict(record)
+    except (KeyError, TypeError, ValueError, ArithmeticError):
+        return record
+    if invoice.to_dict() != record:
+        return record
+    return invoice.to_compact()
+
+
+def unpack_record(data):
+    """Full invoice record from either stored form"""
+    if data.get("f") == RECORD_FORMAT:
+        return Invoice.from_compact(data).to_dict()
+    return data
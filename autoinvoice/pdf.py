@@ -0,0 +1,325 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from autoinvoice.metrics import timed
+
+# ========================
+# INVOICE PDF TEMPLATE
+# ========================
+#
+# The header, the items table header row and the footer only depend on the
+# workshop profile, so an InvoiceTemplate resolves them once into a list of
+# ready-to-play drawing operations (fonts, cell sizes, alignment enums and
+# text). Rendering an invoice then only lays out the variable parts:
+# invoice number/date, customer, vehicle, items and totals.
+#
+# Templates are cached by a hash of the profile fields they print, so a
+# profile change automatically yields a new template - also inside PDF
+# worker processes, which never see save_user_profile().
+#
+# fpdf pulls in numpy, Pillow and fontTools (about 0.4 s), so it is only
+# imported by load_fpdf() when the first template is built. warm_up() does
+# that ahead of time, off the request path.
+
+DEFAULT_PHONE = '+92-300-1234567'
+FONT = "helvetica"  # what FPDF substitutes for "Arial"
+TEMPLATE_CACHE_SIZE = 64
+
+# Part of every cached PDF's key (see autoinvoice.pdfcache). Bump it when
+# the printed layout changes so PDFs cached under the old one are ignored.
+LAYOUT_VERSION = 1
+
+# Also keep a permanent copy of every rendered PDF under
+# invoices/users/<shard>/<id>/. Off by default: a PDF is derived from its
+# stored record and can be rendered again at any time (autoinvoice.pdfcache).
+ARCHIVE_PDFS = os.environ.get("AUTOINVOICE_ARCHIVE_PDFS", "0") != "0"
+
+TEMPLATE_PROFILE_FIELDS = ('workshop_name', 'phone_number', 'address')
+
+# Set by load_fpdf()
+FPDF = None
+Align = None
+_SAME_LINE = None
+_NEXT_LINE = None
+_ALIGN = None
+_fpdf_lock = threading.Lock()
+
+
+def load_fpdf():
+    """Import fpdf on first use and resolve the enums the layout needs"""
+    global FPDF, Align, _SAME_LINE, _NEXT_LINE, _ALIGN
+    if FPDF is not None:
+        return
+    with _fpdf_lock:
+        if FPDF is not None:
+            return
+        from fpdf import FPDF as fpdf_class
+        from fpdf.enums import Align, XPos, YPos
+
+        # Cell position after drawing: stay on the line, or move to the next one
+        _SAME_LINE = {"new_x": XPos.RIGHT, "new_y": YPos.TOP}
+        _NEXT_LINE = {"new_x": XPos.LMARGIN, "new_y": YPos.NEXT}
+        _ALIGN = {'L': Align.L, 'C': Align.C, 'R': Align.R}
+        # Last, so other threads only see a fully loaded module
+        FPDF = fpdf_class
+
+
+def _font(style, size):
+    return ("font", style, size)
+
+
+def _cell(w, h, text, border=0, newline=True, align='L'):
+    kwargs = dict(_NEXT_LINE if newline else _SAME_LINE)
+    kwargs.update(border=border, align=_ALIGN[align])
+    return ("cell", (w, h, text), kwargs)
+
+
+def _ln(h):
+    return ("ln", h)
+
+
+def play(pdf, ops):
+    """Draw a list of prepared operations onto a page"""
+    for op in ops:
+        kind = op[0]
+        if kind == "cell":
+            pdf.cell(*op[1], **op[2])
+        elif kind == "font":
+            pdf.set_font(FONT, op[1], op[2])
+        else:
+            pdf.ln(op[1])
+
+
+def invoice_datetime(invoice_data):
+    """Date and time the invoice was issued"""
+    try:
+        return datetime.datetime.strptime(invoice_data['date'], "%Y-%m-%d %H:%M:%S")
+    except (KeyError, ValueError):
+        return datetime.datetime.now()
+
+
+def invoice_display_date(invoice_data):
+    """dd/mm/YYYY date printed on the invoice"""
+    return invoice_datetime(invoice_data).strftime('%d/%m/%Y')
+
+
+def truncate_description(desc):
+    """Fit an item description in the 100mm table column"""
+    return desc[:37] + "..." if len(desc) > 40 else desc
+
+
+class InvoiceTemplate:
+    """Invoice layout with the profile-dependent static parts precomputed"""
+
+    def __init__(self, profile):
+        load_fpdf()
+        workshop_name = profile['workshop_name']
+
+        self.header = (
+            _font('B', 20),
+            _cell(0, 15, workshop_name, align='C'),
+            _font('', 12),
+            _cell(0, 8, "Professional Auto Repair Services", align='C'),
+            _ln(10),
+            _font('B', 14),
+            _cell(0, 10, "INVOICE"),
+            _font('', 11),
+        )
+
+        self.customer_heading = (
+            _ln(5),
+            _font('B', 12),
+            _cell(0, 10, "Customer Details"),
+            _font('', 11),
+        )
+
+        self.table_header = (
+            _ln(10),
+            _font('B', 11),
+            _cell(100, 10, "Description", 1, False, 'C'),
+            _cell(25, 10, "Qty", 1, False, 'C'),
+            _cell(30, 10, "Price (Rs)", 1, False, 'C'),
+            _cell(35, 10, "Total (Rs)", 1, True, 'C'),
+            _font('', 10),
+        )
+
+        footer = [
+            _ln(15),
+            _font('I', 9),
+            _cell(0, 6, "Thank you for your business!", align='C'),
+        ]
+        if profile['phone_number'] and profile['phone_number'] != DEFAULT_PHONE:
+            footer.append(_cell(0, 6, f"Phone: {profile['phone_number']}", align='C'))
+        footer.append(_cell(0, 6, workshop_name, align='C'))
+        if profile['address']:
+            footer.append(_font('', 8))
+            footer.append(_cell(0, 6, f"Address: {profile['address']}", align='C'))
+        self.footer = tuple(footer)
+
+    def render(self, invoice_data):
+        """Lay out one invoice and return the FPDF document"""
+        pdf = FPDF()
+        # The only varying metadata; pinned so equal inputs give equal bytes
+        pdf.set_creation_date(invoice_datetime(invoice_data))
+        pdf.add_page()
+        cell = pdf.cell
+
+        play(pdf, self.header)
+        cell(0, 7, f"Invoice #: {invoice_data['invoice_number']}", **_NEXT_LINE)
+        cell(0, 7, f"Date: {invoice_display_date(invoice_data)}", **_NEXT_LINE)
+
+        play(pdf, self.customer_heading)
+        cell(0, 7, f"Name: {invoice_data['customer_name']}", **_NEXT_LINE)
+        cell(0, 7, f"Vehicle: {invoice_data['car_details']}", **_NEXT_LINE)
+
+        # Items table
+        play(pdf, self.table_header)
+        for item in invoice_data['items']:
+            cell(100, 8, truncate_description(item['desc']), border=1, align=Align.L, **_SAME_LINE)
+            cell(25, 8, str(item['qty']), border=1, align=Align.C, **_SAME_LINE)
+            cell(30, 8, f"{item['price']:,}", border=1, align=Align.R, **_SAME_LINE)
+            cell(35, 8, f"{item['total']:,}", border=1, align=Align.R, **_NEXT_LINE)
+
+        pdf.ln(10)
+
+        # Summary
+        pdf.set_font(FONT, '', 11)
+        cell(140, 8, "Subtotal:", align=Align.R, **_SAME_LINE)
+        cell(50, 8, f"Rs {invoice_data['subtotal']:,}", align=Align.R, **_NEXT_LINE)
+
+        if invoice_data['labor'] > 0:
+            cell(140, 8, "Labor Charges:", align=Align.R, **_SAME_LINE)
+            cell(50, 8, f"Rs {invoice_data['labor']:,}", align=Align.R, **_NEXT_LINE)
+
+        if invoice_data['discount'] > 0:
+            cell(140, 8, "Discount:", align=Align.R, **_SAME_LINE)
+            cell(50, 8, f"- Rs {invoice_data['discount']:,}", align=Align.R, **_NEXT_LINE)
+
+        pdf.set_font(FONT, 'B', 13)
+        cell(140, 12, "GRAND TOTAL:", align=Align.R, **_SAME_LINE)
+        cell(50, 12, f"Rs {invoice_data['grand_total']:,}", align=Align.R, **_NEXT_LINE)
+
+        play(pdf, self.footer)
+        return pdf
+
+
+# ========================
+# TEMPLATE CACHE
+# ========================
+
+_templates = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+def template_key(profile):
+    """Hash of the profile fields that appear on the invoice"""
+    fields = [profile.get(name) for name in TEMPLATE_PROFILE_FIELDS]
+    return hashlib.sha1(json.dumps(fields).encode("utf-8")).hexdigest()
+
+
+def get_invoice_template(profile):
+    """Cached InvoiceTemplate for a workshop profile (LRU)"""
+    key = template_key(profile)
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is not None:
+            _templates.move_to_end(key)
+            return template
+
+    template = InvoiceTemplate(profile)
+    with _templates_lock:
+        _templates[key] = template
+        while len(_templates) > TEMPLATE_CACHE_SIZE:
+            _templates.popitem(last=False)
+    return template
+
+
+def invalidate_invoice_templates(profile=None):
+    """Drop the cached template for a profile, or every template"""
+    with _templates_lock:
+        if profile is None:
+            _templates.clear()
+        else:
+            _templates.pop(template_key(profile), None)
+
+
+def build_invoice_pdf(invoice_data, profile):
+    """Lay out an invoice and return the FPDF document"""
+    return get_invoice_template(profile).render(invoice_data)
+
+
+def render_invoice_bytes(invoice_data, profile):
+    """Render an invoice to PDF bytes in memory"""
+    with timed("pdf_build"):
+        pdf = build_invoice_pdf(invoice_data, profile)
+    with timed("pdf_output"):
+        return bytes(pdf.output())
+
+
+# Sample invoice rendered by warm_up()
+WARMUP_INVOICE = {
+    'invoice_number': "INV-0000",
+    'customer_name': "Warm-up",
+    'car_details': "-",
+    'date': "2000-01-01 00:00:00",
+    'items': [{'desc': "Warm-up item", 'qty': 1, 'price': 1000, 'total': 1000}],
+    'subtotal': 1000,
+    'labor': 1500,
+    'discount': 100,
+    'grand_total': 2400,
+}
+
+
+def warm_up(profile=None):
+    """
+    Import fpdf, cache the template of a profile (the default one if none
+    is given) and lay out one throwaway invoice, so the first real render
+    of the process pays for none of it.
+    """
+    if profile is None:
+        from autoinvoice.engine import DEFAULT_PROFILE
+        profile = DEFAULT_PROFILE
+    get_invoice_template(profile).render(WARMUP_INVOICE).output()
+
+
+def sync_dir(path):
+    """fsync a directory so a rename into it survives a crash (POSIX only)"""
+    if os.name != "posix":
+        return
+    fd = os.open(path or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_pdf(pdf_bytes, filepath, sync=False):
+    """
+    Atomically write rendered PDF bytes to disk.
+    With sync the file and its directory entry are fsync'd before returning.
+    """
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pdf_bytes)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, filepath)
+    if sync:
+        sync_dir(os.path.dirname(filepath))
+    return filepath
+
+
+def render_invoice_pdf(invoice_data, profile, filepath=None):
+    """
+    Render an invoice once and return the PDF bytes.
+    The same buffer is archived (durably) to filepath when one is given.
+    """
+    pdf_bytes = render_invoice_bytes(invoice_data, profile)
+    if filepath:
+        write_pdf(pdf_bytes, filepath, sync=True)
+    return pdf_bytes
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import threading
+
+from autoinvoice.metrics import count
+from autoinvoice.pdf import LAYOUT_VERSION, TEMPLATE_PROFILE_FIELDS, render_invoice_pdf, write_pdf
+
+# ========================
+# PDF CACHE
+# ========================
+#
+# A PDF is a derived artifact: rendering is deterministic, so the stored
+# invoice record plus the workshop details printed on it always give the
+# same bytes. Recently rendered PDFs are kept in a disk cache
+#
+#     data/pdf_cache/<2 hex>/<sha256>.pdf
+#
+# named by a hash of everything that goes into them: the record, the
+# profile fields on the page and the layout version. An edited record, a
+# changed profile or a new layout therefore hashes to a different name and
+# is rendered afresh; the stale file is never served and simply ages out.
+#
+# The cache is bounded by AUTOINVOICE_PDF_CACHE_MB (0 disables it). A hit
+# touches the file's mtime, and when a write takes the cache over its bound
+# the least recently used files are deleted down to 90% of it. Every
+# process (app and PDF workers) shares the directory; each keeps its own
+# running size estimate and rescans the directory before evicting.
+
+PDF_CACHE_DIR = os.environ.get("AUTOINVOICE_PDF_CACHE_DIR", "data/pdf_cache")
+PDF_CACHE_MB = float(os.environ.get("AUTOINVOICE_PDF_CACHE_MB", "256"))
+EVICT_TO = 0.9
+
+
+def render_profile(invoice_data, profile):
+    """
+    Profile to render a stored invoice with: the workshop details saved in
+    the record when it has them, else the given (current) profile
+    """
+    if invoice_data.get('workshop_phone') is None:
+        return profile
+    return {
+        **profile,
+        'workshop_name': invoice_data.get('workshop_name') or profile.get('workshop_name'),
+        'phone_number': invoice_data['workshop_phone'],
+        'address': invoice_data.get('workshop_address', ''),
+    }
+
+
+def render_key(invoice_data, profile):
+    """Content hash naming the PDF of a record rendered with a profile"""
+    fields = {name: profile.get(name) for name in TEMPLATE_PROFILE_FIELDS}
+    payload = json.dumps([LAYOUT_VERSION, fields, invoice_data], sort_keys=True,
+                         separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PdfCache:
+    """Size-bounded LRU directory of rendered PDFs keyed by content hash"""
+
+    def __init__(self, directory=PDF_CACHE_DIR, max_bytes=int(PDF_CACHE_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._used = None
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".pdf")
+
+    def get(self, key):
+        """Cached PDF bytes, or None on a miss"""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                pdf_bytes = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # Evicted by another process in the meantime
+            pass
+        return pdf_bytes
+
+    def put(self, key, pdf_bytes):
+        """Store PDF bytes, evicting old entries when over the bound"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_pdf(pdf_bytes, path)
+        with self._lock:
+            if self._used is None:
+                self._used = sum(size for _, size, _ in self._entries())
+            else:
+                self._used += len(pdf_bytes)
+            if self._used > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        """(mtime, size, path) of every cached PDF"""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".pdf"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        used = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TO
+        for _, size, path in entries:
+            if used <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            used -= size
+        self._used = used
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_pdf_cache():
+    """Process-wide PdfCache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PdfCache()
+        return _cache
+
+
+def cached_pdf(invoice_data, profile):
+    """PDF bytes of a record from the cache only; None on a miss"""
+    cache = get_pdf_cache()
+    if not cache.enabled:
+        return None
+    pdf_bytes = cache.get(render_key(invoice_data, profile))
+    if pdf_bytes is not None:
+        count("pdf_cache_hit")
+    return pdf_bytes
+
+
+def render_cached(invoice_data, profile, filepath=None):
+    """
+    PDF bytes for an invoice record, from the cache or rendered and cached.
+    The bytes are also written durably to filepath when one is given.
+    """
+    cache = get_pdf_cache()
+    if not cache.enabled:
+        return render_invoice_pdf(invoice_data, profile, filepath)
+
+    key = render_key(invoice_data, profile)
+    pdf_bytes = cache.get(key)
+    if pdf_bytes is None:
+        count("pdf_cache_miss")
+        pdf_bytes = render_invoice_pdf(invoice_data, profile)
+        try:
+            cache.put(key, pdf_bytes)
+        except OSError as e:
+            print(f"Error caching PDF {invoice_data.get('invoice_number')}: {e}")
+    else:
+        count("pdf_cache_hit")
+    if filepath:
+        write_pdf(pdf_bytes, filepath, sync=True)
+    return pdf_bytes
+
+
+def stored_invoice_pdf(storage, invoice_number, profile, filepath=None):
+    """
+    PDF of a stored invoice, rendered with the workshop details saved in
+    its record (or `profile` for older records); None if the number is unknown
+    """
+    invoice_data = storage.find_invoice(invoice_number)
+    if invoice_data is None:
+        return None
+    return render_cached(invoice_data, render_profile(invoice_data, profile), filepath)
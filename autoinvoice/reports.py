@@ -0,0 +1,269 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# ========================
+# REPORTING ENGINE
+# ========================
+#
+# Owner reports over any date range: totals, monthly revenue, labor vs
+# parts, top parts by quantity and revenue per vehicle make. A user's
+# invoices are loaded once into two column-oriented DataFrames, sorted
+# by day:
+#
+#     invoices  day, month, number, customer, make, parts, labor,
+#               discount, total            (one row per invoice)
+#     items     day, part, desc, qty, price, total  (one row per line item)
+#
+# Money columns are int64 paisa, strings are pyarrow-backed. A date range
+# is a binary search on the sorted day column and every breakdown is a
+# vectorized sum or groupby, so a report over years of history costs
+# milliseconds once the frames are loaded.
+#
+# Loading is incremental. The search index file grows with every save and
+# clear, and Storage.invoice_changes() returns the days touched since the
+# frames were last brought up to date; only those days are re-read from
+# storage and swapped in. Finished reports are cached per (user, range)
+# and reused until the user's invoices change. pandas is only imported by
+# this module, so the app imports it on the first report.
+
+REPORT_CACHE_SIZE = int(os.environ.get("AUTOINVOICE_REPORT_CACHE", "64"))
+FRAME_CACHE_SIZE = 16
+TOP_PARTS = 10
+UNKNOWN_MAKE = "Unknown"
+
+_STRING = "string[pyarrow]"
+
+
+def _paisa(values):
+    """Rupee amounts as int64 paisa"""
+    return np.rint(np.asarray(values, dtype="float64") * 100).astype("int64")
+
+
+def load_frames(records):
+    """(invoices, items) DataFrames from (day, record) pairs"""
+    inv = {"day": [], "number": [], "customer": [], "car": [],
+           "parts": [], "labor": [], "discount": [], "total": []}
+    items = {"day": [], "desc": [], "qty": [], "price": [], "total": []}
+
+    for day, record in records:
+        inv["day"].append(day)
+        inv["number"].append(record.get("invoice_number", ""))
+        inv["customer"].append(record.get("customer_name", ""))
+        inv["car"].append(record.get("car_details", ""))
+        inv["parts"].append(record.get("subtotal", 0))
+        inv["labor"].append(record.get("labor", 0))
+        inv["discount"].append(record.get("discount", 0))
+        inv["total"].append(record.get("grand_total", 0))
+        for item in record.get("items", []):
+            items["day"].append(day)
+            items["desc"].append(item.get("desc", ""))
+            items["qty"].append(item.get("qty", 0))
+            items["price"].append(item.get("price", 0))
+            items["total"].append(item.get("total", 0))
+
+    invoices = pd.DataFrame({
+        "day": pd.to_datetime(pd.Series(inv["day"], dtype="object"), format="%Y-%m-%d"),
+        "number": pd.Series(inv["number"], dtype=_STRING),
+        "customer": pd.Series(inv["customer"], dtype=_STRING),
+        "make": vehicle_make(pd.Series(inv["car"], dtype=_STRING)),
+        "parts": _paisa(inv["parts"]),
+        "labor": _paisa(inv["labor"]),
+        "discount": _paisa(inv["discount"]),
+        "total": _paisa(inv["total"]),
+    })
+    invoices["month"] = invoices["day"].to_numpy().astype("datetime64[M]")
+
+    desc = pd.Series(items["desc"], dtype=_STRING).str.strip()
+    line_items = pd.DataFrame({
+        "day": pd.to_datetime(pd.Series(items["day"], dtype="object"), format="%Y-%m-%d"),
+        "part": desc.str.lower(),
+        "desc": desc,
+        "qty": np.asarray(items["qty"], dtype="int64"),
+        "price": _paisa(items["price"]),
+        "total": _paisa(items["total"]),
+    })
+    return _by_day(invoices), _by_day(line_items)
+
+
+def vehicle_make(car_details):
+    """First word of the vehicle description, e.g. 'Toyota' for 'toyota corolla, ABC-123'"""
+    make = car_details.str.strip().str.split(n=1).str[0].str.rstrip(",").str.title()
+    return make.fillna(UNKNOWN_MAKE).replace("", UNKNOWN_MAKE).astype(_STRING)
+
+
+def _by_day(frame):
+    return frame.sort_values("day", kind="stable").reset_index(drop=True)
+
+
+def _day_slice(frame, start=None, end=None):
+    """Rows with start <= day <= end (YYYY-MM-DD, inclusive) of a day-sorted frame"""
+    days = frame["day"].to_numpy()
+    lo = np.searchsorted(days, np.datetime64(start), "left") if start else 0
+    hi = np.searchsorted(days, np.datetime64(end), "right") if end else len(days)
+    return frame.iloc[lo:hi]
+
+
+def _rupees(paisa):
+    return int(paisa) / 100
+
+
+def group_sums(keys, sort=False, **columns):
+    """
+    (unique keys, row counts, {name: sums}) of int64 columns grouped by
+    key: one factorize plus one bincount per column
+    """
+    codes, uniques = pd.factorize(keys, sort=sort)
+    size = len(uniques)
+    counts = np.bincount(codes, minlength=size)
+    sums = {name: np.bincount(codes, weights=values.to_numpy(), minlength=size).astype("int64")
+            for name, values in columns.items()}
+    return codes, uniques, counts, sums
+
+
+def build_report(invoices, items, start=None, end=None, top=TOP_PARTS):
+    """Report dict for a date range (YYYY-MM-DD, inclusive; None = open)"""
+    inv = _day_slice(invoices, start, end)
+    lines = _day_slice(items, start, end)
+
+    parts = int(inv["parts"].sum())
+    labor = int(inv["labor"].sum())
+
+    _, months, counts, sums = group_sums(inv["month"], sort=True, revenue=inv["total"],
+                                         parts=inv["parts"], labor=inv["labor"])
+    monthly = pd.DataFrame({
+        "month": np.asarray(months, dtype="datetime64[M]").astype(str),
+        "invoices": counts,
+        "revenue": sums["revenue"] / 100,
+        "parts": sums["parts"] / 100,
+        "labor": sums["labor"] / 100,
+    })
+
+    codes, _, _, sums = group_sums(lines["part"], qty=lines["qty"], revenue=lines["total"])
+    best = np.argsort(-sums["qty"], kind="stable")[:top]
+    _, first_row = np.unique(codes, return_index=True)
+    top_parts = pd.DataFrame({
+        "part": lines["desc"].to_numpy()[first_row[best]],
+        "qty": sums["qty"][best],
+        "revenue": sums["revenue"][best] / 100,
+    })
+
+    _, makes, counts, sums = group_sums(inv["make"], revenue=inv["total"])
+    order = np.argsort(-sums["revenue"], kind="stable")
+    by_make = pd.DataFrame({
+        "make": np.asarray(makes, dtype=object)[order],
+        "invoices": counts[order],
+        "revenue": sums["revenue"][order] / 100,
+    })
+
+    return {
+        "start": start,
+        "end": end,
+        "invoices": len(inv),
+        "revenue": _rupees(inv["total"].sum()),
+        "parts": _rupees(parts),
+        "labor": _rupees(labor),
+        "discount": _rupees(inv["discount"].sum()),
+        "parts_share": parts / (parts + labor) if parts + labor else 0.0,
+        "items_sold": int(lines["qty"].sum()),
+        "first_day": inv["day"].iloc[0].strftime("%Y-%m-%d") if len(inv) else None,
+        "last_day": inv["day"].iloc[-1].strftime("%Y-%m-%d") if len(inv) else None,
+        "monthly": monthly,
+        "top_parts": top_parts,
+        "makes": by_make,
+    }
+
+
+class InvoiceFrames:
+    """One user's invoices in columnar form, kept current incrementally"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.version = None
+        self.invoices, self.items = load_frames([])
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Bring the frames up to date; returns True if anything changed"""
+        days, version = self.storage.invoice_changes(self.version)
+        if version == self.version:
+            return False
+
+        if days is None:
+            self.invoices, self.items = load_frames(self.storage.iter_invoices())
+        elif days:
+            records = [pair for day in sorted(days) for pair in self.storage.iter_invoices(day, day)]
+            self._replace_days(days, *load_frames(records))
+        self.version = version
+        return True
+
+    def _replace_days(self, days, invoices, items):
+        changed = pd.to_datetime(sorted(days), format="%Y-%m-%d")
+        self.invoices = _replace_days(self.invoices, changed, invoices)
+        self.items = _replace_days(self.items, changed, items)
+
+
+def _replace_days(frame, changed, rows):
+    """
+    Day-sorted frame with the rows of the changed days replaced by `rows`.
+    Only the part from the earliest changed day on is filtered and sorted,
+    which is just the last few rows when today's invoices change.
+    """
+    cut = np.searchsorted(frame["day"].to_numpy(), changed[0].to_datetime64(), "left")
+    tail = frame.iloc[cut:]
+    tail = tail[~tail["day"].isin(changed)]
+    return pd.concat([frame.iloc[:cut], _by_day(pd.concat([tail, rows], ignore_index=True))],
+                     ignore_index=True)
+
+
+class ReportEngine:
+    """Per-user InvoiceFrames plus an LRU cache of finished reports"""
+
+    def __init__(self, max_reports=REPORT_CACHE_SIZE, max_users=FRAME_CACHE_SIZE):
+        self.max_reports = max(1, max_reports)
+        self.max_users = max(1, max_users)
+        self._frames = OrderedDict()
+        self._reports = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _frames_for(self, storage):
+        key = (storage.name, storage.user_id)
+        with self._lock:
+            frames = self._frames.get(key)
+            if frames is None:
+                frames = self._frames[key] = InvoiceFrames(storage)
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.max_users:
+                self._frames.popitem(last=False)
+        return frames
+
+    def report(self, storage, start=None, end=None):
+        """Report for a user and date range, cached until their invoices change"""
+        frames = self._frames_for(storage)
+        with frames.lock:
+            frames.refresh()
+            key = (storage.name, storage.user_id, start, end)
+            with self._lock:
+                cached = self._reports.get(key)
+                if cached is not None and cached[0] == frames.version:
+                    self._reports.move_to_end(key)
+                    return cached[1]
+
+            result = build_report(frames.invoices, frames.items, start, end)
+            with self._lock:
+                self._reports[key] = (frames.version, result)
+                self._reports.move_to_end(key)
+                while len(self._reports) > self.max_reports:
+                    self._reports.popitem(last=False)
+        return result
+
+
+_engine = ReportEngine()
+
+
+def get_report(storage, start=None, end=None):
+    """Owner report for a user's storage over [start, end] (YYYY-MM-DD, inclusive)"""
+    return _engine.report(storage, start, end)
@@ -0,0 +1,136 @@
+import argparse
+import datetime
+import os
+import sys
+import time
+
+from autoinvoice.backends import configured_backend, get_storage, stored_user_ids, user_invoices_dir
+from autoinvoice.engine import merge_profile
+from autoinvoice.pdfcache import stored_invoice_pdf
+
+# ========================
+# INVOICE AND PDF RETENTION
+# ========================
+#
+# Days older than AUTOINVOICE_RETAIN_DAYS move from the live store into
+# compressed monthly archives (see autoinvoice.archive). Their rollups stay,
+# so today/month/all-time statistics are unchanged, and search and
+# iter_invoices() still find the records. Archived PDFs older than
+# AUTOINVOICE_PDF_RETAIN_DAYS are deleted: every PDF can be rendered again
+# from its stored record (`render` below, or Recent Jobs in the app).
+#
+#     python -m autoinvoice.retention run --days 90 --pdf-days 30
+#     python -m autoinvoice.retention run --days 90 --user ws_3f9c0a71d2e4b815 --dry-run
+#     python -m autoinvoice.retention render --user ws_3f9c0a71d2e4b815 INV-1042
+#
+# Both ages default to the environment variables; 0 keeps everything. When
+# either is set, the app also applies the policy to every user once per
+# process in the background warm-up. Re-rendered PDFs print the workshop
+# details saved with the invoice; records from before those were saved use
+# the workshop's current profile.
+
+RETAIN_DAYS = int(os.environ.get("AUTOINVOICE_RETAIN_DAYS", "0"))
+PDF_RETAIN_DAYS = int(os.environ.get("AUTOINVOICE_PDF_RETAIN_DAYS", "0"))
+
+
+def cutoff_day(days, now=None):
+    """First day (YYYY-MM-DD) that is kept live under a retention age"""
+    now = now or datetime.datetime.now()
+    return (now - datetime.timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def prune_pdfs(user_id, days, now=None, dry_run=False):
+    """Delete a user's archived PDFs older than `days`; returns their paths"""
+    directory = user_invoices_dir(user_id)
+    if days <= 0 or not os.path.isdir(directory):
+        return []
+
+    oldest = (now or time.time()) - days * 86400
+    removed = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".pdf") and entry.is_file() and entry.stat().st_mtime < oldest:
+            if not dry_run:
+                os.remove(entry.path)
+            removed.append(entry.path)
+    return removed
+
+
+def apply_retention(storage, days=RETAIN_DAYS, pdf_days=PDF_RETAIN_DAYS, dry_run=False):
+    """Archive old days and prune old PDFs for one user"""
+    archived = storage.archive_before(cutoff_day(days), dry_run) if days > 0 else []
+    pdfs = prune_pdfs(storage.user_id, pdf_days, dry_run=dry_run)
+    return {"user_id": storage.user_id, "archived_days": archived, "pdfs_removed": len(pdfs)}
+
+
+def sweep(backend=None, days=RETAIN_DAYS, pdf_days=PDF_RETAIN_DAYS, dry_run=False):
+    """Apply the policy to every stored user; yields one result per user"""
+    for user_id in stored_user_ids(backend):
+        try:
+            yield apply_retention(get_storage(user_id, backend), days, pdf_days, dry_run)
+        except Exception as e:
+            print(f"Error applying retention for user {user_id}: {e}")
+
+
+def sweep_configured():
+    """Background sweep with the configured ages (no-op when both are 0)"""
+    if RETAIN_DAYS > 0 or PDF_RETAIN_DAYS > 0:
+        for _ in sweep():
+            pass
+
+
+def regenerate_pdf(storage, invoice_number, filepath=None):
+    """Render a stored invoice again; None if the number is unknown"""
+    return stored_invoice_pdf(storage, invoice_number, merge_profile(storage.load_profile()), filepath)
+
+
+def cmd_run(args):
+    users = [args.user] if args.user else stored_user_ids(args.backend)
+    total_days = total_pdfs = 0
+    for user_id in users:
+        result = apply_retention(get_storage(user_id, args.backend), args.days, args.pdf_days, args.dry_run)
+        if result["archived_days"] or result["pdfs_removed"]:
+            days = result["archived_days"]
+            print(f"{user_id}: {len(days)} days {'to archive' if args.dry_run else 'archived'}"
+                  f"{f' ({days[0]} .. {days[-1]})' if days else ''}, "
+                  f"{result['pdfs_removed']} PDFs {'to remove' if args.dry_run else 'removed'}")
+        total_days += len(result["archived_days"])
+        total_pdfs += result["pdfs_removed"]
+    print(f"{len(users)} users: {total_days} days {'to archive' if args.dry_run else 'archived'}, "
+          f"{total_pdfs} PDFs {'to remove' if args.dry_run else 'removed'}")
+    return 0
+
+
+def cmd_render(args):
+    out_path = args.out or f"invoice_{args.invoice_number}.pdf"
+    pdf_bytes = regenerate_pdf(get_storage(args.user, args.backend), args.invoice_number, out_path)
+    if pdf_bytes is None:
+        print(f"Invoice {args.invoice_number} not found for {args.user}", file=sys.stderr)
+        return 1
+    print(f"Written: {out_path} ({len(pdf_bytes):,} bytes)")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive old invoice days and prune old PDFs")
+    parser.add_argument("--backend", default=configured_backend(), choices=["sqlite", "json"])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="apply the retention policy")
+    run.add_argument("--days", type=int, default=RETAIN_DAYS,
+                     help="archive days older than this (default: AUTOINVOICE_RETAIN_DAYS, 0 = never)")
+    run.add_argument("--pdf-days", type=int, default=PDF_RETAIN_DAYS,
+                     help="delete PDFs older than this (default: AUTOINVOICE_PDF_RETAIN_DAYS, 0 = never)")
+    run.add_argument("--user", help="only this workshop id")
+    run.add_argument("--dry-run", action="store_true")
+
+    render = commands.add_parser("render", help="render a stored invoice to PDF again")
+    render.add_argument("invoice_number")
+    render.add_argument("--user", required=True, help="workshop id")
+    render.add_argument("--out", help="PDF file to write (default: invoice_<number>.pdf)")
+
+    args = parser.parse_args(argv)
+    return cmd_run(args) if args.command == "run" else cmd_render(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+import json
+import os
+import re
+import threading
+from collections import Counter
+
+from autoinvoice.cache import LruRegistry
+from autoinvoice.stats import read_journal_tail
+from autoinvoice.storage import today_key
+from autoinvoice.tenants import tenant_path, adopt_legacy_path
+
+# ========================
+# INVOICE SEARCH INDEX
+# ========================
+#
+# Finds invoices by customer name, vehicle/plate, invoice number or part
+# description without opening any day file.
+#
+# Every saved invoice appends a small summary document to
+# data/search/<shard>/<user_id>.jsonl. In memory the documents are indexed by
+# trigram over a compact form of their searchable text (lower-case letters
+# and digits only, fields separated by "|"), so "abc12", "ABC-123" and
+# "corol" all match "Toyota Corolla, ABC-123". Each whitespace-separated
+# query word must appear in the document; candidates come from the
+# trigram postings and are then verified by substring match. Words shorter
+# than three characters are verified against every document.
+#
+# The file is read incrementally like the day journals, so invoices
+# indexed by other processes are picked up on the next query.
+#
+# An invoice is indexed after its record is saved. When an index is opened
+# its invoice count is checked against the storage's; invoices a crash left
+# unindexed are added, or the index is rebuilt if they cannot be found.
+
+SEARCH_ROOT = "data/search"
+MAX_RESULTS = 50
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def compact(text):
+    """Lower-case letters and digits only"""
+    return _NON_ALNUM.sub("", str(text).lower())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2) if "|" not in text[i:i + 3]}
+
+
+def make_document(invoice, day):
+    """Summary stored in the index for one invoice"""
+    fields = [
+        invoice.get("invoice_number", ""),
+        invoice.get("customer_name", ""),
+        invoice.get("car_details", ""),
+    ] + [item.get("desc", "") for item in invoice.get("items", [])]
+
+    return {
+        "day": day,
+        "invoice_number": invoice.get("invoice_number", ""),
+        "customer_name": invoice.get("customer_name", ""),
+        "car_details": invoice.get("car_details", ""),
+        "date": invoice.get("date", ""),
+        "grand_total": invoice.get("grand_total", 0),
+        "text": "|".join(compact(field) for field in fields),
+    }
+
+
+def summary(doc):
+    """Search result form of a document (without the indexed text)"""
+    return {k: v for k, v in doc.items() if k != "text"}
+
+
+def search_index_path(user_id):
+    return tenant_path(SEARCH_ROOT, user_id, f"{user_id}.jsonl")
+
+
+class SearchIndex:
+    """Trigram index over one user's invoices"""
+
+    def __init__(self, user_id, path=None):
+        self.user_id = user_id
+        self.path = path or search_index_path(user_id)
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.docs = []
+        self.postings = {}
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _index(self, entry):
+        if "clear_day" in entry:
+            day = entry["clear_day"]
+            for doc_id, doc in enumerate(self.docs):
+                if doc is not None and doc["day"] == day:
+                    self.docs[doc_id] = None
+            return
+
+        doc_id = len(self.docs)
+        self.docs.append(entry)
+        text = entry["text"]
+        for gram in trigrams(text):
+            self.postings.setdefault(gram, []).append(doc_id)
+
+    def refresh(self):
+        """Index entries appended since the last refresh"""
+        with self._lock:
+            tail = read_journal_tail(self.path, self.offset)
+            if tail is None:
+                self._reset()
+                tail = read_journal_tail(self.path, 0)
+            entries, self.offset = tail
+            for entry in entries:
+                self._index(entry)
+
+    def _append(self, entries):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        payload = "".join(json.dumps(e, separators=(",", ":"), ensure_ascii=False) + "\n"
+                          for e in entries)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(payload)
+            self.refresh()
+
+    def add_invoices(self, invoices, day):
+        """Index newly saved invoices"""
+        if invoices:
+            self._append([make_document(inv, day) for inv in invoices])
+
+    def clear_day(self, day):
+        """Drop every invoice of a day from search results"""
+        self._append([{"clear_day": day}])
+
+    def catch_up(self, storage):
+        """
+        Index invoices that were saved but never indexed - a crash between
+        the two writes - by looking at today and the last indexed day.
+        Rebuilds the index if that does not account for every stored invoice.
+        """
+        with self._lock:
+            self.refresh()
+            stored = storage.range_totals()["count"]
+            if self.count() == stored:
+                return
+            days = {today_key()}
+            days.update(doc["day"] for doc in self.docs[-1:] if doc is not None)
+            for day in sorted(days):
+                indexed = Counter(doc["invoice_number"] for doc in self.docs
+                                  if doc is not None and doc["day"] == day)
+                missing = []
+                for _, invoice in storage.iter_invoices(day, day):
+                    number = invoice.get("invoice_number", "")
+                    if indexed[number]:
+                        indexed[number] -= 1
+                    else:
+                        missing.append(invoice)
+                if missing:
+                    print(f"Search index of {self.user_id}: indexing {len(missing)} invoices of {day}")
+                    self.add_invoices(missing, day)
+            if self.count() != stored:
+                print(f"Search index of {self.user_id} does not match its invoices; rebuilding it")
+                self.rebuild(storage)
+
+    def count(self):
+        """Invoices in the index"""
+        return sum(doc is not None for doc in self.docs)
+
+    def rebuild(self, storage):
+        """Recreate the index file from every invoice in storage"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for day, invoice in storage.iter_invoices():
+                f.write(json.dumps(make_document(invoice, day), separators=(",", ":"),
+                                   ensure_ascii=False) + "\n")
+        with self._lock:
+            os.replace(tmp_path, self.path)
+            self._reset()
+            self.refresh()
+
+    def _candidates(self, word):
+        if len(word) >= 3:
+            grams = sorted(trigrams(word), key=lambda g: len(self.postings.get(g, ())))
+            if not grams or grams[0] not in self.postings:
+                return set()
+            result = set(self.postings[grams[0]])
+            for gram in grams[1:]:
+                result.intersection_update(self.postings.get(gram, ()))
+                if not result:
+                    break
+            return result
+        # One or two characters: too short for trigrams, verify every document
+        return set(range(len(self.docs)))
+
+    def changes_since(self, version):
+        """
+        Every save and clear appends to the index file, so its (inode, size)
+        is a version of the user's invoices. Returns (days, version): the
+        days saved to or cleared since an earlier version, and the current
+        version. days is None if there is no earlier version or the file
+        was rewritten since.
+        """
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if version is not None and version[0] == inode:
+            tail = read_journal_tail(self.path, version[1])
+            if tail is not None:
+                entries, offset = tail
+                return {e.get("day") or e.get("clear_day") for e in entries}, (inode, offset)
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        return None, (inode, size)
+
+    def recent(self, limit=MAX_RESULTS):
+        """Most recently saved invoices, newest first"""
+        with self._lock:
+            self.refresh()
+            results = []
+            for doc in reversed(self.docs):
+                if doc is None:
+                    continue
+                results.append(summary(doc))
+                if len(results) >= limit:
+                    break
+            return results
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Invoices matching every word of the query, newest first"""
+        words = [compact(w) for w in query.split()]
+        words = [w for w in words if w]
+        if not words:
+            return []
+
+        with self._lock:
+            self.refresh()
+            candidates = None
+            for word in sorted(words, key=len, reverse=True):
+                found = self._candidates(word)
+                candidates = found if candidates is None else candidates & found
+                if not candidates:
+                    return []
+
+            results = []
+            for doc_id in sorted(candidates, reverse=True):
+                doc = self.docs[doc_id]
+                if doc is None:
+                    continue
+                if all(w in doc["text"] for w in words):
+                    results.append(summary(doc))
+                    if len(results) >= limit:
+                        break
+            return results
+
+
+_indexes = LruRegistry()
+
+
+def _open_search_index(storage):
+    adopt_legacy_path(os.path.join(SEARCH_ROOT, f"{storage.user_id}.jsonl"),
+                      search_index_path(storage.user_id))
+    index = SearchIndex(storage.user_id)
+    if index.exists():
+        index.catch_up(storage)
+    else:
+        index.rebuild(storage)
+    return index
+
+
+def get_search_index(storage):
+    """
+    Shared search index for a storage object's user.
+    Built from the stored invoices the first time it is needed.
+    """
+    return _indexes.get(storage.user_id, lambda: _open_search_index(storage))
+
+
+def forget_search_index(user_id, remove=False):
+    """Drop a user's index from memory, and its file (both layouts) if remove"""
+    _indexes.pop(user_id)
+    if remove:
+        for path in (search_index_path(user_id), os.path.join(SEARCH_ROOT, f"{user_id}.jsonl")):
+            if os.path.exists(path):
+                os.remove(path)
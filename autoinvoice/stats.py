@@ -0,0 +1,311 @@
+import json
+import os
+import threading
+from collections import deque
+
+from autoinvoice.cache import LruRegistry
+from autoinvoice.models import unpack_record
+from autoinvoice.storage import get_journal, today_key
+
+# ========================
+# RUNNING TODAY AGGREGATE
+# ========================
+#
+# Keeps count / sales / labor / items and the last few invoices for the
+# current day, persisted next to the journal as stats_today.json.
+#
+# The aggregate remembers how many bytes of today's journal it has folded
+# in. Bringing it up to date is a single stat() of the journal plus a read
+# of only the bytes appended since, so the cost does not grow with the
+# number of invoices saved today, and invoices written by another process
+# are picked up on the next read.
+
+AGGREGATE_FILE = "stats_today.json"
+RECENT_LIMIT = 5
+
+
+def read_journal_tail(path, offset):
+    """
+    Read records appended to a journal file after byte `offset`.
+    Returns (records, new_offset), or None if the file shrank below
+    `offset` (cleared or rewritten) and must be re-read from the start.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+
+    if size == offset:
+        return [], offset
+    if size < offset:
+        return None
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+        chunk = f.read(size - offset)
+
+    # Only consume complete lines; a partial tail is picked up later
+    end = chunk.rfind(b"\n") + 1
+    records = []
+    for line in chunk[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict):
+            records.append(record)
+
+    return records, offset + end
+
+
+class TodayAggregate:
+    """Incrementally maintained statistics for one user's current day"""
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.journal = get_journal(data_dir)
+        self.path = os.path.join(data_dir, AGGREGATE_FILE)
+        self._lock = threading.Lock()
+        self._reset(today_key())
+        self._load()
+
+    def _reset(self, day):
+        self.day = day
+        self.offset = 0
+        self.count = 0
+        self.sales = 0
+        self.labor = 0
+        self.items = 0
+        self.recent = deque(maxlen=RECENT_LIMIT)
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return
+
+        if data.get("day") != self.day:
+            return
+
+        self.offset = data.get("offset", 0)
+        self.count = data.get("count", 0)
+        self.sales = data.get("sales", 0)
+        self.labor = data.get("labor", 0)
+        self.items = data.get("items", 0)
+        self.recent.extend(data.get("recent", []))
+
+    def _save(self):
+        data = {
+            "day": self.day,
+            "offset": self.offset,
+            "count": self.count,
+            "sales": self.sales,
+            "labor": self.labor,
+            "items": self.items,
+            "recent": list(self.recent),
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def _fold(self, record):
+        invoice = unpack_record(record)
+        self.count += 1
+        self.sales += invoice.get("grand_total", 0)
+        self.labor += invoice.get("labor", 0)
+        self.items += len(invoice.get("items", []))
+        # Kept in the compact stored form; expanded by snapshot()
+        self.recent.append(record)
+
+    def refresh(self):
+        """Fold in any journal bytes written since the last refresh"""
+        with self._lock:
+            day = today_key()
+            if day != self.day:
+                self._reset(day)
+
+            path = self.journal.day_path(day)
+            tail = read_journal_tail(path, self.offset)
+            restarted = tail is None
+            if restarted:
+                # Journal was cleared or rewritten - start over
+                self._reset(day)
+                tail = read_journal_tail(path, 0)
+
+            records, offset = tail
+            if offset == self.offset and not restarted:
+                return False
+
+            for invoice in records:
+                self._fold(invoice)
+            self.offset = offset
+            self._save()
+            return True
+
+    def snapshot(self):
+        """Current totals for today"""
+        self.refresh()
+        return {
+            "day": self.day,
+            "count": self.count,
+            "sales": self.sales,
+            "labor": self.labor,
+            "items": self.items,
+            "recent": [unpack_record(record) for record in self.recent],
+        }
+
+
+_aggregates = LruRegistry()
+
+
+def get_today_aggregate(data_dir):
+    """Get the shared running aggregate for a user data directory"""
+    return _aggregates.get(os.path.abspath(data_dir), lambda: TodayAggregate(data_dir))
+
+
+# ========================
+# PER-DAY ROLLUP INDEX
+# ========================
+#
+# rollups.json holds one small row per day:
+#
+#     {"2025-01-31": {"count": 12, "sales": 84000, "labor": 18000,
+#                     "items": 40, "offset": 5120}, ...}
+#
+# All-time and date-range totals are sums over these rows, so invoice
+# bodies are only read when a day's journal has grown since it was last
+# indexed. The index is rebuilt from the journals (and monthly archives)
+# if it is missing or unreadable.
+#
+# When a day is archived its row is kept with "archived": true and offset
+# 0: the totals stay, and anything journaled for that day later is added
+# on top.
+
+ROLLUP_FILE = "rollups.json"
+
+
+def _empty_rollup():
+    return {"count": 0, "sales": 0, "labor": 0, "items": 0, "offset": 0}
+
+
+class RollupIndex:
+    """Persisted per-day count/sales/labor rollups for one user"""
+
+    def __init__(self, data_dir, archive=None):
+        self.data_dir = data_dir
+        self.journal = get_journal(data_dir)
+        self.archive = archive
+        self.path = os.path.join(data_dir, ROLLUP_FILE)
+        self._lock = threading.Lock()
+        self.rows = {}
+
+        if not self._load():
+            self.rebuild()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except Exception:
+            return False
+
+        if not isinstance(rows, dict):
+            return False
+        self.rows = rows
+        return True
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.rows, f, separators=(",", ":"), sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def _refresh_day(self, day):
+        path = self.journal.day_path(day)
+        row = self.rows.get(day) or _empty_rollup()
+
+        tail = read_journal_tail(path, row["offset"])
+        restarted = tail is None
+        if restarted:
+            row = _empty_rollup()
+            tail = read_journal_tail(path, 0)
+
+        records, offset = tail
+        if offset == row["offset"] and not restarted:
+            return False
+
+        if not offset:
+            # Day was cleared
+            self.rows.pop(day, None)
+            return True
+
+        for record in records:
+            invoice = unpack_record(record)
+            row["count"] += 1
+            row["sales"] += invoice.get("grand_total", 0)
+            row["labor"] += invoice.get("labor", 0)
+            row["items"] += len(invoice.get("items", []))
+
+        row["offset"] = offset
+        self.rows[day] = row
+        return True
+
+    def refresh(self, day=None):
+        """Bring one day's row (today by default) up to date with its journal"""
+        with self._lock:
+            if self._refresh_day(day or today_key()):
+                self._save()
+
+    def rebuild(self):
+        """Recompute every row from the archives and the raw journal files"""
+        with self._lock:
+            self.rows = {}
+            if self.archive is not None:
+                for day, totals in self.archive.day_totals().items():
+                    self.rows[day] = dict(totals, offset=0, archived=True)
+            for day in self.journal.days():
+                self._refresh_day(day)
+            self._save()
+
+    def mark_archived(self, days):
+        """Keep the rows of days whose journals move into the archive"""
+        with self._lock:
+            for day in days:
+                self._refresh_day(day)
+                row = self.rows.get(day)
+                if row is not None:
+                    row["offset"] = 0
+                    row["archived"] = True
+            self._save()
+
+    def totals(self, start=None, end=None):
+        """
+        Sum rollup rows for days in [start, end] (YYYY-MM-DD, inclusive).
+        Either bound may be None for an open range.
+        """
+        self.refresh()
+
+        totals = {"count": 0, "sales": 0, "labor": 0, "items": 0, "days": 0}
+        for day, row in self.rows.items():
+            if start and day < start:
+                continue
+            if end and day > end:
+                continue
+            if not row["count"]:
+                continue
+            totals["count"] += row["count"]
+            totals["sales"] += row["sales"]
+            totals["labor"] += row["labor"]
+            totals["items"] += row["items"]
+            totals["days"] += 1
+        return totals
+
+
+_rollups = LruRegistry()
+
+
+def get_rollup_index(data_dir, archive=None):
+    """Get the shared rollup index for a user data directory"""
+    return _rollups.get(os.path.abspath(data_dir), lambda: RollupIndex(data_dir, archive))
@@ -0,0 +1,271 @@
+import atexit
+import datetime
+import json
+import os
+import threading
+import time
+
+from autoinvoice.cache import LruRegistry
+from autoinvoice.models import pack_record, unpack_record
+
+# ========================
+# APPEND-ONLY INVOICE JOURNAL
+# ========================
+#
+# Each day gets one newline-delimited JSON file in the user's data directory:
+#
+#     data/users/<shard>/<USER_ID>/invoices_<YYYY-MM-DD>.jsonl
+#
+# Saving an invoice appends a single line instead of re-reading and
+# re-writing the whole day. Writes are flushed to the OS immediately and
+# fsync'd in batches (every FSYNC_EVERY records or FSYNC_INTERVAL seconds,
+# and always at exit). A torn last line after a crash is skipped on read
+# and ended before the next append, so at most the invoice being written
+# is lost, never the whole day.
+
+JOURNAL_PREFIX = "invoices_"
+JOURNAL_SUFFIX = ".jsonl"
+LEGACY_SUFFIX = ".json"
+
+FSYNC_EVERY = int(os.environ.get("AUTOINVOICE_FSYNC_EVERY", "8"))
+FSYNC_INTERVAL = float(os.environ.get("AUTOINVOICE_FSYNC_INTERVAL", "2.0"))
+
+
+def today_key():
+    """Day key used for journal file names"""
+    return datetime.datetime.now().strftime("%Y-%m-%d")
+
+
+def encode_record(record):
+    """Serialize one invoice record as a single compact journal line"""
+    return json.dumps(pack_record(record), separators=(",", ":"), ensure_ascii=False) + "\n"
+
+
+class InvoiceJournal:
+    """Append-only per-day invoice journal for one user data directory"""
+
+    def __init__(self, data_dir, fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL):
+        self.data_dir = data_dir
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._handle = None
+        self._handle_day = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        os.makedirs(data_dir, exist_ok=True)
+
+    def day_path(self, day):
+        """Path of the journal file for a day"""
+        return os.path.join(self.data_dir, f"{JOURNAL_PREFIX}{day}{JOURNAL_SUFFIX}")
+
+    def _open_for_day(self, day):
+        if self._handle_day != day:
+            self._close_handle()
+            self._handle = open(self.day_path(day), "a", encoding="utf-8")
+            self._handle_day = day
+            # End a line torn by a crash, so the next record is not glued to it
+            if self._handle.tell() and not self._ends_with_newline(day):
+                self._handle.write("\n")
+        return self._handle
+
+    def _ends_with_newline(self, day):
+        with open(self.day_path(day), "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _close_handle(self):
+        if self._handle is not None:
+            try:
+                self._sync_handle()
+                self._handle.close()
+            except Exception:
+                pass
+        self._handle = None
+        self._handle_day = None
+
+    def _sync_handle(self):
+        if self._handle is not None and self._pending:
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def append(self, record, day=None):
+        """Append one invoice record to the day's journal"""
+        return self.append_many([record], day)
+
+    def append_many(self, records, day=None):
+        """Append several invoice records with a single write"""
+        day = day or today_key()
+        payload = "".join(encode_record(r) for r in records)
+
+        with self._lock:
+            handle = self._open_for_day(day)
+            handle.write(payload)
+            handle.flush()
+            self._pending += len(records)
+
+            if (self._pending >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync_handle()
+
+        return True
+
+    def sync(self):
+        """Force pending journal writes to disk"""
+        with self._lock:
+            self._sync_handle()
+
+    def close(self):
+        """Sync and release the open journal file"""
+        with self._lock:
+            self._close_handle()
+
+    def read_day(self, day):
+        """Read all invoice records saved on a day"""
+        path = self.day_path(day)
+        if not os.path.exists(path):
+            return []
+
+        records = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash - skip it
+                    continue
+                if isinstance(record, dict):
+                    records.append(unpack_record(record))
+        return records
+
+    def days(self):
+        """Sorted list of days that have a journal file"""
+        if not os.path.isdir(self.data_dir):
+            return []
+
+        days = []
+        for name in os.listdir(self.data_dir):
+            if name.startswith(JOURNAL_PREFIX) and name.endswith(JOURNAL_SUFFIX):
+                days.append(name[len(JOURNAL_PREFIX):-len(JOURNAL_SUFFIX)])
+        return sorted(days)
+
+    def iter_invoices(self, days=None):
+        """Yield (day, record) for every invoice, oldest day first"""
+        for day in (days if days is not None else self.days()):
+            for record in self.read_day(day):
+                yield day, record
+
+    def clear_day(self, day):
+        """Delete the journal for a day"""
+        with self._lock:
+            if self._handle_day == day:
+                self._close_handle()
+            path = self.day_path(day)
+            if os.path.exists(path):
+                os.remove(path)
+                return True
+        return False
+
+    @staticmethod
+    def _starts_with(path, lines):
+        """Whether a journal file begins with exactly these lines"""
+        if not lines:
+            return True
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return all(f.readline() == line for line in lines)
+        except FileNotFoundError:
+            return False
+
+    def migrate_legacy(self):
+        """
+        Convert old invoices_<date>.json list files into journal files.
+        The original file is kept as invoices_<date>.json.migrated; running
+        again after a crash part-way does not migrate a file twice.
+        Returns the number of records migrated.
+        """
+        if not os.path.isdir(self.data_dir):
+            return 0
+
+        migrated = 0
+        for name in sorted(os.listdir(self.data_dir)):
+            if not (name.startswith(JOURNAL_PREFIX) and name.endswith(LEGACY_SUFFIX)):
+                continue
+
+            day = name[len(JOURNAL_PREFIX):-len(LEGACY_SUFFIX)]
+            legacy_path = os.path.join(self.data_dir, name)
+
+            try:
+                with open(legacy_path, "r", encoding="utf-8") as f:
+                    invoices = json.load(f)
+            except Exception as e:
+                print(f"Skipping unreadable legacy file {legacy_path}: {e}")
+                continue
+
+            if not isinstance(invoices, list):
+                invoices = []
+            invoices = [inv for inv in invoices if isinstance(inv, dict)]
+
+            with self._lock:
+                if self._handle_day == day:
+                    self._close_handle()
+
+                # Legacy records come first, then anything already journaled
+                journal_path = self.day_path(day)
+                lines = [encode_record(inv) for inv in invoices]
+                # A crash after the journal was replaced left the legacy file
+                # behind: its records are already there
+                if not self._starts_with(journal_path, lines):
+                    tmp_path = journal_path + ".tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as out:
+                        out.writelines(lines)
+                        if os.path.exists(journal_path):
+                            with open(journal_path, "r", encoding="utf-8") as existing:
+                                out.write(existing.read())
+                        out.flush()
+                        os.fsync(out.fileno())
+                    os.replace(tmp_path, journal_path)
+                os.replace(legacy_path, legacy_path + ".migrated")
+
+            migrated += len(invoices)
+
+        return migrated
+
+
+# ========================
+# JOURNAL REGISTRY
+# ========================
+
+# Evicted journals are synced and their day file closed
+_journals = LruRegistry(on_evict=InvoiceJournal.close)
+
+
+def _open_journal(data_dir):
+    journal = InvoiceJournal(data_dir)
+    try:
+        journal.migrate_legacy()
+    except Exception as e:
+        print(f"Error migrating legacy invoices in {data_dir}: {e}")
+    return journal
+
+
+def get_journal(data_dir):
+    """
+    Get the shared journal for a user data directory.
+    Legacy JSON day files are migrated the first time a directory is opened.
+    """
+    return _journals.get(os.path.abspath(data_dir), lambda: _open_journal(data_dir))
+
+
+def close_all_journals():
+    """Sync and close every open journal"""
+    for journal in _journals.values():
+        journal.close()
+
+
+atexit.register(close_all_journals)
@@ -0,0 +1,138 @@
+import hashlib
+import hmac
+import os
+import re
+import secrets
+
+# ========================
+# WORKSHOP (TENANT) IDENTITY
+# ========================
+#
+# A workshop is identified by a stable tenant id such as ws_3f9c0a71d2e4b815,
+# not by the Streamlit session, so refreshing the page or reconnecting keeps
+# the same counter, statistics and profile. The id reaches the app in one of
+# two ways:
+#
+#     login header   AUTOINVOICE_TENANT_HEADER names a header set by an
+#                    authenticating reverse proxy (e.g. X-Forwarded-User);
+#                    each login maps to its own tenant id
+#     workshop link  otherwise the first visit creates a tenant and puts a
+#                    signed token (<tenant id>.<signature>) in the URL as
+#                    ?workshop=...; the bookmarked link opens the workshop
+#
+# Tokens and login ids are signed with AUTOINVOICE_SECRET. Without it a
+# random secret is generated once and kept in data/tenant_secret; servers
+# sharing one data directory share it, separate hosts need the variable.
+#
+# Per-tenant directories are sharded by a two-hex-digit hash of the id
+# (data/users/<shard>/<tenant id>), so no parent directory holds more than
+# about 1/256 of the tenants.
+
+TENANT_HEADER = os.environ.get("AUTOINVOICE_TENANT_HEADER", "")
+TOKEN_PARAM = "workshop"
+SECRET_FILE = "data/tenant_secret"
+TENANT_PREFIX = "ws_"
+
+# Ids the app used to derive from the Streamlit session (user_<8 hex>)
+SESSION_ID_PATTERN = re.compile(r"^user_[0-9a-f]{8}$")
+_TENANT_ID_PATTERN = re.compile(r"^ws_[0-9a-f]{16}$")
+
+_secret = None
+
+
+def get_secret():
+    """Signing key: AUTOINVOICE_SECRET, or the one kept in SECRET_FILE"""
+    global _secret
+    if _secret is None:
+        value = os.environ.get("AUTOINVOICE_SECRET")
+        _secret = value.encode("utf-8") if value else _load_or_create_secret(SECRET_FILE)
+    return _secret
+
+
+def _load_or_create_secret(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    secret = secrets.token_hex(32).encode("ascii")
+    try:
+        # O_EXCL: if another process won the race, use its secret
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, "rb") as f:
+            return f.read().strip()
+    with os.fdopen(fd, "wb") as f:
+        f.write(secret)
+    return secret
+
+
+def _signature(message):
+    return hmac.new(get_secret(), message.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def new_tenant_id():
+    """Fresh random tenant id"""
+    return TENANT_PREFIX + secrets.token_hex(8)
+
+
+def is_tenant_id(value):
+    return bool(_TENANT_ID_PATTERN.match(value or ""))
+
+
+def sign_tenant(tenant_id):
+    """Workshop link token for a tenant id"""
+    return f"{tenant_id}.{_signature('token:' + tenant_id)[:32]}"
+
+
+def verify_token(token):
+    """Tenant id of a valid workshop link token, else None"""
+    tenant_id, _, signature = (token or "").partition(".")
+    if not is_tenant_id(tenant_id):
+        return None
+    if not hmac.compare_digest(signature, _signature("token:" + tenant_id)[:32]):
+        return None
+    return tenant_id
+
+
+def tenant_for_login(login):
+    """Stable tenant id for a login name passed by an authenticating proxy"""
+    return TENANT_PREFIX + _signature("login:" + login.strip().lower())[:16]
+
+
+# ========================
+# SHARDED LAYOUT
+# ========================
+
+def shard_of(user_id):
+    """Two hex digits spreading tenants over 256 subdirectories"""
+    return hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:2]
+
+
+def is_shard_name(name):
+    return len(name) == 2 and all(c in "0123456789abcdef" for c in name)
+
+
+def tenant_path(root, user_id, name=None):
+    """<root>/<shard>/<user_id>, or a file named `name` inside the shard"""
+    return os.path.join(root, shard_of(user_id), name or user_id)
+
+
+def adopt_legacy_path(old_path, new_path):
+    """
+    Move a file or directory from the old flat layout to its sharded path.
+    Nothing happens if the old path is gone or the new one already exists.
+    """
+    if not os.path.exists(old_path) or os.path.exists(new_path):
+        return False
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    try:
+        os.replace(old_path, new_path)
+    except OSError:
+        # Another process moved it first
+        return False
+    return True
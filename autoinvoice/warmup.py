@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+
+from autoinvoice.backends import configured_backend, get_database
+from autoinvoice.commit import get_commit_log
+from autoinvoice.jobs import get_render_pool
+from autoinvoice.metrics import observe
+from autoinvoice.pdf import warm_up as warm_up_pdf
+from autoinvoice.retention import sweep_configured
+
+# ========================
+# PROCESS WARM-UP
+# ========================
+#
+# Work every process does once, whichever user comes first: opening the
+# SQLite database (and creating its schema), finishing or rolling back
+# invoices a crashed process left half-committed, importing fpdf and
+# caching the default invoice template, starting the PDF worker processes
+# and, when a retention age is configured, archiving old days of every user.
+# start_warmup() runs it on a background thread so the first page paints
+# without waiting for it; by the time the first invoice is generated it is
+# usually done. Each step is recorded as a warmup_<step> timing.
+#
+# AUTOINVOICE_WARMUP=0 leaves everything to the first request that needs it.
+
+WARMUP = os.environ.get("AUTOINVOICE_WARMUP", "1") != "0"
+
+_started = False
+_started_lock = threading.Lock()
+
+
+def _open_database():
+    if configured_backend() == "sqlite":
+        get_database()
+
+
+WARMUP_STEPS = (
+    ("storage", _open_database),
+    ("recovery", get_commit_log),
+    ("pdf", warm_up_pdf),
+    ("pdf_workers", lambda: get_render_pool().start()),
+    ("retention", sweep_configured),
+)
+
+
+def warm_up():
+    """Run every warm-up step in this thread; failures are logged and skipped"""
+    for name, step in WARMUP_STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"Warm-up step '{name}' failed: {e}")
+            continue
+        observe(f"warmup_{name}", time.perf_counter() - started)
+
+
+def start_warmup():
+    """Start warm_up() on a background thread, once per process"""
+    global _started
+    if not WARMUP:
+        return False
+    with _started_lock:
+        if _started:
+            return False
+        _started = True
+    threading.Thread(target=warm_up, name="autoinvoice-warmup", daemon=True).start()
+    return True
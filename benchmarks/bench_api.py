@@ -0,0 +1,228 @@
+"""
+Load test for the HTTP/JSON API (autoinvoice.api).
+
+Starts the API server in a scratch directory and drives it with a small
+asyncio HTTP/1.1 client: C concurrent keep-alive connections, each
+sending requests back to back for a fixed time. Reports requests/sec and
+latency percentiles per scenario:
+
+    create   POST /api/v1/invoices
+    get      GET  /api/v1/invoices/<number>
+    search   GET  /api/v1/invoices?q=...
+    stats    GET  /api/v1/stats
+    pdf      GET  /api/v1/invoices/<number>/pdf
+    mix      60% get/search/stats, 30% create, 10% pdf
+
+    python benchmarks/bench_api.py --concurrency 1,8,32 --seconds 5
+    python benchmarks/bench_api.py --scenario create,mix --backend json --out api.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SECRET = "bench-api"
+TENANT = "ws_00000000000be7c0"
+PARTS = ["Brake pads", "Oil filter", "Engine oil 4L", "Air filter", "Spark plugs"]
+CARS = ["Toyota Corolla", "Honda Civic", "Suzuki Alto", "Kia Sportage"]
+SCENARIOS = ["create", "get", "search", "stats", "pdf", "mix"]
+
+
+def start_api(port, workdir, backend, workers):
+    env = dict(os.environ, PYTHONPATH=ROOT, AUTOINVOICE_SECRET=SECRET, AUTOINVOICE_STORAGE=backend,
+               AUTOINVOICE_PDF_WORKERS=str(workers))
+    proc = subprocess.Popen([sys.executable, "-m", "autoinvoice.api", "--port", str(port)],
+                            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1)
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("API server did not start")
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection"""
+
+    def __init__(self, port, token):
+        self.port = port
+        self.token = token
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        payload = json.dumps(body).encode() if body is not None else b""
+        head = (f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                f"Authorization: Bearer {self.token}\r\nContent-Length: {len(payload)}\r\n")
+        if payload:
+            head += "Content-Type: application/json\r\n"
+        self.writer.write(head.encode() + b"\r\n" + payload)
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode().partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        data = await self.reader.readexactly(length)
+        return status, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def invoice_body(rng):
+    return {
+        "customer_name": f"Customer {rng.randint(1, 5000)}",
+        "car_details": f"{rng.choice(CARS)} ABC-{rng.randint(100, 999)}",
+        "labor": rng.choice([1000, 1500, 2000]),
+        "discount": 0,
+        "items": [{"desc": rng.choice(PARTS), "qty": rng.randint(1, 3), "price": rng.randrange(500, 9000, 50)}
+                  for _ in range(rng.randint(1, 4))],
+    }
+
+
+def pick_request(scenario, rng, numbers):
+    if scenario == "mix":
+        roll = rng.random()
+        scenario = ("get" if roll < 0.3 else "search" if roll < 0.45 else "stats" if roll < 0.6
+                    else "create" if roll < 0.9 else "pdf")
+    if scenario == "create":
+        return "POST", "/api/v1/invoices", invoice_body(rng)
+    if scenario == "get":
+        return "GET", f"/api/v1/invoices/{rng.choice(numbers)}", None
+    if scenario == "search":
+        return "GET", f"/api/v1/invoices?q={rng.choice(['corolla', 'civic', 'brake', 'abc-1'])}", None
+    if scenario == "stats":
+        return "GET", "/api/v1/stats", None
+    return "GET", f"/api/v1/invoices/{rng.choice(numbers)}/pdf", None
+
+
+async def run_load(port, token, scenario, concurrency, seconds, numbers, seed):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+
+    async def client(index):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + index)
+        conn = Connection(port, token)
+        try:
+            while time.perf_counter() < deadline:
+                method, path, body = pick_request(scenario, rng, numbers)
+                started = time.perf_counter()
+                status, _ = await conn.request(method, path, body)
+                latencies.append(time.perf_counter() - started)
+                if status >= 400:
+                    errors += 1
+        finally:
+            conn.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 3) if ordered else None
+
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else None,
+    }
+
+
+async def seed_invoices(port, token, count):
+    conn = Connection(port, token)
+    rng = random.Random(0)
+    numbers = []
+    try:
+        for _ in range(count):
+            status, data = await conn.request("POST", "/api/v1/invoices", invoice_body(rng))
+            if status != 201:
+                raise RuntimeError(f"seeding failed: {status} {data[:200]!r}")
+            numbers.append(json.loads(data)["invoice_number"])
+    finally:
+        conn.close()
+    return numbers
+
+
+def int_list(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenario", default=",".join(SCENARIOS), help="comma-separated, from: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8, 32], help="comma-separated")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--seed-invoices", type=int, default=200, help="invoices created before measuring")
+    parser.add_argument("--backend", default="sqlite", choices=["sqlite", "json"])
+    parser.add_argument("--pdf-workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8650)
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    os.environ["AUTOINVOICE_SECRET"] = SECRET
+    from autoinvoice.tenants import sign_tenant
+    token = sign_tenant(TENANT)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = start_api(args.port, workdir, args.backend, args.pdf_workers)
+        try:
+            numbers = asyncio.run(seed_invoices(args.port, token, args.seed_invoices))
+            for scenario in [s for s in args.scenario.split(",") if s]:
+                for concurrency in args.concurrency:
+                    result = asyncio.run(run_load(args.port, token, scenario, concurrency, args.seconds,
+                                                  numbers, len(results) + 1))
+                    results.append(result)
+                    print(f"{scenario:>7} c={concurrency:<3} {result['rps']:>8} req/s  "
+                          f"p50 {result['p50_ms']} ms  p99 {result['p99_ms']} ms  errors {result['errors']}",
+                          file=sys.stderr)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    report = {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Invoice commit benchmark on a slow (throttled) disk.
+
+Times the generate path from a reserved invoice number to a confirmed
+invoice - record saved and synced, PDF rendered and archived with fsync -
+in two ways:
+
+    sequential   save + sync the record, then render + write the PDF
+    overlapped   autoinvoice.commit: both at once, confirmed when both are done
+
+A slow shared disk is simulated by adding --fsync-ms of latency to every
+os.fsync() (the journal, the counter, the SQLite WAL and the archived PDF
+all sync through it). Point --dir at a really throttled mount (dm-delay,
+NFS, a cgroup io.max limit) to measure one instead; --fsync-ms 0 adds
+nothing. PDFs render on a thread here so the added latency applies to
+them too; the app renders them in worker processes.
+
+    python benchmarks/bench_commit.py --fsync-ms 0,5,20 --invoices 50
+    python benchmarks/bench_commit.py --backend json --dir /mnt/slow --fsync-ms 0
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_scale import ROOT, synthetic_invoice
+
+os.environ.setdefault("AUTOINVOICE_METRICS", "0")
+
+_real_fsync = os.fsync
+
+
+def throttle_fsync(latency_ms):
+    """Make every os.fsync() take latency_ms longer"""
+    if not latency_ms:
+        os.fsync = _real_fsync
+        return
+
+    def slow_fsync(fd):
+        time.sleep(latency_ms / 1000)
+        return _real_fsync(fd)
+
+    os.fsync = slow_fsync
+
+
+def summary(samples):
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+async def run_mode(mode, storage, profile, invoices, pdf_threads):
+    from autoinvoice.commit import commit_invoice_async, save_durably
+    from autoinvoice.allocator import format_invoice_number
+    from autoinvoice.pdfcache import render_cached
+
+    pdf_dir = os.path.join("invoices", storage.user_id)
+    os.makedirs(pdf_dir, exist_ok=True)
+    samples = []
+    for invoice_data in invoices:
+        started = time.perf_counter()
+        number = format_invoice_number(storage.allocate(1))
+        invoice_data = dict(invoice_data, invoice_number=number)
+        filepath = os.path.join(pdf_dir, f"invoice_{number}.pdf")
+        if mode == "sequential":
+            save_durably(storage, invoice_data)
+            render_cached(invoice_data, profile, filepath)
+        else:
+            pdf = pdf_threads.submit(render_cached, invoice_data, profile, filepath)
+            await commit_invoice_async(storage, invoice_data, pdf)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", default="sqlite", choices=["sqlite", "json"])
+    parser.add_argument("--fsync-ms", default="0,5,20", help="comma-separated added fsync latencies")
+    parser.add_argument("--invoices", type=int, default=50, help="invoices per mode and latency")
+    parser.add_argument("--dir", help="scratch directory on the disk to test (default: a temp dir)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    latencies = [float(v) for v in args.fsync_ms.split(",") if v.strip()]
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.dir) as workdir:
+        os.chdir(workdir)
+        from autoinvoice.backends import get_storage
+        from autoinvoice.engine import merge_profile
+
+        profile = merge_profile({"workshop_name": "Bench Workshop", "phone_number": "0300-0000000",
+                                 "address": "Bench Road"})
+        rng = random.Random(args.seed)
+        pdf_threads = ThreadPoolExecutor(max_workers=1)
+        for point, latency in enumerate(latencies):
+            result = {"fsync_ms": latency}
+            for mode in ("sequential", "overlapped"):
+                user_id = f"ws_{point:08x}{len(mode):08x}"
+                invoices = [synthetic_invoice(rng, 0, user_id, datetime.datetime.now())
+                            for _ in range(args.invoices)]
+                storage = get_storage(user_id, args.backend)
+                # Warm up fonts, templates and the storage before timing
+                asyncio.run(run_mode(mode, storage, profile, invoices[:2], pdf_threads))
+                throttle_fsync(latency)
+                try:
+                    samples = asyncio.run(run_mode(mode, storage, profile, invoices, pdf_threads))
+                finally:
+                    throttle_fsync(0)
+                result[mode] = summary(samples)
+            result["speedup"] = round(result["sequential"]["mean_ms"] / result["overlapped"]["mean_ms"], 2)
+            results.append(result)
+            print(f"fsync +{latency:g} ms: sequential {result['sequential']['mean_ms']} ms, "
+                  f"overlapped {result['overlapped']['mean_ms']} ms ({result['speedup']}x)", file=sys.stderr)
+        pdf_threads.shutdown()
+        os.chdir(ROOT)
+
+    print(json.dumps({
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
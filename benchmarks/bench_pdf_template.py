@@ -0,0 +1,175 @@
+"""
+Microbenchmark: cached InvoiceTemplate vs the original inline FPDF code.
+
+The inline version below is the layout code as it used to live in the
+GENERATE INVOICE PDF button handler. Both paths are checked to produce
+byte-identical PDFs before timing.
+
+    python benchmarks/bench_pdf_template.py --items 8 --runs 300
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fpdf import FPDF
+
+from autoinvoice.pdf import build_invoice_pdf, invalidate_invoice_templates
+
+FIXED_DATE = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+PROFILE = {
+    'workshop_name': 'Auto Care Workshop',
+    'phone_number': '+92-321-7654321',
+    'address': 'Main Road, Karachi',
+}
+
+
+def sample_invoice(item_count):
+    items = [
+        {'desc': f'Replacement part number {i} with fitting', 'qty': 1 + i % 3,
+         'price': 1000.0 + i, 'total': (1 + i % 3) * (1000.0 + i)}
+        for i in range(item_count)
+    ]
+    subtotal = sum(item['total'] for item in items)
+    return {
+        'invoice_number': 'INV-1000',
+        'customer_name': 'Ali Khan',
+        'car_details': 'Toyota Corolla 2018, White, ABC-123',
+        'date': '2025-01-01 10:30:00',
+        'items': items,
+        'subtotal': subtotal,
+        'labor': 1500,
+        'discount': 200,
+        'grand_total': subtotal + 1500 - 200,
+    }
+
+
+def inline_render(invoice_data, profile):
+    """The pre-template handler code, kept verbatim as the baseline"""
+    pdf = FPDF()
+    pdf.add_page()
+
+    pdf.set_font("Arial", 'B', 20)
+    pdf.cell(0, 15, profile['workshop_name'], 0, 1, 'C')
+    pdf.set_font("Arial", '', 12)
+    pdf.cell(0, 8, "Professional Auto Repair Services", 0, 1, 'C')
+
+    pdf.ln(10)
+
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(0, 10, "INVOICE", 0, 1, 'L')
+    pdf.set_font("Arial", '', 11)
+    pdf.cell(0, 7, f"Invoice #: {invoice_data['invoice_number']}", 0, 1)
+    pdf.cell(0, 7, "Date: 01/01/2025", 0, 1)
+
+    pdf.ln(5)
+
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(0, 10, "Customer Details", 0, 1)
+    pdf.set_font("Arial", '', 11)
+    pdf.cell(0, 7, f"Name: {invoice_data['customer_name']}", 0, 1)
+    pdf.cell(0, 7, f"Vehicle: {invoice_data['car_details']}", 0, 1)
+
+    pdf.ln(10)
+
+    pdf.set_font("Arial", 'B', 11)
+    pdf.cell(100, 10, "Description", 1, 0, 'C')
+    pdf.cell(25, 10, "Qty", 1, 0, 'C')
+    pdf.cell(30, 10, "Price (Rs)", 1, 0, 'C')
+    pdf.cell(35, 10, "Total (Rs)", 1, 1, 'C')
+
+    pdf.set_font("Arial", '', 10)
+    for item in invoice_data['items']:
+        desc = item['desc']
+        if len(desc) > 40:
+            desc = desc[:37] + "..."
+
+        pdf.cell(100, 8, desc, 1, 0, 'L')
+        pdf.cell(25, 8, str(item['qty']), 1, 0, 'C')
+        pdf.cell(30, 8, f"{item['price']:,}", 1, 0, 'R')
+        pdf.cell(35, 8, f"{item['total']:,}", 1, 1, 'R')
+
+    pdf.ln(10)
+
+    pdf.set_font("Arial", '', 11)
+    pdf.cell(140, 8, "Subtotal:", 0, 0, 'R')
+    pdf.cell(50, 8, f"Rs {invoice_data['subtotal']:,}", 0, 1, 'R')
+
+    if invoice_data['labor'] > 0:
+        pdf.cell(140, 8, "Labor Charges:", 0, 0, 'R')
+        pdf.cell(50, 8, f"Rs {invoice_data['labor']:,}", 0, 1, 'R')
+
+    if invoice_data['discount'] > 0:
+        pdf.cell(140, 8, "Discount:", 0, 0, 'R')
+        pdf.cell(50, 8, f"- Rs {invoice_data['discount']:,}", 0, 1, 'R')
+
+    pdf.set_font("Arial", 'B', 13)
+    pdf.cell(140, 12, "GRAND TOTAL:", 0, 0, 'R')
+    pdf.cell(50, 12, f"Rs {invoice_data['grand_total']:,}", 0, 1, 'R')
+
+    pdf.ln(15)
+
+    pdf.set_font("Arial", 'I', 9)
+    pdf.cell(0, 6, "Thank you for your business!", 0, 1, 'C')
+
+    if profile['phone_number'] and profile['phone_number'] != '+92-300-1234567':
+        pdf.cell(0, 6, f"Phone: {profile['phone_number']}", 0, 1, 'C')
+
+    pdf.cell(0, 6, profile['workshop_name'], 0, 1, 'C')
+
+    if profile['address']:
+        pdf.set_font("Arial", '', 8)
+        pdf.cell(0, 6, f"Address: {profile['address']}", 0, 1, 'C')
+
+    return pdf
+
+
+def render_bytes(build, invoice_data):
+    pdf = build(invoice_data, PROFILE)
+    pdf.set_creation_date(FIXED_DATE)
+    return bytes(pdf.output())
+
+
+def time_runs(build, invoice_data, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        render_bytes(build, invoice_data)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=300)
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore", DeprecationWarning)
+    invoice_data = sample_invoice(args.items)
+
+    invalidate_invoice_templates()
+    if render_bytes(inline_render, invoice_data) != render_bytes(build_invoice_pdf, invoice_data):
+        print("FAIL: template output differs from the inline layout")
+        return 1
+
+    results = {}
+    for name, build in (("inline", inline_render), ("template", build_invoice_pdf)):
+        time_runs(build, invoice_data, 20)  # warm up
+        samples = time_runs(build, invoice_data, args.runs)
+        results[name] = statistics.median(samples)
+        print(f"{name:>8}: median {results[name]:.3f} ms  "
+              f"p95 {statistics.quantiles(samples, n=20)[-1]:.3f} ms  ({args.items} items)")
+
+    print(f"speedup: {results['inline'] / results['template']:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
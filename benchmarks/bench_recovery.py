@@ -0,0 +1,104 @@
+"""
+Crash recovery benchmark: recovery time against history size.
+
+Generates one synthetic workshop (the bench_scale.py generator: D days
+ending today, K invoices per day), then leaves behind the commit logs of
+--crashed dead processes with --pending unfinished invoices each - half
+with their record saved (completed by recovery), half without (rolled
+back) - and times autoinvoice.commit.recover(). Each history size runs
+in a fresh scratch directory; recovery should take the same time for
+all of them.
+
+    python benchmarks/bench_recovery.py --days 30,365,1095 --per-day 40
+    python benchmarks/bench_recovery.py --backend json --crashed 4 --pending 8
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from bench_scale import ROOT, generate, int_list, synthetic_invoice, user_ids
+
+
+def crashed_logs(storage, crashed, pending, rng):
+    """Write the commit logs of `crashed` dead processes"""
+    from autoinvoice.commit import COMMIT_LOG_DIR, LOCK_SUFFIX, LOG_SUFFIX
+    from autoinvoice.storage import today_key
+
+    os.makedirs(COMMIT_LOG_DIR, exist_ok=True)
+    first = storage.allocate(crashed * pending)
+    for process in range(crashed):
+        name = uuid.uuid4().hex
+        with open(os.path.join(COMMIT_LOG_DIR, name + LOG_SUFFIX), "w", encoding="utf-8") as f:
+            for i in range(pending):
+                number = first + process * pending + i
+                invoice = synthetic_invoice(rng, number, storage.user_id, datetime.datetime.now())
+                if i % 2 == 0:
+                    storage.save_invoice(invoice)
+                f.write(json.dumps({"op": "begin", "id": uuid.uuid4().hex, "backend": storage.name,
+                                    "user": storage.user_id, "number": invoice["invoice_number"],
+                                    "day": today_key(), "pdf": None}) + "\n")
+        open(os.path.join(COMMIT_LOG_DIR, name + LOCK_SUFFIX), "w").close()
+
+
+def run_point(args, days):
+    """One history size in a scratch directory (runs in its own process)"""
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        from autoinvoice.backends import get_storage
+        from autoinvoice.commit import recover
+
+        generate(1, days, args.per_day, args.seed)
+        storage = get_storage(user_ids(1)[0], args.backend)
+        crashed_logs(storage, args.crashed, args.pending, random.Random(args.seed))
+
+        started = time.perf_counter()
+        completed, rolled_back = recover()
+        recover_ms = (time.perf_counter() - started) * 1000
+        os.chdir(ROOT)
+
+    return {
+        "days": days,
+        "invoices": days * args.per_day,
+        "completed": completed,
+        "rolled_back": rolled_back,
+        "recover_ms": round(recover_ms, 3),
+        "per_invoice_ms": round(recover_ms / max(1, completed + rolled_back), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", default="sqlite", choices=["sqlite", "json"])
+    parser.add_argument("--days", type=int_list, default=[30, 365, 1095], help="comma-separated history sizes")
+    parser.add_argument("--per-day", type=int, default=40)
+    parser.add_argument("--crashed", type=int, default=2, help="dead processes left with a commit log")
+    parser.add_argument("--pending", type=int, default=4, help="unfinished invoices in each log")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    results = []
+    for days in args.days:
+        # A fresh process per point: storage registries are process-wide
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(run_point, args, days).result()
+        results.append(result)
+        print(f"{result['invoices']:>8} invoices: recovery {result['recover_ms']} ms "
+              f"({result['completed']} completed, {result['rolled_back']} rolled back)", file=sys.stderr)
+
+    print(json.dumps({
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
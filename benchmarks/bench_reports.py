@@ -0,0 +1,126 @@
+"""
+Reporting benchmark over a multi-year history.
+
+Generates one synthetic workshop (the bench_scale.py generator: D days
+ending today, K invoices per day) in a scratch directory and times the
+reporting engine:
+
+    cold_load       first report: every record loaded into the frames
+    all_time        cached all-time report (no change since)
+    ranges          uncached reports over random date ranges
+    after_save      report after one new invoice: only today is reloaded
+    loop_baseline   the same all-time breakdowns as a plain Python loop
+                    over iter_invoices(), for comparison
+
+Results are printed as JSON. Streamlit is not imported.
+
+    python benchmarks/bench_reports.py --days 1095 --per-day 40
+    python benchmarks/bench_reports.py --backend json --days 365 --per-day 200
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from bench_scale import ROOT, generate, synthetic_invoice, user_ids
+
+
+def timed_ms(fn):
+    started = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def summary(samples):
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+def loop_report(storage):
+    """The breakdowns the engine computes, as one pass of Python over the records"""
+    monthly, parts, makes = {}, {}, {}
+    for day, record in storage.iter_invoices():
+        month = monthly.setdefault(day[:7], [0, 0.0])
+        month[0] += 1
+        month[1] += record.get("grand_total", 0)
+        words = record.get("car_details", "").split()
+        make = words[0].title() if words else "Unknown"
+        makes[make] = makes.get(make, 0) + record.get("grand_total", 0)
+        for item in record.get("items", []):
+            key = item.get("desc", "").strip().lower()
+            parts[key] = parts.get(key, 0) + item.get("qty", 0)
+    return monthly, sorted(parts.items(), key=lambda kv: -kv[1])[:10], makes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", default="sqlite", choices=["sqlite", "json"])
+    parser.add_argument("--days", type=int, default=3 * 365)
+    parser.add_argument("--per-day", type=int, default=40)
+    parser.add_argument("--ranges", type=int, default=50, help="random date ranges to time")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        from autoinvoice.backends import get_storage
+        from autoinvoice.reports import get_report
+
+        started = time.perf_counter()
+        generate(1, args.days, args.per_day, args.seed)
+        generate_seconds = time.perf_counter() - started
+
+        user_id = user_ids(1)[0]
+        open_ms, storage = timed_ms(lambda: get_storage(user_id, args.backend))
+        # Builds the search index on first use; not part of the reports
+        index_ms, _ = timed_ms(lambda: storage.invoice_changes())
+
+        cold_ms, report = timed_ms(lambda: get_report(storage))
+        cached = [timed_ms(lambda: get_report(storage))[0] for _ in range(100)]
+
+        rng = random.Random(args.seed)
+        today = datetime.date.today()
+        ranges = []
+        for _ in range(args.ranges):
+            a, b = sorted(rng.sample(range(args.days), 2))
+            start = (today - datetime.timedelta(days=b)).isoformat()
+            end = (today - datetime.timedelta(days=a)).isoformat()
+            ranges.append(timed_ms(lambda: get_report(storage, start, end))[0])
+
+        after_save = []
+        for i in range(20):
+            invoice = synthetic_invoice(rng, 900000 + i, user_id, datetime.datetime.now())
+            storage.save_invoice(invoice)
+            after_save.append(timed_ms(lambda: get_report(storage))[0])
+
+        loop_ms, _ = timed_ms(lambda: loop_report(storage))
+        os.chdir(ROOT)
+
+    result = {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "invoices": report["invoices"],
+        "generate_seconds": round(generate_seconds, 3),
+        "open_ms": round(open_ms, 3),
+        "index_ms": round(index_ms, 3),
+        "cold_load_ms": round(cold_ms, 3),
+        "all_time": summary(cached),
+        "ranges": summary(ranges),
+        "after_save": summary(after_save),
+        "loop_baseline_ms": round(loop_ms, 3),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Per-interaction script cost of the Streamlit app.
+
+Starts `streamlit run` on a scratch data directory, connects to it over the
+same websocket the browser uses and replays a typical editing session:
+typing the customer name, typing an item, adding it, changing labor and
+removing the item. For each interaction it reports the server-side script
+(or fragment) run time, the round trip until the run finished and the
+websocket payload the server sent back.
+
+    python benchmarks/bench_reruns.py
+    python benchmarks/bench_reruns.py --app /path/to/older/app.py --rounds 20
+
+Run it against two versions of app.py to compare layouts.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from tornado.ioloop import IOLoop
+from tornado.websocket import websocket_connect
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DONE_STATUSES = (
+    ForwardMsg.FINISHED_SUCCESSFULLY,
+    ForwardMsg.FINISHED_WITH_COMPILE_ERROR,
+    ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+)
+
+# (name, widget label, value) - None clicks a button
+SESSION = [
+    ("type customer", "**Customer Name**", "Ali Raza"),
+    ("type item", "Description", "Brake pads"),
+    ("add item", "➕ **Add Item**", None),
+    ("change labor", "**Labor Charges (Rs)**", 2000),
+    ("remove item", "🗑️", None),
+    ("reset labor", "**Labor Charges (Rs)**", 1500),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app_path, port, workdir, extra_env=None):
+    env = dict(os.environ, PYTHONPATH=ROOT, AUTOINVOICE_PDF_WORKERS="0", **(extra_env or {}))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", app_path,
+         "--server.headless", "true",
+         "--server.port", str(port),
+         "--server.enableXsrfProtection", "false",
+         "--server.enableWebsocketCompression", "false",
+         "--server.fileWatcherType", "none",
+         # only so the server reports each run's exec time; nothing leaves the host
+         "--browser.gatherUsageStats", "true"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1)
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("streamlit did not start")
+
+
+class Session:
+    """Minimal browser: tracks widgets and replays interactions"""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.widgets = {}  # label -> (kind, id, fragment_id)
+        self.values = {}  # widget id -> (kind, value)
+
+    async def rerun(self, trigger=None, fragment_id=""):
+        msg = BackMsg()
+        state = msg.rerun_script
+        state.fragment_id = fragment_id
+        for widget_id, (kind, value) in self.values.items():
+            w = state.widget_states.widgets.add()
+            w.id = widget_id
+            if kind == "int":
+                w.int_value = value
+            elif kind == "float":
+                w.double_value = value
+            else:
+                w.string_value = value
+        if trigger:
+            w = state.widget_states.widgets.add()
+            w.id = trigger
+            w.trigger_value = True
+
+        started = time.perf_counter()
+        await self.ws.write_message(msg.SerializeToString(), binary=True)
+
+        script_time = payload = messages = 0
+        while True:
+            raw = await self.ws.read_message()
+            if raw is None:
+                raise RuntimeError("websocket closed")
+            fwd = ForwardMsg()
+            fwd.ParseFromString(raw)
+            kind = fwd.WhichOneof("type")
+            if kind == "page_profile":
+                # Telemetry a normal deployment would not send
+                script_time += fwd.page_profile.exec_time / 1e6
+                continue
+            payload += len(raw)
+            messages += 1
+            if kind == "delta":
+                self._track(fwd.delta)
+            elif kind == "script_finished" and fwd.script_finished in DONE_STATUSES:
+                return script_time, time.perf_counter() - started, payload, messages
+
+    def _track(self, delta):
+        if delta.WhichOneof("type") != "new_element":
+            return
+        element = getattr(delta.new_element, delta.new_element.WhichOneof("type"))
+        label = getattr(element, "label", None)
+        if label and getattr(element, "id", None):
+            kind = type(element).__name__
+            if kind == "NumberInput":
+                kind = "float" if element.data_type == element.FLOAT else "int"
+            self.widgets[label] = (kind, element.id, delta.fragment_id)
+
+    async def interact(self, label, value):
+        kind, widget_id, fragment_id = self.widgets[label]
+        if value is None:
+            return await self.rerun(trigger=widget_id, fragment_id=fragment_id)
+        self.values[widget_id] = (kind if kind in ("int", "float") else "str", value)
+        return await self.rerun(fragment_id=fragment_id)
+
+
+async def run_session(port, rounds):
+    ws = await websocket_connect(f"ws://127.0.0.1:{port}/_stcore/stream",
+                                 subprotocols=["streamlit"], max_message_size=64 * 1024 * 1024)
+    session = Session(ws)
+    first = await session.rerun()
+    results = {name: [] for name, _, _ in SESSION}
+    for _ in range(rounds):
+        for name, label, value in SESSION:
+            results[name].append(await session.interact(label, value))
+    ws.close()
+    return first, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--app", default=os.path.join(ROOT, "app.py"))
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = start_server(os.path.abspath(args.app), port, workdir)
+        try:
+            first, results = IOLoop.current().run_sync(lambda: run_session(port, args.rounds))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    print(f"{args.app}  ({args.rounds} rounds, medians)")
+    print(f"{'interaction':<16}{'script ms':>10}{'trip ms':>10}{'bytes':>10}{'msgs':>8}")
+    for name, samples in [("first load", [first])] + list(results.items()):
+        print(f"{name:<16}"
+              f"{statistics.median(s[0] for s in samples) * 1000:>10.1f}"
+              f"{statistics.median(s[1] for s in samples) * 1000:>10.1f}"
+              f"{statistics.median(s[2] for s in samples):>10.0f}"
+              f"{statistics.median(s[3] for s in samples):>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Scale benchmark for storage, statistics and PDF rendering.
+
+Generates synthetic workshops - N users, D days ending today, K invoices
+per day - in the data/users/<shard>/<id>/ journal layout inside a scratch
+directory, then times the storage calls behind the app's functions:
+
+    today_stats      get_today_statistics()
+    range_totals     get_all_time_statistics()
+    save_invoice     save_invoice_data()
+    peek_counter     get_user_invoice_counter()
+    render_pdf       invoice PDF generation
+
+Every data size runs in a fresh process. The first call of each operation
+is reported separately as `cold_ms` (it may build rollups or the search
+index); the rest give p50/p95/mean latency and throughput. The sqlite
+backend imports the generated files on first open, reported as
+`open_seconds`. Results are printed as JSON. Streamlit is not imported.
+
+    python benchmarks/bench_scale.py --users 5 --days 30 --per-day 10,100,500
+    python benchmarks/bench_scale.py --backend json --ops 500 --out scale.json
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PARTS = ["Brake pads", "Oil filter", "Engine oil 4L", "Air filter", "Spark plugs",
+         "AC gas refill", "Clutch plate", "Battery 12V", "Wiper blades", "Tyre rotation"]
+CARS = ["Toyota Corolla", "Honda Civic", "Suzuki Alto", "Suzuki Cultus", "Kia Sportage"]
+
+
+def user_ids(count):
+    return [f"user_bench{i:03d}" for i in range(count)]
+
+
+def synthetic_invoice(rng, number, user_id, when):
+    from autoinvoice.engine import make_line_item, build_invoice_data
+
+    items = [make_line_item(rng.choice(PARTS), rng.randint(1, 4), rng.randrange(500, 20000, 50))
+             for _ in range(rng.randint(1, 8))]
+    return build_invoice_data(
+        f"INV-{number:04d}",
+        f"Customer {rng.randint(1, 5000)}",
+        f"{rng.choice(CARS)} {rng.randint(2005, 2024)}, ABC-{rng.randint(100, 999)}",
+        items,
+        rng.choice([1000, 1500, 2000, 3000]),
+        rng.choice([0, 0, 0, 500]),
+        user_id,
+        "Bench Workshop",
+        when,
+    )
+
+
+def generate(users, days, per_day, seed):
+    """Write day journals and counters for every user under ./data/users"""
+    from autoinvoice.backends import user_data_dir
+    from autoinvoice.storage import encode_record
+
+    rng = random.Random(seed)
+    today = datetime.datetime.now().replace(hour=10, minute=0, second=0, microsecond=0)
+    for user_id in user_ids(users):
+        data_dir = user_data_dir(user_id)
+        os.makedirs(data_dir, exist_ok=True)
+        number = 1000
+        for back in range(days - 1, -1, -1):
+            when = today - datetime.timedelta(days=back)
+            day = when.strftime("%Y-%m-%d")
+            with open(os.path.join(data_dir, f"invoices_{day}.jsonl"), "w", encoding="utf-8") as f:
+                for _ in range(per_day):
+                    f.write(encode_record(synthetic_invoice(rng, number, user_id, when)))
+                    number += 1
+        with open(os.path.join(data_dir, "invoice_counter.json"), "w") as f:
+            json.dump({"counter": number}, f)
+
+
+def measure(fn, ops):
+    """Cold first call, then `ops` timed calls"""
+    started = time.perf_counter()
+    fn(0)
+    cold = time.perf_counter() - started
+
+    samples = []
+    for i in range(1, ops + 1):
+        started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - started)
+
+    ordered = sorted(samples)
+    return {
+        "cold_ms": round(cold * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "ops_per_sec": round(len(samples) / sum(samples), 1) if sum(samples) else None,
+    }
+
+
+def run_point(args):
+    """One data size in a scratch directory (runs in its own process)"""
+    backend, users, days, per_day, ops, pdf_ops, seed = args
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+
+        from autoinvoice.backends import get_storage
+        from autoinvoice.engine import DEFAULT_PROFILE
+        from autoinvoice.pdf import render_invoice_bytes
+
+        started = time.perf_counter()
+        generate(users, days, per_day, seed)
+        generate_seconds = time.perf_counter() - started
+
+        ids = user_ids(users)
+        started = time.perf_counter()
+        storages = [get_storage(user_id, backend) for user_id in ids]
+        open_seconds = time.perf_counter() - started
+
+        def pick(i):
+            return storages[i % len(storages)]
+
+        rng = random.Random(seed + 1)
+        now = datetime.datetime.now()
+        new_invoices = [synthetic_invoice(rng, 900000 + i, ids[i % len(ids)], now) for i in range(ops + 1)]
+
+        results = {
+            "today_stats": measure(lambda i: pick(i).today_stats(), ops),
+            "range_totals": measure(lambda i: pick(i).range_totals(), ops),
+            "peek_counter": measure(lambda i: pick(i).peek_counter(), ops),
+            "save_invoice": measure(lambda i: pick(i).save_invoice(new_invoices[i]), ops),
+        }
+        if pdf_ops:
+            results["render_pdf"] = measure(
+                lambda i: render_invoice_bytes(new_invoices[i % len(new_invoices)], DEFAULT_PROFILE),
+                pdf_ops,
+            )
+
+        os.chdir(ROOT)
+        return {
+            "backend": backend,
+            "users": users,
+            "days": days,
+            "per_day": per_day,
+            "invoices": users * days * per_day,
+            "generate_seconds": round(generate_seconds, 3),
+            "open_seconds": round(open_seconds, 3),
+            "ops": results,
+        }
+
+
+def int_list(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", default="both", choices=["sqlite", "json", "both"])
+    parser.add_argument("--users", type=int_list, default=[5], help="comma-separated, e.g. 1,10,50")
+    parser.add_argument("--days", type=int_list, default=[30], help="comma-separated")
+    parser.add_argument("--per-day", type=int_list, default=[10, 50, 200], help="comma-separated")
+    parser.add_argument("--ops", type=int, default=200, help="timed calls per operation")
+    parser.add_argument("--pdf-ops", type=int, default=30, help="timed PDF renders (0 to skip)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    backends = ["sqlite", "json"] if args.backend == "both" else [args.backend]
+    points = [(b, u, d, k, args.ops, args.pdf_ops, args.seed)
+              for b in backends for u in args.users for d in args.days for k in args.per_day]
+
+    results = []
+    for point in points:
+        # A fresh process per point: storage registries are process-wide
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(run_point, point).result()
+        results.append(result)
+        print(f"{result['backend']:>6} users={result['users']} days={result['days']} "
+              f"per_day={result['per_day']} invoices={result['invoices']}: "
+              f"today p50 {result['ops']['today_stats']['p50_ms']} ms, "
+              f"save p50 {result['ops']['save_invoice']['p50_ms']} ms", file=sys.stderr)
+
+    report = {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
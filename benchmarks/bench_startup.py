@@ -0,0 +1,123 @@
+"""
+Cold start and time to first render of the Streamlit app.
+
+For each setting it starts a fresh `streamlit run` on an empty data
+directory and reports:
+
+    server_ready   process start until /_stcore/health answers
+    first_render   process start until the first page run finished
+                   (the time to first render of a new container)
+    page_script    server-side run time of that first page
+    first_pdf      server-side run time of the first "Generate" click,
+                   which renders the PDF inline (AUTOINVOICE_PDF_WORKERS=0)
+
+Between the first paint and the click the session fills in the form and
+waits --think seconds, like a user would; that is the window the
+background warm-up has to load fpdf. It also reports how long a bare
+interpreter needs to import the modules app.py imports.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 5 --target-ms 1500
+
+Exits with status 1 when the median first_render with warm-up exceeds
+--target-ms.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from tornado.ioloop import IOLoop
+from tornado.websocket import websocket_connect
+
+from bench_reruns import ROOT, Session, free_port, start_server
+
+IMPORT_PROBE = (
+    "import sys, time; started = time.perf_counter(); "
+    "import autoinvoice.backends, autoinvoice.cache, autoinvoice.engine, autoinvoice.allocator, "
+    "autoinvoice.pdf, autoinvoice.jobs, autoinvoice.metrics, autoinvoice.warmup; "
+    "print(time.perf_counter() - started, 'fpdf' in sys.modules)"
+)
+
+FORM = [
+    ("**Customer Name**", "Ali Raza"),
+    ("**Vehicle Details**", "Toyota Corolla 2018, ABC-123"),
+    ("Description", "Brake pads"),
+    ("➕ **Add Item**", None),
+]
+GENERATE = "📄 **GENERATE INVOICE PDF**"
+
+
+def import_cost():
+    """Seconds a fresh interpreter spends importing the app's modules"""
+    out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=ROOT, env=dict(os.environ, PYTHONPATH=ROOT),
+                         check=True, capture_output=True, text=True).stdout.split()
+    return float(out[0]), out[1] == "True"
+
+
+async def first_session(port, think):
+    ws = await websocket_connect(f"ws://127.0.0.1:{port}/_stcore/stream",
+                                 subprotocols=["streamlit"], max_message_size=64 * 1024 * 1024)
+    session = Session(ws)
+    page_script, _, _, _ = await session.rerun()
+    rendered = time.perf_counter()
+
+    for label, value in FORM:
+        await session.interact(label, value)
+    time.sleep(max(0.0, think - (time.perf_counter() - rendered)))
+    pdf_script, _, _, _ = await session.interact(GENERATE, None)
+    ws.close()
+    return rendered, page_script, pdf_script
+
+
+def run_once(app_path, warmup, think):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        proc = start_server(app_path, port, workdir, {"AUTOINVOICE_WARMUP": "1" if warmup else "0"})
+        ready = time.perf_counter()
+        try:
+            rendered, page_script, pdf_script = IOLoop.current().run_sync(lambda: first_session(port, think))
+        finally:
+            proc.terminate()
+            proc.wait()
+    return {
+        "server_ready": ready - started,
+        "first_render": rendered - started,
+        "page_script": page_script,
+        "first_pdf": pdf_script,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--app", default=os.path.join(ROOT, "app.py"))
+    parser.add_argument("--runs", type=int, default=3, help="server starts per setting")
+    parser.add_argument("--think", type=float, default=2.0, help="seconds between first paint and Generate")
+    parser.add_argument("--target-ms", type=float, default=2000.0, help="first_render budget with warm-up")
+    args = parser.parse_args()
+
+    seconds, fpdf_loaded = import_cost()
+    print(f"module imports: {seconds * 1000:.0f} ms (fpdf imported: {'yes' if fpdf_loaded else 'no'})")
+
+    app_path = os.path.abspath(args.app)
+    medians = {}
+    print(f"{'setting':<12}{'ready ms':>10}{'first render':>14}{'page script':>13}{'first pdf':>11}")
+    for warmup in (False, True):
+        runs = [run_once(app_path, warmup, args.think) for _ in range(args.runs)]
+        row = {key: statistics.median(r[key] for r in runs) * 1000 for key in runs[0]}
+        medians[warmup] = row
+        print(f"{'warm-up' if warmup else 'no warm-up':<12}{row['server_ready']:>10.0f}{row['first_render']:>14.0f}"
+              f"{row['page_script']:>13.1f}{row['first_pdf']:>11.1f}")
+
+    first_render = medians[True]["first_render"]
+    verdict = "OK" if first_render <= args.target_ms else "OVER BUDGET"
+    print(f"time to first render {first_render:.0f} ms (target {args.target_ms:.0f} ms): {verdict}")
+    sys.exit(0 if verdict == "OK" else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Multi-process stress test for the invoice number allocator.
+
+Spawns several processes that all allocate numbers for the same user at
+the same time and checks that the union of what they received has no
+duplicates and no gaps. Exits non-zero on failure.
+
+    python benchmarks/stress_allocator.py --backend sqlite --procs 8 --per-proc 500
+    python benchmarks/stress_allocator.py --backend json --block 10
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+USER_ID = "stress_user"
+
+
+def worker(args):
+    workdir, backend, count, block_size, start_event = args
+    os.chdir(workdir)
+
+    from autoinvoice.backends import get_storage
+    from autoinvoice.allocator import InvoiceNumberAllocator
+
+    allocator = InvoiceNumberAllocator(get_storage(USER_ID, backend), block_size)
+    start_event.wait()
+    return [allocator.take() for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", default="sqlite", choices=["sqlite", "json"])
+    parser.add_argument("--procs", type=int, default=8)
+    parser.add_argument("--per-proc", type=int, default=250)
+    parser.add_argument("--block", type=int, default=1, help="numbers reserved per storage round trip")
+    args = parser.parse_args()
+
+    # Whole blocks only, so an honest run leaves no gaps
+    per_proc = -(-args.per_proc // args.block) * args.block
+
+    with tempfile.TemporaryDirectory() as workdir:
+        manager = multiprocessing.Manager()
+        start_event = manager.Event()
+
+        with multiprocessing.Pool(args.procs) as pool:
+            jobs = pool.map_async(worker, [
+                (workdir, args.backend, per_proc, args.block, start_event)
+                for _ in range(args.procs)
+            ])
+            time.sleep(0.5)  # let every worker reach the start line
+            started = time.perf_counter()
+            start_event.set()
+            results = jobs.get()
+            elapsed = time.perf_counter() - started
+
+    numbers = sorted(n for result in results for n in result)
+    expected = list(range(numbers[0], numbers[0] + len(numbers)))
+    duplicates = len(numbers) - len(set(numbers))
+    missing = sorted(set(expected) - set(numbers))
+
+    print(f"backend={args.backend} procs={args.procs} per_proc={per_proc} block={args.block}")
+    print(f"allocated {len(numbers)} numbers in {elapsed:.3f}s "
+          f"({len(numbers) / elapsed:,.0f}/s), range {numbers[0]}..{numbers[-1]}")
+    print(f"duplicates={duplicates} gaps={len(missing)}")
+
+    if duplicates or missing or numbers != expected:
+        print("FAIL")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
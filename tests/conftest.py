@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory: every store path is relative to it"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("AUTOINVOICE_SECRET", "tests")
+    return tmp_path
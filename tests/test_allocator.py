@@ -0,0 +1,38 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from autoinvoice.allocator import InvoiceNumberAllocator
+from autoinvoice.backends import get_storage
+
+PROCESSES = 4
+THREADS = 4
+PER_SESSION = 25
+
+
+def take_numbers(workdir, user_id, backend, block_size):
+    # One process's sessions, each with its own allocator
+    os.chdir(workdir)
+    storage = get_storage(user_id, backend)
+
+    def session(_):
+        allocator = InvoiceNumberAllocator(storage, block_size)
+        return [allocator.take() for _ in range(PER_SESSION)]
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        return [n for numbers in pool.map(session, range(THREADS)) for n in numbers]
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "json"])
+@pytest.mark.parametrize("block_size", [1, 5])
+def test_concurrent_allocators_never_share_or_skip(workdir, backend, block_size):
+    user_id = f"ws_{backend.encode().hex():b>15}{block_size}"
+    with ProcessPoolExecutor(PROCESSES) as pool:
+        jobs = [pool.submit(take_numbers, str(workdir), user_id, backend, block_size) for _ in range(PROCESSES)]
+        numbers = [n for job in jobs for n in job.result()]
+
+    total = PROCESSES * THREADS * PER_SESSION
+    assert len(set(numbers)) == len(numbers) == total
+    assert sorted(numbers) == list(range(1000, 1000 + total))
+    assert get_storage(user_id, backend).peek_counter() == 1000 + total
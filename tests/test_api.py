@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from autoinvoice.api import ApiError, parse_invoice_request
+
+
+def body(**fields):
+    data = {"customer_name": "Ali", "car_details": "Honda Civic",
+            "items": [{"desc": "Oil", "qty": 2, "price": 2500}]}
+    data.update(fields)
+    return json.dumps(data).encode()
+
+
+def test_parse_invoice_request():
+    customer_name, car_details, items, labor, discount = parse_invoice_request(body(labor=1000))
+    assert (customer_name, car_details, labor, discount) == ("Ali", "Honda Civic", 1000, 0)
+    assert items[0].qty == 2
+
+
+@pytest.mark.parametrize("fields", [
+    {"labor": True},
+    {"discount": False},
+    {"labor": -1},
+    {"items": [{"desc": "Oil", "qty": True, "price": 2500}]},
+    {"items": [{"desc": "Oil", "qty": 1.5, "price": 2500}]},
+    {"items": [{"desc": "Oil", "qty": 0, "price": 2500}]},
+    {"items": [{"desc": "Oil", "qty": 1, "price": True}]},
+    {"items": [{"desc": "Oil", "qty": 1, "price": -5}]},
+    {"items": [{"desc": "Oil", "qty": 1, "price": float("inf")}]},
+    {"items": [{"desc": "Oil", "qty": float("nan"), "price": 2500}]},
+    {"labor": float("inf")},
+    {"discount": float("nan")},
+])
+def test_parse_invoice_request_rejects(fields):
+    with pytest.raises(ApiError) as e:
+        parse_invoice_request(body(**fields))
+    assert e.value.status_code == 400
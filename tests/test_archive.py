@@ -0,0 +1,22 @@
+import pytest
+
+from autoinvoice.backends import get_storage
+
+from test_export import save
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "json"])
+def test_rearchive_keeps_late_record(workdir, backend):
+    storage = get_storage(f"ws_{backend.encode().hex():a>16}", backend)
+    save(storage, "INV-1000", "2025-01-10")
+    assert storage.archive_before("2025-02-01") == ["2025-01-10"]
+
+    # Saved to the day after it was archived, e.g. by a merge
+    save(storage, "INV-1001", "2025-01-10")
+    assert storage.archive_before("2025-02-01") == ["2025-01-10"]
+    # Run again after a partial archive: nothing is added twice
+    assert storage.archive.add({"2025-01-10": [storage.find_invoice("INV-1000", "2025-01-10")]})
+
+    numbers = [invoice["invoice_number"] for _, invoice in storage.iter_invoices()]
+    assert numbers == ["INV-1000", "INV-1001"]
+    assert storage.range_totals()["count"] == 2
@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from autoinvoice.batch import BatchInputError, read_jobs
+
+
+def test_read_jobs(workdir):
+    path = workdir / "jobs.csv"
+    path.write_text("job,customer_name,car_details,labor,discount,desc,qty,price\n"
+                    "1,Ali,Civic,1500,0,Oil,2,2500\n"
+                    "1,Ali,Civic,1500,0,Filter,1,800.5\n")
+    jobs = read_jobs(str(path))
+    assert len(jobs) == 1
+    assert [(i.qty, i.price) for i in jobs[0]['items']] == [(2, 2500), (1, 800.5)]
+
+
+def test_read_jobs_reports_every_bad_row(workdir):
+    path = workdir / "jobs.csv"
+    path.write_text("job,customer_name,car_details,labor,discount,desc,qty,price\n"
+                    "1,Ali,Civic,1500,0,Oil,2.7,2500\n"
+                    "2,Bo,Corolla,-5,0,Oil,1,2500\n"
+                    "3,Cy,City,1500,0,Oil,1,-100\n"
+                    "4,Di,Alto,1500,0,Oil,1,abc\n")
+    with pytest.raises(BatchInputError) as e:
+        read_jobs(str(path))
+    assert [line.split(":")[0] for line in str(e.value).splitlines()] == ["line 2", "line 3", "line 4", "line 5"]
+
+
+def test_read_jsonl_jobs_rejects_booleans(workdir):
+    path = workdir / "jobs.jsonl"
+    path.write_text(json.dumps({"customer_name": "Ali", "car_details": "Civic", "labor": True,
+                                "items": [{"desc": "Oil", "qty": 1, "price": 2500}]}) + "\n")
+    with pytest.raises(BatchInputError, match="line 1"):
+        read_jobs(str(path))
@@ -0,0 +1,62 @@
+import threading
+
+from autoinvoice import storage
+from autoinvoice.cache import LruRegistry
+
+
+class Entry:
+    def __init__(self, name):
+        self.name = name
+
+
+def test_registry_evicts_least_recently_used():
+    evicted = []
+    registry = LruRegistry(max_entries=2, on_evict=evicted.append)
+    a = registry.get("a", lambda: Entry("A"))
+    registry.get("b", lambda: Entry("B"))
+    registry.get("a", lambda: Entry("not created"))
+    c = registry.get("c", lambda: Entry("C"))
+    assert [e.name for e in evicted] == ["B"]
+    del evicted[:]
+    assert registry.values() == [a, c]
+
+
+def test_evicted_entry_still_held_is_reused():
+    registry = LruRegistry(max_entries=1)
+    held = registry.get("a", lambda: Entry("A"))
+    registry.get("b", lambda: Entry("B"))
+    assert registry.get("a", lambda: Entry("second A")) is held
+
+
+def test_slow_create_does_not_block_other_keys():
+    registry = LruRegistry()
+    started, release = threading.Event(), threading.Event()
+    made = []
+
+    def slow():
+        started.set()
+        release.wait(5)
+        made.append("slow")
+        return Entry("slow")
+
+    threads = [threading.Thread(target=registry.get, args=("slow", slow)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    assert registry.get("fast", lambda: Entry("fast")).name == "fast"
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert made == ["slow"]
+
+
+def test_evicted_journal_is_closed(workdir, monkeypatch):
+    monkeypatch.setattr(storage, "_journals", LruRegistry(max_entries=1, on_evict=storage.InvoiceJournal.close))
+    journal = storage.get_journal("data/a")
+    journal.append({"invoice_number": "INV-1000"}, "2025-01-10")
+    assert journal._handle is not None
+
+    storage.get_journal("data/b")
+    assert journal._handle is None
+    assert storage.get_journal("data/a") is journal
+    assert [r["invoice_number"] for r in journal.read_day("2025-01-10")] == ["INV-1000"]
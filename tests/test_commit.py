@@ -0,0 +1,151 @@
+import asyncio
+import os
+from concurrent.futures import Future
+
+import pytest
+
+from autoinvoice.backends import try_file_lock
+from autoinvoice.commit import (
+    COMPLETED, LOCK_SUFFIX, ROLLED_BACK, CommitLog, commit_invoice_async, read_log, recover
+)
+
+
+def test_commit_log_is_locked_under_its_name(workdir):
+    directory = str(workdir / "commits")
+    log = CommitLog(directory)
+    assert sorted(os.listdir(directory)) == [log.name + ".jsonl", log.name + LOCK_SUFFIX]
+    assert try_file_lock(log.lock_path) is None
+
+    # A live process's log is never recovered
+    assert recover(directory) == (0, 0)
+    assert os.path.exists(log.lock_path)
+
+    log.close()
+    assert os.listdir(directory) == []
+
+
+def test_failed_batch_is_rolled_back(workdir, monkeypatch):
+    from autoinvoice import batch
+    from autoinvoice.backends import get_storage, user_invoices_dir
+
+    user_id = "ws_00000000000ba7c4"
+    storage = get_storage(user_id)
+    monkeypatch.setattr(batch, "ARCHIVE_PDFS", True)
+
+    def fail(invoices, day=None):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(storage, "save_invoices", fail)
+    jobs = [{"customer_name": "Ali", "car_details": "Honda Civic", "labor": 1500, "discount": 0,
+             "items": [batch.make_line_item("Oil", 1, 2500)]}] * 2
+    with pytest.raises(OSError):
+        batch.run_batch(jobs, user_id, str(workdir / "out.zip"), workers=1)
+
+    # The PDFs archived for the unsaved records are removed; the numbers stay used
+    assert os.listdir(user_invoices_dir(user_id)) == []
+    assert storage.peek_counter() == 1002
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "json"])
+def test_recovery_skips_number_whose_counter_bump_was_lost(workdir, backend):
+    from autoinvoice.backends import get_storage
+
+    user_id = f"ws_{backend.encode().hex():c>16}"
+    storage = get_storage(user_id, backend)
+    assert storage.allocate(1) == 1000
+    directory = str(workdir / "commits")
+    log = CommitLog(directory)
+    log.begin(storage, "INV-1000")
+    log._owner.close()
+
+    # The crash lost the counter bump but not the "begin" line
+    storage.set_counter(1000)
+    assert recover(directory) == (0, 1)
+    assert storage.peek_counter() == 1001
+
+
+def commit_scenario(storage, invoice_data, pdf, day, fail_pdf=False):
+    """Run commit_invoice_async, finishing the PDF only once the record is saved"""
+    async def run():
+        task = asyncio.ensure_future(commit_invoice_async(storage, invoice_data, pdf, day))
+        for _ in range(200):
+            if storage.find_invoice(invoice_data["invoice_number"], day) is not None:
+                break
+            await asyncio.sleep(0.01)
+        # The record is on disk while the PDF is still being written
+        assert not task.done()
+        if fail_pdf:
+            pdf.set_exception(OSError("disk full"))
+        else:
+            pdf.set_result(b"%PDF")
+        return await task
+
+    return asyncio.run(run())
+
+
+def invoice_record(number, user_id):
+    from autoinvoice.models import Invoice, LineItem
+
+    items = [LineItem.from_rupees("Oil", 2, 2500)]
+    return Invoice(number, "Ali", "Honda Civic", items, labor=1500, user_id=user_id).to_dict()
+
+
+def test_record_is_saved_while_pdf_renders(workdir):
+    from autoinvoice.backends import get_storage
+
+    storage = get_storage("ws_0000000000a57c01")
+    log = CommitLog(str(workdir / "commits"))
+    invoice_commit = log.begin(storage, "INV-1000", str(workdir / "INV-1000.pdf"), "2025-01-10")
+    pdf = Future()
+    invoice_commit.watch_pdf(pdf)
+
+    data = invoice_record("INV-1000", storage.user_id)
+    assert commit_scenario(storage, data, pdf, "2025-01-10") == b"%PDF"
+    assert invoice_commit.record_saved() == COMPLETED
+    assert read_log(log.path) == []
+
+
+def test_failed_pdf_after_saved_record_completes_on_abort(workdir):
+    from autoinvoice.backends import get_storage
+
+    storage = get_storage("ws_0000000000a57c02")
+    log = CommitLog(str(workdir / "commits"))
+    filepath = str(workdir / "INV-1000.pdf")
+    invoice_commit = log.begin(storage, "INV-1000", filepath, "2025-01-10")
+    pdf = Future()
+    invoice_commit.watch_pdf(pdf)
+
+    data = invoice_record("INV-1000", storage.user_id)
+    with pytest.raises(OSError):
+        commit_scenario(storage, data, pdf, "2025-01-10", fail_pdf=True)
+    # The record reached disk, so the invoice stands and its PDF is written again
+    assert invoice_commit.abort() == COMPLETED
+    assert storage.find_invoice("INV-1000", "2025-01-10") == data
+    with open(filepath, "rb") as f:
+        assert f.read(4) == b"%PDF"
+    assert read_log(log.path) == []
+
+
+def test_failed_save_rolls_back_on_abort(workdir, monkeypatch):
+    from autoinvoice.backends import get_storage
+
+    storage = get_storage("ws_0000000000a57c03")
+    log = CommitLog(str(workdir / "commits"))
+    filepath = str(workdir / "INV-1000.pdf")
+    invoice_commit = log.begin(storage, "INV-1000", filepath, "2025-01-10")
+    pdf = Future()
+    invoice_commit.watch_pdf(pdf)
+
+    def fail(invoice_data, day=None):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(storage, "save_invoice", fail)
+    # The PDF was written, but its record never was
+    with open(filepath, "wb") as f:
+        f.write(b"%PDF")
+    pdf.set_result(b"%PDF")
+    with pytest.raises(OSError):
+        asyncio.run(commit_invoice_async(storage, invoice_record("INV-1000", storage.user_id), pdf, "2025-01-10"))
+    assert invoice_commit.abort() == ROLLED_BACK
+    assert not os.path.exists(filepath)
+    assert read_log(log.path) == []
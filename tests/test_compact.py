@@ -0,0 +1,25 @@
+import pytest
+
+from autoinvoice.allocator import parse_invoice_number
+from autoinvoice.backends import get_storage
+from autoinvoice.compact import merge_user
+
+from test_export import save
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "json"])
+def test_merge_renumbers_clashing_invoices(workdir, backend):
+    target = get_storage(f"ws_{backend.encode().hex():f>16}", backend)
+    save(target, "INV-1000", "2025-01-05")
+    renumbered = {}
+    for session in ("user_0000cccc", "user_0000dddd"):
+        source = get_storage(session, backend)
+        save(source, "INV-1000", "2025-01-10")
+        save(source, "INV-1001", "2025-02-10")
+        renumbered.update(merge_user(source, target)[2])
+
+    numbers = [invoice["invoice_number"] for _, invoice in target.iter_invoices()]
+    assert len(numbers) == 5
+    assert len(set(numbers)) == 5
+    assert renumbered["INV-1000"] in numbers
+    assert target.peek_counter() > max(parse_invoice_number(n) for n in numbers)
@@ -0,0 +1,47 @@
+import datetime
+
+import pyarrow.dataset as ds
+import pytest
+
+from autoinvoice.backends import get_storage
+from autoinvoice.compact import merge_user
+from autoinvoice.engine import build_invoice_data, make_line_item
+from autoinvoice.export import export
+
+
+def save(storage, number, day):
+    when = datetime.datetime.strptime(day, "%Y-%m-%d")
+    invoice = build_invoice_data(number, "Ali", "Honda Civic", [make_line_item("Oil", 1, 2500)],
+                                 1500, 0, storage.user_id, "Workshop", when)
+    storage.save_invoice(invoice, day)
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "json"])
+def test_export_after_merging_sessions(workdir, backend):
+    target = get_storage(f"ws_{backend.encode().hex():0>16}", backend)
+    for session in ("user_0000aaaa", "user_0000bbbb"):
+        source = get_storage(session, backend)
+        save(source, "INV-1000", "2025-01-10")
+        save(source, "INV-1001", "2025-02-10")
+        merge_user(source, target)
+
+    out = str(workdir / "exports")
+    list(export(out, backend))
+
+    table = ds.dataset(f"{out}/invoices", partitioning="hive").to_table()
+    assert table.num_rows == 4
+    months = sorted(str(m) for m in table.column("month").to_pylist())
+    assert months == ["2025-01", "2025-01", "2025-02", "2025-02"]
+
+
+def test_sqlite_range_is_read_in_pages(workdir, monkeypatch):
+    from autoinvoice import backends
+
+    monkeypatch.setattr(backends, "RANGE_PAGE_ROWS", 2)
+    storage = get_storage("ws_00000000000009a6", "sqlite")
+    for n, day in enumerate(["2025-01-10", "2025-01-10", "2025-01-10", "2025-01-11", "2025-02-01"]):
+        save(storage, f"INV-{1000 + n}", day)
+
+    numbers = [invoice["invoice_number"] for _, invoice in storage.iter_invoices()]
+    assert numbers == ["INV-1000", "INV-1001", "INV-1002", "INV-1003", "INV-1004"]
+    assert [day for day, _ in storage.iter_invoices("2025-01-11", "2025-01-31")] == ["2025-01-11"]
@@ -0,0 +1,32 @@
+from autoinvoice import metrics
+from autoinvoice.metrics import MetricsRegistry, capture_timings, record_samples
+
+
+def test_series_evicted_least_recently_updated():
+    registry = MetricsRegistry(max_series=2, log_path="")
+    registry.observe("render", 0.1, "a")
+    registry.observe("render", 0.1, "b")
+    registry.observe("render", 0.1, "a")
+    registry.observe("render", 0.1, "c")
+    assert [row["user"] for row in registry.snapshot()] == ["a", "c"]
+
+    registry.incr("saved", "a")
+    registry.incr("saved", "b")
+    registry.incr("saved", "a")
+    registry.incr("saved", "c")
+    assert [(row["user"], row["count"]) for row in registry.counters()] == [("a", 2), ("c", 1)]
+
+
+def test_captured_counts_reach_the_parent(monkeypatch):
+    registry = MetricsRegistry(log_path="")
+    monkeypatch.setattr(metrics, "_registry", registry)
+
+    # As in a PDF worker: nothing is recorded until the parent gets the samples
+    with capture_timings() as samples:
+        metrics.observe("pdf_render", 0.25)
+        metrics.count("pdf_cache_miss")
+    assert registry.snapshot() == [] and registry.counters() == []
+
+    record_samples(samples, "ws_1")
+    assert [(row["phase"], row["user"]) for row in registry.snapshot()] == [("pdf_render", "ws_1")]
+    assert registry.counters() == [{"event": "pdf_cache_miss", "user": "-", "count": 1}]
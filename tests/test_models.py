@@ -0,0 +1,47 @@
+import pytest
+
+from autoinvoice.models import Invoice, LineItem, from_paisa, pack_record, rupees, to_paisa, unpack_record
+
+
+@pytest.mark.parametrize("amount, paisa", [
+    (25, 2500),
+    ("0.1", 10),
+    (0.1 + 0.2, 30),
+    (2.675, 268),
+    ("2.005", 201),
+    ("2.004", 200),
+    (1e-3, 0),
+])
+def test_to_paisa_rounds_half_up(amount, paisa):
+    assert to_paisa(amount) == paisa
+
+
+def test_from_paisa():
+    assert from_paisa(268) == 2.68
+    assert rupees(2500) == 25 and isinstance(rupees(2500), int)
+    assert rupees(2550) == 25.5
+
+
+def test_totals_do_not_drift():
+    items = [LineItem.from_rupees("Filter", 3, 0.1), LineItem.from_rupees("Bulb", 1, 0.2)]
+    invoice = Invoice("INV-1000", "Ali", "Honda Civic", items, labor=0.1, discount=0.05)
+    assert invoice.subtotal_paisa == 50
+    assert invoice.to_dict()["grand_total"] == 0.55
+
+
+def test_pack_record_round_trips():
+    invoice = Invoice("INV-1000", "Ali", "Honda Civic", [LineItem.from_rupees("Oil", 2, 2500.5)],
+                      labor=1500, discount=99.99, user_id="ws_1", workshop_name="Ali Motors",
+                      workshop_phone="0300", workshop_address="Lahore")
+    record = invoice.to_dict()
+    packed = pack_record(record)
+    assert packed["f"] == 2 and packed["i"] == [["Oil", 2, 250050]]
+    assert unpack_record(packed) == record
+    assert pack_record(packed) is packed
+
+
+def test_pack_record_keeps_records_that_do_not_round_trip():
+    record = Invoice("INV-1000", "Ali", "Honda Civic").to_dict()
+    record["grand_total"] = 1
+    assert pack_record(record) is record
+    assert unpack_record(record) is record
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from autoinvoice import pdf, pdfcache
+from autoinvoice.models import Invoice, LineItem
+from autoinvoice.pdfcache import PdfCache, render_cached, render_key
+
+PROFILE = {"workshop_name": "Ali Motors", "phone_number": "0300", "address": "Lahore", "theme": "dark"}
+
+
+def record(number="INV-1000"):
+    return Invoice(number, "Ali", "Honda Civic", [LineItem.from_rupees("Oil", 2, 2500)], labor=1500).to_dict()
+
+
+@pytest.fixture
+def renders(workdir, monkeypatch):
+    """Records passed to the PDF renderer, with a private cache in place"""
+    rendered = []
+
+    def render(invoice_data, profile, filepath=None):
+        rendered.append(invoice_data["invoice_number"])
+        return f"%PDF {invoice_data['invoice_number']} {profile['phone_number']}".encode()
+
+    monkeypatch.setattr(pdfcache, "_cache", PdfCache(str(workdir / "pdf_cache")))
+    monkeypatch.setattr(pdfcache, "render_invoice_pdf", render)
+    return rendered
+
+
+def test_key_follows_record_and_printed_profile():
+    key = render_key(record(), PROFILE)
+    assert render_key(record(), dict(PROFILE)) == key
+    assert render_key(record("INV-1001"), PROFILE) != key
+    assert render_key(record(), dict(PROFILE, phone_number="0301")) != key
+    # Profile fields not printed on the page do not matter
+    assert render_key(record(), dict(PROFILE, theme="light")) == key
+
+
+def test_render_cached_hits_and_misses(renders):
+    pdf_bytes = render_cached(record(), PROFILE)
+    assert render_cached(record(), PROFILE) == pdf_bytes
+    assert renders == ["INV-1000"]
+
+    render_cached(record("INV-1001"), PROFILE)
+    assert renders == ["INV-1000", "INV-1001"]
+
+
+def test_profile_change_renders_again(renders):
+    render_cached(record(), PROFILE)
+    assert render_cached(record(), dict(PROFILE, phone_number="0301")) == b"%PDF INV-1000 0301"
+    assert renders == ["INV-1000", "INV-1000"]
+
+
+def test_put_is_atomic(workdir, monkeypatch):
+    cache = PdfCache(str(workdir / "pdf_cache"))
+    key = render_key(record(), PROFILE)
+    cache.put(key, b"%PDF first")
+    assert os.listdir(os.path.dirname(cache.path(key))) == [key + ".pdf"]
+
+    def crash(src, dst):
+        raise OSError("disk full")
+
+    # A write that fails before the rename leaves the old file whole
+    monkeypatch.setattr(pdf.os, "replace", crash)
+    with pytest.raises(OSError):
+        cache.put(key, b"%PDF second")
+    assert cache.get(key) == b"%PDF first"
+
+
+def test_put_evicts_least_recently_used(workdir):
+    cache = PdfCache(str(workdir / "pdf_cache"), max_bytes=250)
+    keys = [render_key(record(f"INV-{n}"), PROFILE) for n in range(1000, 1003)]
+    for age, key in enumerate(keys[:2]):
+        cache.put(key, b"x" * 100)
+        os.utime(cache.path(key), (age, age))
+    cache.get(keys[0])
+
+    cache.put(keys[2], b"x" * 100)
+    assert [cache.get(key) is not None for key in keys] == [True, False, True]
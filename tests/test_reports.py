@@ -0,0 +1,70 @@
+from autoinvoice.backends import get_storage
+from autoinvoice.models import Invoice, LineItem
+from autoinvoice.reports import ReportEngine, build_report, load_frames
+
+
+def record(number, car, items, labor=1500, discount=0):
+    items = [LineItem.from_rupees(desc, qty, price) for desc, qty, price in items]
+    return Invoice(number, "Ali", car, items, labor=labor, discount=discount).to_dict()
+
+
+RECORDS = [
+    ("2025-01-10", record("INV-1000", "Honda Civic", [("Oil", 2, 2500), ("Filter", 1, 800)])),
+    ("2025-01-20", record("INV-1001", "toyota corolla, ABC-123", [("oil ", 1, 2500)], labor=1000)),
+    ("2025-02-05", record("INV-1002", "Toyota Vitz", [("Brake pads", 1, 6000.5)], discount=500)),
+    ("2025-02-06", record("INV-1003", "", [("Bulb", 4, 150)], labor=0)),
+]
+
+
+def report(start=None, end=None):
+    return build_report(*load_frames(RECORDS), start, end)
+
+
+def test_report_totals():
+    r = report()
+    assert (r["invoices"], r["items_sold"]) == (4, 9)
+    assert (r["parts"], r["labor"], r["discount"]) == (14900.5, 4000.0, 500.0)
+    assert r["revenue"] == 18400.5
+    assert r["parts_share"] == 14900.5 / 18900.5
+    assert (r["first_day"], r["last_day"]) == ("2025-01-10", "2025-02-06")
+
+
+def test_report_date_range():
+    r = report("2025-01-20", "2025-02-05")
+    assert (r["invoices"], r["revenue"], r["first_day"], r["last_day"]) == (2, 10500.5, "2025-01-20", "2025-02-05")
+
+    empty = report("2025-03-01")
+    assert (empty["invoices"], empty["revenue"], empty["first_day"]) == (0, 0.0, None)
+    assert empty["monthly"].empty and empty["top_parts"].empty
+
+
+def test_report_groupings():
+    r = report()
+    assert r["monthly"].to_dict("records") == [
+        {"month": "2025-01", "invoices": 2, "revenue": 10800.0, "parts": 8300.0, "labor": 2500.0},
+        {"month": "2025-02", "invoices": 2, "revenue": 7600.5, "parts": 6600.5, "labor": 1500.0},
+    ]
+    # Parts are grouped case- and space-insensitively, named as first written
+    assert r["top_parts"].to_dict("records")[:2] == [
+        {"part": "Bulb", "qty": 4, "revenue": 600.0},
+        {"part": "Oil", "qty": 3, "revenue": 7500.0},
+    ]
+    assert r["makes"].to_dict("records") == [
+        {"make": "Toyota", "invoices": 2, "revenue": 10500.5},
+        {"make": "Honda", "invoices": 1, "revenue": 7300.0},
+        {"make": "Unknown", "invoices": 1, "revenue": 600.0},
+    ]
+
+
+def test_engine_picks_up_new_invoices(workdir):
+    storage = get_storage("ws_00000000000e7e70", "json")
+    for day, data in RECORDS[:2]:
+        storage.save_invoice(data, day)
+    engine = ReportEngine()
+    first = engine.report(storage)
+    assert first["invoices"] == 2
+    assert engine.report(storage) is first
+
+    storage.save_invoice(RECORDS[2][1], RECORDS[2][0])
+    r = engine.report(storage)
+    assert (r["invoices"], r["revenue"]) == (3, 17800.5)
@@ -0,0 +1,27 @@
+import pytest
+
+from autoinvoice.backends import get_storage
+from autoinvoice.search import forget_search_index
+from autoinvoice.storage import today_key
+
+from test_export import save
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "json"])
+def test_index_catches_up_after_crash(workdir, backend):
+    storage = get_storage(f"ws_{backend.encode().hex():e>16}", backend)
+    save(storage, "INV-1000", "2025-01-10")
+    save(storage, "INV-1001", today_key())
+    assert [r["invoice_number"] for r in storage.search("civic")] == ["INV-1001", "INV-1000"]
+
+    # Saved, then the process died before indexing it
+    invoice = dict(storage.find_invoice("INV-1001"), invoice_number="INV-1002")
+    storage._write_invoices([invoice], today_key())
+    forget_search_index(storage.user_id)
+    assert storage.find_invoice("INV-1002") is not None
+    assert len(storage.search("civic")) == 3
+
+    # Out of step beyond the last day: rebuilt
+    storage._write_invoices([dict(invoice, invoice_number="INV-1003")], "2025-01-11")
+    forget_search_index(storage.user_id)
+    assert len(storage.search("civic")) == 4
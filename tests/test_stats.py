@@ -0,0 +1,117 @@
+import os
+
+from autoinvoice.backends import get_storage
+from autoinvoice.models import Invoice, LineItem
+from autoinvoice.stats import ROLLUP_FILE, RollupIndex, TodayAggregate
+from autoinvoice.storage import get_journal, today_key
+
+
+def invoice(number, price, labor=1500):
+    items = [LineItem.from_rupees("Oil", 2, price)]
+    return Invoice(number, "Ali", "Honda Civic", items, labor=labor).to_dict()
+
+
+def test_today_aggregate_folds_appends(workdir):
+    journal = get_journal("data/today_a")
+    aggregate = TodayAggregate("data/today_a")
+    assert aggregate.snapshot()["count"] == 0
+
+    journal.append(invoice("INV-1000", 2500))
+    journal.append(invoice("INV-1001", 1000, labor=500))
+    stats = aggregate.snapshot()
+    assert (stats["count"], stats["sales"], stats["labor"], stats["items"]) == (2, 9000.0, 2000, 2)
+    assert [r["invoice_number"] for r in stats["recent"]] == ["INV-1000", "INV-1001"]
+    assert aggregate.refresh() is False
+
+
+def test_today_aggregate_resets_after_clear_day(workdir):
+    journal = get_journal("data/today_b")
+    aggregate = TodayAggregate("data/today_b")
+    journal.append(invoice("INV-1000", 2500))
+    assert aggregate.snapshot()["count"] == 1
+
+    journal.clear_day(today_key())
+    assert aggregate.snapshot()["count"] == 0
+    journal.append(invoice("INV-1001", 1000))
+    stats = aggregate.snapshot()
+    assert (stats["count"], stats["sales"]) == (1, 3500.0)
+    assert [r["invoice_number"] for r in stats["recent"]] == ["INV-1001"]
+
+
+def test_today_aggregate_reads_only_the_tail_after_restart(workdir):
+    journal = get_journal("data/today_c")
+    first = TodayAggregate("data/today_c")
+    journal.append(invoice("INV-1000", 2500))
+    first.refresh()
+
+    journal.append(invoice("INV-1001", 1000))
+    restarted = TodayAggregate("data/today_c")
+    # Picks up where the saved aggregate stopped, not from the start of the day
+    assert (restarted.offset, restarted.count) == (first.offset, 1)
+    stats = restarted.snapshot()
+    assert (stats["count"], stats["sales"]) == (2, 10000.0)
+    assert restarted.offset > first.offset
+
+
+def test_rollups_index_each_day_incrementally(workdir):
+    journal = get_journal("data/rollup_a")
+    rollups = RollupIndex("data/rollup_a")
+    journal.append(invoice("INV-1000", 2500), "2025-01-10")
+    rollups.refresh("2025-01-10")
+    journal.append(invoice("INV-1001", 1000), "2025-01-11")
+    journal.append(invoice("INV-1002", 1000), "2025-01-11")
+    rollups.refresh("2025-01-11")
+
+    assert rollups.rows["2025-01-10"]["count"] == 1
+    offset = rollups.rows["2025-01-11"]["offset"]
+    journal.append(invoice("INV-1003", 1000), "2025-01-11")
+    rollups.refresh("2025-01-11")
+    row = rollups.rows["2025-01-11"]
+    assert (row["count"], row["sales"]) == (3, 10500.0)
+    assert row["offset"] > offset
+
+    # Saved rows are loaded, not recomputed
+    assert RollupIndex("data/rollup_a").rows == rollups.rows
+
+
+def test_range_totals(workdir):
+    storage = get_storage("ws_000000000000a11e", "json")
+    # Grand totals 5500, 7500 and 9500
+    for number, day, price in [(1000, "2025-01-10", 2000), (1001, "2025-01-11", 3000), (1002, "2025-01-12", 4000)]:
+        storage.save_invoice(invoice(f"INV-{number}", price), day)
+
+    def totals(start=None, end=None):
+        t = storage.range_totals(start, end)
+        return t["count"], t["sales"], t["days"]
+
+    assert totals() == (3, 22500.0, 3)
+    assert totals("2025-01-11") == (2, 17000.0, 2)
+    assert totals(end="2025-01-11") == (2, 13000.0, 2)
+    assert totals("2025-01-11", "2025-01-11") == (1, 7500.0, 1)
+    assert totals("2025-02-01") == (0, 0, 0)
+
+
+def test_rollups_rebuild_after_journal_shrinks(workdir):
+    journal = get_journal("data/rollup_b")
+    rollups = RollupIndex("data/rollup_b")
+    journal.append_many([invoice("INV-1000", 2500), invoice("INV-1001", 2500)], "2025-01-10")
+    rollups.refresh("2025-01-10")
+    assert rollups.rows["2025-01-10"]["count"] == 2
+
+    # Rewritten shorter than the indexed offset: the row is recomputed
+    journal.clear_day("2025-01-10")
+    journal.append(invoice("INV-1002", 1000), "2025-01-10")
+    rollups.refresh("2025-01-10")
+    row = rollups.rows["2025-01-10"]
+    assert (row["count"], row["sales"]) == (1, 3500.0)
+
+    journal.clear_day("2025-01-10")
+    rollups.refresh("2025-01-10")
+    assert "2025-01-10" not in rollups.rows
+
+    # A lost index is rebuilt from the journals
+    journal.append(invoice("INV-1003", 1000), "2025-01-11")
+    os.remove(os.path.join("data/rollup_b", ROLLUP_FILE))
+    rebuilt = RollupIndex("data/rollup_b")
+    assert sorted(rebuilt.rows) == ["2025-01-11"]
+    assert rebuilt.rows["2025-01-11"]["count"] == 1
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+from autoinvoice.backends import get_storage
+from autoinvoice.models import Invoice, LineItem
+from autoinvoice.storage import InvoiceJournal, today_key
+
+
+def test_migrate_legacy_after_crash_does_not_duplicate(workdir):
+    journal = InvoiceJournal("data/u")
+    legacy_path = "data/u/invoices_2025-01-10.json"
+    with open(legacy_path, "w") as f:
+        json.dump([{"invoice_number": "INV-0998"}, {"invoice_number": "INV-0999"}], f)
+    journal.append({"invoice_number": "INV-1000"}, "2025-01-10")
+    journal.close()
+
+    assert journal.migrate_legacy() == 2
+    # Crashed after the journal was replaced, before the legacy file was renamed
+    os.replace(legacy_path + ".migrated", legacy_path)
+    journal.migrate_legacy()
+
+    numbers = [r["invoice_number"] for r in journal.read_day("2025-01-10")]
+    assert numbers == ["INV-0998", "INV-0999", "INV-1000"]
+    assert not os.path.exists(legacy_path)
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def store(request, workdir):
+    """A fresh storage of each backend"""
+    # Storages are shared per user id for the whole run: one id per test
+    user_id = "ws_" + hashlib.sha256(request.node.name.encode()).hexdigest()[:16]
+    return get_storage(user_id, request.param)
+
+
+def record(number, price=2500):
+    items = [LineItem.from_rupees("Oil", 2, price)]
+    return Invoice(number, "Ali", "Honda Civic", items, labor=1500).to_dict()
+
+
+def test_profile_round_trips(store):
+    assert store.load_profile() is None
+    store.save_profile({"workshop_name": "Ali Motors", "phone": "0300"})
+    assert store.load_profile() == {"workshop_name": "Ali Motors", "phone": "0300"}
+
+
+def test_counter_starts_after_saved_invoices(store):
+    store.save_invoices([record("INV-1000"), record("INV-1001")], "2025-01-10")
+    assert store.peek_counter() == 1002
+    assert store.allocate(3) == 1002
+    assert store.peek_counter() == 1005
+
+
+def test_invoices_are_found_by_day_and_number(store):
+    store.save_invoice(record("INV-1000"), "2025-01-10")
+    store.save_invoices([record("INV-1001", 1000), record("INV-1002")], "2025-01-11")
+    store.sync()
+
+    assert [(day, r["invoice_number"]) for day, r in store.iter_invoices()] == [
+        ("2025-01-10", "INV-1000"), ("2025-01-11", "INV-1001"), ("2025-01-11", "INV-1002")]
+    assert store.find_invoice("INV-1001", "2025-01-11") == record("INV-1001", 1000)
+    assert store.find_invoice("INV-1001") == record("INV-1001", 1000)
+    assert store.find_invoice("INV-1001", "2025-01-10") is None
+    assert [doc["invoice_number"] for doc in store.search("INV-1002")] == ["INV-1002"]
+
+
+def test_clear_day_and_today_stats(store):
+    store.save_invoices([record("INV-1000"), record("INV-1001", 1000)])
+    stats = store.today_stats()
+    assert (stats["count"], stats["sales"], stats["items"]) == (2, 10000.0, 2)
+    assert [r["invoice_number"] for r in stats["recent"]] == ["INV-1000", "INV-1001"]
+
+    assert store.clear_day(today_key())
+    assert store.today_stats()["count"] == 0
+    assert store.range_totals()["count"] == 0
+    assert list(store.iter_invoices()) == []